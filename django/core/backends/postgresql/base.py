@@ -0,0 +1,115 @@
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+#-== @h1
+# Pooled Postgres Backend
+#-== /core.backends.postgresql.base.py
+#________________________________________
+#
+#-== A Postgres database backend which can take its connections from a
+# /psycopg_pool connection pool. Use it with the /ENGINE
+# /-core.backends.postgresql-/ and set the /pool option:
+# /-'OPTIONS': {'pool': {'min_size': 2, 'max_size': 10}}-/
+#
+#-== Each process keeps one pool per database alias. A request checks a connection
+# out of the pool when it first queries the database and returns it when the request ends,
+# so the connection setup is only paid when the pool opens a new connection.
+# The pool options are passed to /ConnectionPool , /-'pool': True-/ uses its defaults.
+# Without the /pool option the backend behaves as the standard Postgres backend.
+# @note
+# This follows the /pool option of the Postgres backend in Django 5.1,
+# so the /ENGINE can go back to /-django.db.backends.postgresql-/ after upgrading.
+# Like there, /CONN_MAX_AGE must be 0 with a pool, and /CONN_HEALTH_CHECKS
+# makes the pool check each connection before handing it out.
+
+
+#-== @class
+class DatabaseWrapper(base.DatabaseWrapper):
+	#-== The standard Postgres /DatabaseWrapper with the optional connection pool.
+
+	_connection_pools = {}
+	_pool_lock = threading.Lock()
+
+	#-== @method
+	@property
+	def pool(self):
+		#-== @returns
+		# The /ConnectionPool of this database, opened on first use,
+		# or /None if the /pool option is not set.
+
+		pool_options = self.settings_dict['OPTIONS'].get('pool')
+		if self.alias == NO_DB_ALIAS or not pool_options:
+			return None
+		with self._pool_lock:
+			if self.alias not in self._connection_pools:
+				if self.settings_dict.get('CONN_MAX_AGE', 0) != 0:
+					raise ImproperlyConfigured('Connection pooling does not support persistent connections, set CONN_MAX_AGE to 0.')
+				try:
+					from psycopg_pool import ConnectionPool
+				except ImportError as exc:
+					raise ImproperlyConfigured('Error loading psycopg_pool, install psycopg[pool] to use connection pooling.') from exc
+				if pool_options is True:
+					pool_options = {}
+				pool = ConnectionPool(
+					kwargs=self.get_connection_params(),
+					check=ConnectionPool.check_connection if self.settings_dict['CONN_HEALTH_CHECKS'] else None,
+					name='{}:{}'.format(self.alias, self.settings_dict['NAME']),
+					open=False,
+					**pool_options
+				)
+				pool.open()
+				self._connection_pools[self.alias] = pool
+			return self._connection_pools[self.alias]
+
+	#-== @method
+	def close_pool(self):
+		#-== Closes the connection pool of this database.
+		# A new pool is opened the next time a connection is needed.
+
+		with self._pool_lock:
+			pool = self._connection_pools.pop(self.alias, None)
+		if pool is not None:
+			pool.close()
+
+	#-== @method
+	def get_connection_params(self):
+		#-== @returns
+		# The connection parameters of the standard backend, without the /pool option.
+
+		conn_params = super().get_connection_params()
+		conn_params.pop('pool', None)
+		return conn_params
+
+	#-== @method
+	def get_new_connection(self, conn_params):
+		#-== @returns
+		# A connection checked out of the pool, or a new connection without a pool.
+
+		pool = self.pool
+		if pool is None:
+			return super().get_new_connection(conn_params)
+		isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+		try:
+			self.isolation_level = IsolationLevel(isolation_level) if isolation_level is not None else IsolationLevel.READ_COMMITTED
+		except ValueError:
+			raise ImproperlyConfigured(
+				'Invalid transaction isolation level {} specified. Use one of the psycopg.IsolationLevel values.'.format(isolation_level))
+		connection = pool.getconn()
+		if isolation_level is not None:
+			connection.isolation_level = self.isolation_level
+		return connection
+
+	#-== @method
+	def _close(self):
+		#-== Returns the connection to its pool instead of closing it.
+		# The pool rolls back anything left open on it.
+
+		if self.connection is None or self.pool is None:
+			return super()._close()
+		with self.wrap_database_errors:
+			self.connection._pool.putconn(self.connection)
+			self.connection = None
@@ -0,0 +1,120 @@
+import os, shlex, sys
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+#-== @h1
+# Serve Command
+#-== /core.management.commands.serve.py
+#________________________________________
+
+#-== @function
+def available_cpus():
+	#-== @returns
+	# The number of CPUs the process may run on, which in a container
+	# can be fewer than the CPUs of the host.
+
+	if hasattr(os, 'sched_getaffinity'):
+		return len(os.sched_getaffinity(0))
+	return os.cpu_count() or 1
+
+
+#-== @function
+def default_workers(mode, cpus=None):
+	#-== @returns
+	# The number of worker processes for the server /mode on /cpus CPUs.
+	# WSGI workers block on the database and on slow clients, so there are
+	# /-2 * cpus + 1-/ of them, the sizing recommended by gunicorn.
+	# An ASGI worker keeps serving other requests while one waits, so there is one per CPU.
+
+	cpus = cpus or available_cpus()
+	if mode == 'asgi':
+		return cpus
+	return 2 * cpus + 1
+
+
+#-== @class
+class Command(BaseCommand):
+	#-== Runs the app with the server of the /SERVER_MODE setting.
+	# This is the command of the container entrypoint, so the server is chosen
+	# with the settings, or with the /SERVER_MODE environment variable:
+	# @deflist
+	# runserver: the Django development server, a single process which reloads on code changes
+	# wsgi: gunicorn with /SERVER_WORKERS processes of /SERVER_THREADS threads, serving /server.wsgi
+	# asgi: gunicorn with /SERVER_WORKERS uvicorn processes, serving /server.asgi
+	#
+	#-== In the gunicorn modes each worker is replaced after /SERVER_MAX_REQUESTS requests,
+	# once its requests have finished, and idle connections are kept open for /SERVER_KEEPALIVE seconds.
+	# The command replaces itself with the gunicorn process, which then receives the signals
+	# sent to the container, so /SIGTERM stops the workers gracefully.
+	#
+	#-== Under ASGI a streaming response must be an asynchronous generator, or Django reads it
+	# whole into memory before sending it. The streamed lists and the exports are, and a view
+	# which streams a synchronous iterator is logged (see /UnauthenticatedView.check_streaming ).
+	# @note
+	# Each worker opens its own database connections: up to /SERVER_THREADS per WSGI worker
+	# with persistent connections, or the /max_size of the pool per worker with a pool
+	# (see /postgres_database ), which must stay within the connection limit of the database.
+
+	help = 'Runs the app with the development server or gunicorn, as set by SERVER_MODE'
+
+	MODES = ['runserver', 'wsgi', 'asgi']
+
+	def add_arguments(self, parser):
+		parser.add_argument('--mode', choices=self.MODES,
+			help='The server to run, instead of the SERVER_MODE setting')
+		parser.add_argument('--bind',
+			help='The address and port to listen on, instead of the SERVER_BIND setting')
+		parser.add_argument('--workers', type=int,
+			help='The number of worker processes, instead of the SERVER_WORKERS setting')
+		parser.add_argument('--noreload', action='store_true',
+			help='Do not reload the development server on code changes')
+		parser.add_argument('--dry-run', action='store_true',
+			help='Print the gunicorn command instead of running it')
+
+	def handle(self, *args, **options):
+		mode = options['mode'] or getattr(settings, 'SERVER_MODE', 'runserver')
+		bind = options['bind'] or getattr(settings, 'SERVER_BIND', '0.0.0.0:8000')
+		if mode not in self.MODES:
+			raise CommandError('Unsupported server mode: {}'.format(mode))
+		if mode == 'runserver':
+			call_command('runserver', bind, use_reloader=not options['noreload'])
+			return
+
+		argv = self.gunicorn_command(mode, bind, options['workers'])
+		if options['dry_run']:
+			self.stdout.write(shlex.join(argv))
+			return
+		# the workers load the same settings as this command
+		os.environ['DJANGO_SETTINGS_MODULE'] = settings.SETTINGS_MODULE
+		sys.stdout.flush()
+		os.execv(argv[0], argv)
+
+	#-== @method
+	def gunicorn_command(self, mode, bind, workers=None):
+		#-== @returns
+		# The command line which runs gunicorn for the server /mode , see
+		# !https://docs.gunicorn.org/en/stable/settings.html
+
+		workers = workers or getattr(settings, 'SERVER_WORKERS', 0) or default_workers(mode)
+		argv = [sys.executable, '-m', 'gunicorn',
+			'--chdir', str(settings.BASE_DIR),
+			'--bind', bind,
+			'--workers', str(workers),
+			'--max-requests', str(getattr(settings, 'SERVER_MAX_REQUESTS', 1000)),
+			'--max-requests-jitter', str(getattr(settings, 'SERVER_MAX_REQUESTS_JITTER', 100)),
+			'--keep-alive', str(getattr(settings, 'SERVER_KEEPALIVE', 5)),
+			'--timeout', str(getattr(settings, 'SERVER_TIMEOUT', 60)),
+			'--graceful-timeout', str(getattr(settings, 'SERVER_GRACEFUL_TIMEOUT', 30)),
+			'--access-logfile', '-',
+		]
+		# the worker heartbeat files are written to memory rather than to the container's disk
+		if os.path.isdir('/dev/shm'):
+			argv += ['--worker-tmp-dir', '/dev/shm']
+		if mode == 'asgi':
+			argv += ['--worker-class', 'uvicorn_worker.UvicornWorker', 'server.asgi:application']
+		else:
+			argv += ['--worker-class', 'gthread', '--threads', str(getattr(settings, 'SERVER_THREADS', 4)),
+				'server.wsgi:application']
+		return argv
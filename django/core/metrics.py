@@ -0,0 +1,275 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import connection
+
+#-== @h1
+# Request Metrics
+#-== /core.metrics.py
+#________________________________________
+#
+#-== Measures where the time of each request goes. /UnauthenticatedView.dispatch
+# records a /RequestMetrics for every request, which is sent back in the
+# /-Server-Timing-/ header, added to the per-view /LatencyHistogram of the
+# /registry (see /MetricsView ), and logged with its queries if the request is slow.
+# Set /REQUEST_METRICS to /False to turn the measurements off.
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+slow_request_logger = logging.getLogger('django.arva.slow_requests')
+
+
+#-== @function
+@contextmanager
+def measure_serialization():
+	#-== Adds the time spent in the block to the serialization time of the current request,
+	# leaving out the time of the queries run in it.
+	# Does nothing outside of a request.
+
+	metrics = _current.get()
+	if metrics is None:
+		yield
+		return
+	started = time.perf_counter()
+	db_time = metrics.db_time
+	try:
+		yield
+	finally:
+		metrics.serialize_time += time.perf_counter() - started - (metrics.db_time - db_time)
+
+
+#-== @class
+class RequestMetrics:
+	#-== The measurements of a single request.
+	# It is also the database execute wrapper which times the queries,
+	# see !https://docs.djangoproject.com/en/4.2/topics/db/instrumentation/
+	# @attributes
+	# view: the name of the view which handled the request
+	# method: the HTTP method
+	# wall_time: the time taken by the view, in seconds
+	# query_count: the number of queries run
+	# db_time: the time spent running queries, in seconds
+	# serialize_time: the time spent turning data into JSON, in seconds, see /measure_serialization
+	# response_size: the size of the response body in bytes, /None for streaming responses
+	# queries: a list of the SQL and duration of the queries, up to /max_queries
+	# max_queries: the number of queries to keep, /None to keep all of them
+
+	def __init__(self, view, method, max_queries=None):
+		self.view = view
+		self.method = method
+		self.max_queries = max_queries
+		self.wall_time = 0.0
+		self.query_count = 0
+		self.db_time = 0.0
+		self.serialize_time = 0.0
+		self.response_size = None
+		self.queries = []
+
+	def __call__(self, execute, sql, params, many, context):
+		started = time.perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			duration = time.perf_counter() - started
+			self.query_count += 1
+			self.db_time += duration
+			if self.max_queries is None or len(self.queries) < self.max_queries:
+				self.queries.append((sql, duration))
+
+	#-== @method
+	@contextmanager
+	def record(self):
+		#-== Measures the block as the handling of the request.
+
+		token = _current.set(self)
+		started = time.perf_counter()
+		try:
+			with connection.execute_wrapper(self):
+				yield self
+		finally:
+			self.wall_time = time.perf_counter() - started
+			_current.reset(token)
+
+	#-== @method
+	@asynccontextmanager
+	async def arecord(self):
+		#-== The version of /record for a coroutine, see /AsyncBaseView .
+		# The async ORM runs the queries with /sync_to_async , in a thread which
+		# has a database connection of its own, so the wrapper is added to that connection
+		# rather than to the connection of the event loop.
+
+		token = _current.set(self)
+		started = time.perf_counter()
+		wrappers = await sync_to_async(lambda: connection.execute_wrappers)()
+		wrappers.append(self)
+		try:
+			yield self
+		finally:
+			wrappers.remove(self)
+			self.wall_time = time.perf_counter() - started
+			_current.reset(token)
+
+	#-== @method
+	def finish(self, response):
+		#-== Records the size of the /response and adds the /-Server-Timing-/ header to it.
+
+		if not response.streaming:
+			self.response_size = len(response.content)
+		response['Server-Timing'] = self.server_timing()
+
+	#-== @method
+	def server_timing(self):
+		#-== @returns
+		# The value of the /-Server-Timing-/ header, with the durations in milliseconds.
+		# Streaming responses are timed until the response starts.
+
+		metrics = [
+			'total;dur={:.1f}'.format(self.wall_time * 1000),
+			'db;dur={:.1f};desc="{} queries"'.format(self.db_time * 1000, self.query_count),
+			'serialize;dur={:.1f}'.format(self.serialize_time * 1000),
+		]
+		if self.response_size is not None:
+			metrics.append('size;desc="{} bytes"'.format(self.response_size))
+		return ', '.join(metrics)
+
+	#-== @method
+	def is_slow(self):
+		#-== @returns
+		# /True if the request took longer than the /SLOW_REQUEST_MS setting.
+
+		return self.wall_time * 1000 >= getattr(settings, 'SLOW_REQUEST_MS', 1000)
+
+	#-== @method
+	def log_slow_request(self, request):
+		#-== Logs the measurements of a slow /request with the queries it ran.
+
+		lines = ['Slow request {} {} ({}): {}'.format(request.method, request.get_full_path(),
+			self.view, self.server_timing())]
+		for sql, duration in self.queries:
+			lines.append('  {:.1f} ms: {}'.format(duration * 1000, sql))
+		if self.query_count > len(self.queries):
+			lines.append('  ... {} more queries'.format(self.query_count - len(self.queries)))
+		slow_request_logger.warning('\n'.join(lines))
+
+
+#-== @class
+class LatencyHistogram:
+	#-== The distribution of the wall time of the requests to one view and method,
+	# with the totals of the other measurements.
+	# The mean response size leaves out the streaming responses, which are not measured.
+	# @attributes
+	# BUCKETS: the upper bounds of the buckets in milliseconds,
+	#			the last bucket counts the requests slower than all of them
+
+	BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+	def __init__(self):
+		self.buckets = [0] * (len(self.BUCKETS) + 1)
+		self.count = 0
+		self.wall_time = 0.0
+		self.max_time = 0.0
+		self.query_count = 0
+		self.db_time = 0.0
+		self.serialize_time = 0.0
+		self.sized_count = 0
+		self.response_size = 0
+
+	#-== @method
+	def add(self, metrics):
+		#-== Adds the /RequestMetrics of a request.
+
+		wall_ms = metrics.wall_time * 1000
+		self.buckets[bisect.bisect_left(self.BUCKETS, wall_ms)] += 1
+		self.count += 1
+		self.wall_time += metrics.wall_time
+		self.max_time = max(self.max_time, metrics.wall_time)
+		self.query_count += metrics.query_count
+		self.db_time += metrics.db_time
+		self.serialize_time += metrics.serialize_time
+		if metrics.response_size is not None:
+			self.sized_count += 1
+			self.response_size += metrics.response_size
+
+	#-== @method
+	def percentile(self, fraction):
+		#-== @returns
+		# The upper bound in milliseconds of the bucket holding the /fraction percentile,
+		# or /None if it is in the last bucket.
+
+		target = fraction * self.count
+		seen = 0
+		for bound, count in zip(self.BUCKETS, self.buckets):
+			seen += count
+			if seen >= target:
+				return bound
+		return None
+
+	#-== @method
+	def to_data(self):
+		#-== @returns
+		# A dictionary of the histogram, with the times in milliseconds
+		# and the cumulative count of requests up to each bucket bound in /buckets .
+
+		cumulative = []
+		seen = 0
+		for bound, count in zip(self.BUCKETS + ['+Inf'], self.buckets):
+			seen += count
+			cumulative.append([bound, seen])
+		count = self.count or 1
+		return {
+			'count': self.count,
+			'mean_ms': round(self.wall_time * 1000 / count, 2),
+			'p50_ms': self.percentile(0.5),
+			'p95_ms': self.percentile(0.95),
+			'max_ms': round(self.max_time * 1000, 2),
+			'mean_queries': round(self.query_count / count, 2),
+			'mean_db_ms': round(self.db_time * 1000 / count, 2),
+			'mean_serialize_ms': round(self.serialize_time * 1000 / count, 2),
+			'mean_response_bytes': round(self.response_size / self.sized_count) if self.sized_count else None,
+			'buckets': cumulative,
+		}
+
+
+#-== @class
+class MetricsRegistry:
+	#-== The /LatencyHistogram of each view and method, for the requests handled by this process.
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.histograms = {}
+
+	#-== @method
+	def add(self, metrics):
+		#-== Adds the /RequestMetrics of a request to the histogram of its view and method.
+
+		key = '{} {}'.format(metrics.view, metrics.method)
+		with self.lock:
+			histogram = self.histograms.get(key)
+			if histogram is None:
+				histogram = self.histograms[key] = LatencyHistogram()
+			histogram.add(metrics)
+
+	#-== @method
+	def to_data(self):
+		#-== @returns
+		# A dictionary of the histograms by view and method.
+
+		with self.lock:
+			return {key: histogram.to_data() for key, histogram in sorted(self.histograms.items())}
+
+	#-== @method
+	def reset(self):
+		#-== Removes all of the histograms.
+
+		with self.lock:
+			self.histograms = {}
+
+
+registry = MetricsRegistry()
@@ -1,6 +1,8 @@
 
+from concurrency.exceptions import RecordModifiedError
 from concurrency.fields import AutoIncVersionField
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.utils import timezone
 
 #-== @h1
 # Core Models
@@ -18,12 +20,70 @@ class CoreModel(models.Model):
 	# created: datetime that the model was added to the database
 	# updated: datetime that the most recent change was made to the object
 
+	#-== @attributes
+	# data_fields: the schema of the dictionary produced by /to_data ,
+	#			a list of /pk and model field names. It is also used by
+	#			the /CompiledSerializer to serialize rows without model objects.
+
 	created = models.DateTimeField(auto_now_add=True)
 	updated = models.DateTimeField(auto_now=True)
 
+	data_fields = ['pk', 'created', 'updated']
+
 	class Meta:
 		abstract = True
 
+	#-== @method
+	def to_data(self, depth=0):
+		#-== Wrangles the model object data into a Python dictionary that can be easily serialized.
+		# The keys are the /data_fields of the model.
+
+		#-== @params
+		# depth: how many nested levels down to traverse
+
+		#-== The /depth parameter controls how /ForeignKey or other relational fields are wrangled.
+		# If /-depth == 0-/ then these fields will simply provide the primary key of the related object.
+		# *Example:* /-'related_object_id': 23-/
+		# If /depth is greater than zero, the related object will also call its /to_data method.
+
+		data = {}
+		for name in self.data_fields:
+			if name == 'pk':
+				data[name] = self.pk
+				continue
+			field = self._meta.get_field(name)
+			if field.many_to_one:
+				value = getattr(self, field.attname)
+				if depth > 0 and value is not None:
+					value = getattr(self, name).to_data(depth-1)
+			elif isinstance(field, models.DateTimeField):
+				value = str(getattr(self, name))
+			else:
+				value = getattr(self, name)
+			data[name] = value
+		return data
+
+	#-== @method
+	@classmethod
+	def related_paths(cls, depth):
+		#-== Works out which relations /to_data will follow for the given /depth .
+		# Each /ForeignKey is followed one level down per level of /depth .
+		# @returns
+		# A list of lookups such as /-['farm', 'farm__grower']-/ to pass to /select_related ,
+		# so the related objects are loaded in the same query.
+
+		paths = []
+		if depth <= 0:
+			return paths
+		for field in cls._meta.concrete_fields:
+			if not field.many_to_one:
+				continue
+			paths.append(field.name)
+			related = field.related_model
+			if hasattr(related, 'related_paths'):
+				paths.extend(field.name + '__' + path for path in related.related_paths(depth - 1))
+		return paths
+
 
 #-== @class
 class ConcurrentModel(models.Model):
@@ -45,3 +105,95 @@ class ConcurrentModel(models.Model):
 
     class Meta:
         abstract = True
+
+    #-== @method
+    @classmethod
+    def versioned_update(cls, pk, version, **values):
+        #-== Writes the /values to the record with /pk in a single conditional
+        # /-UPDATE ... WHERE pk = %s AND version = %s RETURNING ...-/ statement.
+        # The /version is incremented and /-auto_now-/ fields are set in the same statement,
+        # so the record does not need to be read before or after the write.
+        # @params
+        # pk: the primary key of the record
+        # version: the version the change was based on
+        # values: the new values, by field name
+        # @returns
+        # The updated model object, built from the returned row.
+        # The value each of the /values had before the update is set on it
+        # as /-previous_<field>-/ , such as /previous_farm_id .
+        # A /post_save signal is sent for it, as /save would.
+        #
+        #-== If no row matches, a second query tells the two failures apart:
+        # /DoesNotExist is raised if there is no record with /pk ,
+        # and /RecordModifiedError if the record is at another /version .
+        # @note
+        # On Postgres the previous values are returned by the same statement.
+        # Other databases read them first, and those without /-RETURNING-/
+        # (SQLite before 3.35 included) read the record back after the update.
+
+        meta = cls._meta
+        db = router.db_for_write(cls)
+        connection = connections[db]
+        quote = connection.ops.quote_name
+        version_field = meta.get_field('version')
+        now = timezone.now()
+
+        table = quote(meta.db_table)
+        sets = ['{0} = {1}.{0} + 1'.format(quote(version_field.column), table)]
+        params = []
+        previous = []
+        for field in meta.concrete_fields:
+            if field.primary_key or field is version_field:
+                continue
+            if getattr(field, 'auto_now', False):
+                value = now
+            elif field.name in values or field.attname in values:
+                value = values.get(field.name, values.get(field.attname))
+                if field.many_to_one and isinstance(value, models.Model):
+                    value = value.pk
+                previous.append(field)
+            else:
+                continue
+            sets.append('{} = %s'.format(quote(field.column)))
+            params.append(field.get_db_prep_save(value, connection))
+        pk_value = meta.pk.get_db_prep_value(pk, connection)
+
+        where = ' WHERE {table}.{pk} = %s AND {table}.{version} = %s'.format(
+            table=table, pk=quote(meta.pk.column), version=quote(version_field.column))
+        params.extend([pk_value, version])
+        returning = ' RETURNING ' + ', '.join('{}.{}'.format(table, quote(field.column)) for field in meta.concrete_fields)
+        manager = cls._base_manager.db_manager(db)
+        previous_values = {}
+        # the signal receivers run in the same transaction as the update,
+        # so the tables they keep in sync are never out of step with it
+        with transaction.atomic(using=db):
+            if connection.vendor == 'postgresql':
+                # join the row to a snapshot of itself from before the update,
+                # so the previous values are returned as well
+                returning += ''.join(', previous.{} AS {}'.format(quote(field.column), quote('previous_' + field.attname))
+                    for field in previous)
+                sql = 'UPDATE {table} SET {sets} FROM (SELECT * FROM {table} WHERE {pk} = %s) previous{where}{returning}'.format(
+                    table=table, sets=', '.join(sets), pk=quote(meta.pk.column), returning=returning,
+                    where=where + ' AND {}.{} = previous.{}'.format(table, quote(meta.pk.column), quote(meta.pk.column)))
+                rows = list(manager.raw(sql, params[:-2] + [pk_value] + params[-2:]))
+            else:
+                # the previous values are read first, which SQLite keeps consistent
+                # as it only allows one writer at a time
+                sql = 'UPDATE {} SET {}{}'.format(table, ', '.join(sets), where)
+                previous_values = manager.filter(pk=pk).values(*[field.attname for field in previous]).first() or {}
+                if connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert:
+                    rows = list(manager.raw(sql + returning, params))
+                else:
+                    with connection.cursor() as cursor:
+                        cursor.execute(sql, params)
+                        rows = list(manager.filter(pk=pk)) if cursor.rowcount else []
+            for row in rows:
+                for attname, value in previous_values.items():
+                    setattr(row, 'previous_' + attname, value)
+            if rows:
+                models.signals.post_save.send(sender=cls, instance=rows[0], created=False,
+                    update_fields=frozenset(values), raw=False, using=db)
+                return rows[0]
+        if not manager.filter(pk=pk).exists():
+            raise cls.DoesNotExist('No {} with pk: {}'.format(meta.model_name, pk))
+        raise RecordModifiedError('Record has been modified', target=cls(pk=pk, version=version))
@@ -0,0 +1,168 @@
+import cProfile
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+#-== @h1
+# Profiling
+#-== /core.profiling.py
+#________________________________________
+#
+#-== Profiles a block of code and writes the profile to a file.
+# Two formats are supported:
+# @deflist
+# cprofile: the /cProfile statistics, read with /pstats or viewers such as /snakeviz
+# speedscope: an evented profile of every Python call, opened at !https://www.speedscope.app
+#
+#-== Only the calls made by the current thread are profiled.
+
+PROFILE_FORMATS = {
+	'cprofile': '.prof',
+	'speedscope': '.speedscope.json',
+}
+
+
+#-== @class
+class SpeedscopeProfiler:
+	#-== Records when each Python and built-in function is entered and left,
+	# in the evented profile format of speedscope, see
+	# !https://github.com/jlfwong/speedscope/wiki/Importing-from-custom-sources
+	# @attributes
+	# name: the name of the profile
+	# frames: the list of frames of the profile, each a dictionary with the /name , /file and /line
+	# events: the list of open ( /O ) and close ( /C ) events, with the time in seconds
+	# max_events: the most events kept, or /None for no limit
+	# truncated: whether recording stopped early because /max_events was reached
+	#
+	#-== Each call adds two events, so profile a sample of the work rather than
+	# a large run, and expect the profiled code to run several times slower.
+	# Once /max_events is reached the calls which are open are closed and recording stops,
+	# so the profile covers the start of the work.
+
+	def __init__(self, name='profile', max_events=None):
+		self.name = name
+		self.max_events = max_events
+		self.truncated = False
+		self.frames = []
+		self.frame_index = {}
+		self.events = []
+		self.stack = []
+		self.started = None
+		self.ended = None
+
+	#-== @method
+	def frame(self, key, name, file, line):
+		#-== @returns
+		# The index of the frame for /key , added to /frames on first use.
+
+		index = self.frame_index.get(key)
+		if index is None:
+			index = self.frame_index[key] = len(self.frames)
+			self.frames.append({'name': name, 'file': file, 'line': line})
+		return index
+
+	def __call__(self, frame, event, arg):
+		now = time.perf_counter() - self.started
+		if event == 'call':
+			code = frame.f_code
+			index = self.frame((code.co_filename, code.co_firstlineno, code.co_name),
+				code.co_qualname if hasattr(code, 'co_qualname') else code.co_name,
+				code.co_filename, code.co_firstlineno)
+		elif event == 'c_call':
+			module = getattr(arg, '__module__', None) or ''
+			name = getattr(arg, '__qualname__', None) or getattr(arg, '__name__', repr(arg))
+			index = self.frame(('', module, name), '{}.{}'.format(module, name) if module else name, module, 0)
+		elif self.stack:
+			self.events.append({'type': 'C', 'frame': self.stack.pop(), 'at': now})
+			return
+		else:
+			# a return from one of the calls which were running when the profile started
+			return
+		# the close events of the open calls are kept within the limit as well
+		if self.max_events is not None and len(self.events) + len(self.stack) + 2 > self.max_events:
+			sys.setprofile(None)
+			self.truncated = True
+			self.close(now)
+			return
+		self.stack.append(index)
+		self.events.append({'type': 'O', 'frame': index, 'at': now})
+
+	#-== @method
+	def enable(self):
+		#-== Starts recording the calls of the current thread.
+
+		self.started = time.perf_counter()
+		sys.setprofile(self)
+
+	#-== @method
+	def disable(self):
+		#-== Stops recording and closes the calls which are still open.
+
+		sys.setprofile(None)
+		self.ended = time.perf_counter() - self.started
+		self.close(self.ended)
+
+	#-== @method
+	def close(self, at):
+		#-== Closes the calls which are still open at the time /at .
+
+		while self.stack:
+			self.events.append({'type': 'C', 'frame': self.stack.pop(), 'at': at})
+
+	#-== @method
+	def dump(self, path):
+		#-== Writes the profile to the file at /path .
+
+		profile = {
+			'$schema': 'https://www.speedscope.app/file-format-schema.json',
+			'name': '{} (truncated)'.format(self.name) if self.truncated else self.name,
+			'exporter': 'core.profiling',
+			'shared': {'frames': self.frames},
+			'profiles': [{
+				'type': 'evented',
+				'name': self.name,
+				'unit': 'seconds',
+				'startValue': 0,
+				'endValue': self.ended,
+				'events': self.events,
+			}],
+		}
+		with open(path, 'w', encoding='utf-8') as output:
+			json.dump(profile, output, separators=(',', ':'))
+
+
+#-== @function
+@contextmanager
+def profile_to_file(format, directory, name, max_events=None):
+	#-== Profiles the block and writes the profile to a new file in /directory .
+	# @params
+	# format: one of the /PROFILE_FORMATS
+	# directory: the directory of the profile files, created if it does not exist
+	# name: the start of the file name, which is followed by a timestamp, a unique suffix
+	#			and the extension of the format
+	# max_events: the most events kept by a /speedscope profile, or /None for no limit
+	# @returns
+	# The path of the profile file, which is only written once the block has finished.
+
+	if format not in PROFILE_FORMATS:
+		raise ValueError('Unsupported profile format: {}'.format(format))
+	os.makedirs(directory, exist_ok=True)
+	handle, path = tempfile.mkstemp(suffix=PROFILE_FORMATS[format],
+		prefix='{}-{}-'.format(name, time.strftime('%Y%m%d-%H%M%S')), dir=directory)
+	os.close(handle)
+	if format == 'cprofile':
+		profiler = cProfile.Profile()
+	else:
+		profiler = SpeedscopeProfiler(name, max_events)
+	profiler.enable()
+	try:
+		yield path
+	finally:
+		profiler.disable()
+		if format == 'cprofile':
+			profiler.dump_stats(path)
+		else:
+			profiler.dump(path)
@@ -0,0 +1,132 @@
+import json
+from functools import lru_cache
+
+from django.db import models
+
+from core.metrics import measure_serialization
+
+try:
+	import orjson
+except ImportError:  # pragma: no cover
+	orjson = None
+
+#-== @h1
+# Core Serializers
+#-== /core.serializers.py
+#________________________________________
+#
+#-== Serializes query results straight from the database rows.
+# A /CompiledSerializer reads the /data_fields schema of a model
+# (see /CoreModel ) and generates a function which turns one
+# /values_list tuple into the same dictionary that /to_data returns,
+# so no model objects are created for the rows of a list.
+
+
+#-== @function
+def dumps(data):
+	#-== Encodes /data as a JSON string.
+	# Uses /orjson , a dependency of the project which is several times faster
+	# than the standard /json module, and /json if it cannot be installed on the platform.
+	# The time taken is counted as serialization in the request metrics.
+
+	with measure_serialization():
+		if orjson is not None:
+			return orjson.dumps(data).decode('utf-8')
+		return json.dumps(data)
+
+
+#-== @class
+class CompiledSerializer:
+	#-== Builds a specialized row-to-dictionary function for a model and depth.
+	# @attributes
+	# columns: the lookups to pass to /values_list , in the order the function reads them
+	# build: the generated function, which takes one row tuple and returns a dictionary
+	# source: the Python source of the generated function
+	#
+	#-== Use /get_serializer rather than creating these directly,
+	# so each function is only generated once.
+
+	def __init__(self, modelclass, depth=0, fields=None):
+		self.columns = []
+		if fields is None:
+			expression = self.compile_model(modelclass, depth, '')
+		else:
+			expression = self.compile_flat(fields)
+		self.source = 'def build(row):\n\treturn {}\n'.format(expression)
+		namespace = {}
+		exec(self.source, namespace)
+		self.build = namespace['build']
+
+	#-== @method
+	def column(self, lookup):
+		#-== Adds a /values_list lookup and returns the expression which reads it from the row.
+
+		self.columns.append(lookup)
+		return 'row[{}]'.format(len(self.columns) - 1)
+
+	#-== @method
+	def compile_model(self, modelclass, depth, prefix):
+		#-== Generates the dictionary expression for the /data_fields of /modelclass .
+		# Datetimes are converted with /str() and a /ForeignKey is either the primary key
+		# of the related object or, if /depth is greater than zero, its nested dictionary.
+
+		items = []
+		for name in modelclass.data_fields:
+			if name == 'pk':
+				value = self.column(prefix + 'pk')
+			else:
+				field = modelclass._meta.get_field(name)
+				if field.many_to_one:
+					value = self.column(prefix + field.attname)
+					if depth > 0:
+						nested = self.compile_model(field.related_model, depth - 1, prefix + name + '__')
+						value = '(None if {} is None else {})'.format(value, nested)
+				elif isinstance(field, models.DateTimeField):
+					value = 'str({})'.format(self.column(prefix + name))
+				else:
+					value = self.column(prefix + name)
+			items.append('{!r}: {}'.format(name, value))
+		return '{' + ', '.join(items) + '}'
+
+	#-== @method
+	def compile_flat(self, fields):
+		#-== Generates the dictionary expression for a flat list of lookups,
+		# each of which is used as the key of its value.
+
+		items = ['{!r}: {}'.format(lookup, self.column(lookup)) for lookup in fields]
+		return '{' + ', '.join(items) + '}'
+
+	#-== @method
+	def rows(self, qs):
+		#-== @returns
+		# The queryset /qs reduced to the /columns as /values_list tuples.
+
+		return qs.values_list(*self.columns)
+
+	#-== @method
+	def serialize(self, qs):
+		#-== @returns
+		# The list of dictionaries for the records of the queryset /qs .
+
+		build = self.build
+		with measure_serialization():
+			return [build(row) for row in self.rows(qs)]
+
+	#-== @method
+	async def aserialize(self, qs):
+		#-== The coroutine version of /serialize , which reads the rows with the async ORM.
+
+		rows = [row async for row in self.rows(qs)]
+		build = self.build
+		with measure_serialization():
+			return [build(row) for row in rows]
+
+
+#-== @function
+@lru_cache(maxsize=None)
+def get_serializer(modelclass, depth=0, fields=None):
+	#-== @returns
+	# The /CompiledSerializer for the /modelclass and /depth ,
+	# or for a tuple of flat /fields lookups, generated on first use.
+
+	return CompiledSerializer(modelclass, depth, fields)
@@ -5,4 +5,5 @@ from core import views
 urlpatterns = [
     path('login/', views.LoginView.as_view(), name = 'login'),
     path('logout/', views.LogoutView.as_view(), name = 'logout'),
+    path('metrics/', views.MetricsView.as_view(), name = 'metrics'),
 ]
\ No newline at end of file
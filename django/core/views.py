@@ -1,15 +1,31 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import inspect
+import itertools
 import json
 import logging
 
+from asgiref.sync import sync_to_async
 from django.views import View
+
+from core import metrics
+from core.serializers import dumps
 from django.forms.models import model_to_dict
 from django.core import serializers
-from django.core.exceptions import ObjectDoesNotExist, ValidationError
-from django.http import HttpResponse
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied, ValidationError
+from django.db.models import F, Q
+from django.conf import settings
+from django.core.cache import caches
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.decorators.csrf import csrf_exempt
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
+from django.utils.http import http_date
 
 #-== @h1
 # Core Views
@@ -22,6 +38,11 @@ class UnauthenticatedView(View):
 	#-== Provides the basic elements that all pages will use.
 	# See the Django /View documentation for more info:
 	#						!https://docs.djangoproject.com/en/4.2/topics/class-based-views/
+	# @attributes
+	# query_limits: the maximum number of database queries for each HTTP method,
+	#			checked when the /ASSERT_QUERY_COUNTS setting is on
+
+	query_limits = {}
 
 	#-== @method
 	def log_error(self, error_msg, exception=None):
@@ -83,10 +104,81 @@ class UnauthenticatedView(View):
 	def dispatch(self, request, *args, **kwargs):
 		#-== Dispatches the view with the appropriate HTTP method
 		# after checking permissions and initializing.
+		#
+		#-== When the /REQUEST_METRICS setting is on, the time taken by the HTTP method,
+		# its database queries and the serialization of its data are measured
+		# with a /RequestMetrics (see /core.metrics ). The measurements are sent back in the
+		# /-Server-Timing-/ header, added to the latency histograms shown by /MetricsView ,
+		# and logged with the queries when the request takes longer than /SLOW_REQUEST_MS .
+		#
+		#-== When the /ASSERT_QUERY_COUNTS setting is on, the database queries
+		# run by the HTTP method are counted, and an /AssertionError is raised
+		# if there are more than the view allows in its /query_limits .
+		# This is meant for tests, to catch views which query once per object.
 
 		self.check_perms(request, *args, **kwargs)
 		self.initialize(request, *args, **kwargs)
-		return super().dispatch(request, *args, **kwargs)
+		request_metrics = self.start_metrics(request)
+		if request_metrics is None:
+			return self.check_streaming(request, super().dispatch(request, *args, **kwargs))
+		with request_metrics.record():
+			response = super().dispatch(request, *args, **kwargs)
+		return self.check_streaming(request, self.finish_metrics(request, request_metrics, response))
+
+	#-== @method
+	def check_streaming(self, request, response):
+		#-== Logs a warning when a streaming /response to a /request served through ASGI
+		# has a synchronous iterator, which Django reads whole into memory before sending it.
+		# Views which stream under ASGI must send an asynchronous generator instead,
+		# see /AsyncCrudMixin.astream_json .
+		# @returns
+		# The /response .
+
+		if response.streaming and not response.is_async and isinstance(request, ASGIRequest):
+			self.logger.warning('{} {} streams a synchronous iterator, which is buffered under ASGI'.format(
+				self.__class__.__qualname__, request.method))
+		return response
+
+	#-== @method
+	def query_limit(self, request):
+		#-== @returns
+		# The maximum number of queries of the HTTP method of the /request ,
+		# or /None if it is not limited or the /ASSERT_QUERY_COUNTS setting is off.
+
+		if not getattr(settings, 'ASSERT_QUERY_COUNTS', False):
+			return None
+		return self.query_limits.get(request.method.lower())
+
+	#-== @method
+	def start_metrics(self, request):
+		#-== @returns
+		# The /RequestMetrics to record the handling of the /request with,
+		# or /None if neither the metrics nor the query limit are needed.
+
+		limit = self.query_limit(request)
+		if limit is None and not getattr(settings, 'REQUEST_METRICS', True):
+			return None
+		# all of the queries are kept to list them when the limit is exceeded
+		max_queries = None if limit is not None else getattr(settings, 'SLOW_REQUEST_MAX_QUERIES', 200)
+		return metrics.RequestMetrics(self.__class__.__qualname__, request.method, max_queries)
+
+	#-== @method
+	def finish_metrics(self, request, request_metrics, response):
+		#-== Checks the query limit and records the /request_metrics of the /response .
+		# @returns
+		# The /response .
+
+		limit = self.query_limit(request)
+		if limit is not None and request_metrics.query_count > limit:
+			raise AssertionError('{} {} ran {} queries, the limit is {}:\n{}'.format(
+				self.__class__.__qualname__, request.method, request_metrics.query_count, limit,
+				'\n'.join(sql for sql, duration in request_metrics.queries)))
+		if getattr(settings, 'REQUEST_METRICS', True):
+			request_metrics.finish(response)
+			metrics.registry.add(request_metrics)
+			if request_metrics.is_slow():
+				request_metrics.log_slow_request(request)
+		return response
 
 	#-== The Django /View class allows the developer
 	# to create methods for each HTTP request method type
@@ -130,6 +222,58 @@ class BaseView(LoginRequiredMixin, UnauthenticatedView):
 		pass
 
 
+#-== @class
+class AsyncBaseView(BaseView):
+	#-== A /BaseView whose HTTP methods may be coroutines, for views which
+	# read the database with the async ORM. Under ASGI a coroutine method
+	# runs on the event loop, so a request waiting on the database or on a slow
+	# client does not hold a thread. Under WSGI Django runs the view in an event loop
+	# of its own, so the view works with either server.
+	#
+	#-== Django requires the methods of an async view to be all coroutines.
+	# This view also accepts ordinary methods, which are run in a thread with
+	# /sync_to_async , the same way Django runs a synchronous view under ASGI.
+	# A view can then make its read methods coroutines and keep its write methods,
+	# with their transactions, as they are.
+
+	view_is_async = True
+
+	#-== @method
+	async def dispatch(self, request, *args, **kwargs):
+		#-== The coroutine version of /UnauthenticatedView.dispatch , which also
+		# checks the login like the /LoginRequiredMixin .
+
+		# the user is loaded from the session on first use, which queries the database
+		if not await sync_to_async(lambda: request.user.is_authenticated)():
+			return self.handle_no_permission()
+		self.check_perms(request, *args, **kwargs)
+		self.initialize(request, *args, **kwargs)
+		request_metrics = self.start_metrics(request)
+		if request_metrics is None:
+			return self.check_streaming(request, await self.call_handler(request, *args, **kwargs))
+		async with request_metrics.arecord():
+			response = await self.call_handler(request, *args, **kwargs)
+		return self.check_streaming(request, self.finish_metrics(request, request_metrics, response))
+
+	#-== @method
+	async def call_handler(self, request, *args, **kwargs):
+		#-== Calls the method of the view for the HTTP method of the /request .
+		# @returns
+		# The response of the method.
+
+		method = request.method.lower()
+		handler = self.http_method_not_allowed
+		if method in self.http_method_names:
+			handler = getattr(self, method, self.http_method_not_allowed)
+		if asyncio.iscoroutinefunction(handler):
+			return await handler(request, *args, **kwargs)
+		response = await sync_to_async(handler)(request, *args, **kwargs)
+		# /options and /http_method_not_allowed return a coroutine in an async view
+		if inspect.isawaitable(response):
+			response = await response
+		return response
+
+
 #-== @class
 class CrudMixin:
 	#-== A View-class mixin which provides methods
@@ -138,6 +282,8 @@ class CrudMixin:
 	PYTHON = 'py'
 	JSON = 'json'
 	XML = 'xml'
+	FILTER_LOOKUPS = ['exact', 'iexact', 'contains', 'icontains', 'startswith',
+		'istartswith', 'gt', 'gte', 'lt', 'lte', 'isnull']
 	modelclass = None
 
 	#-== @method
@@ -192,12 +338,15 @@ class CrudMixin:
 		self.validate_model_obj(obj)
 
 	#-== @method
-	def validate_model_obj(self, obj):
+	def validate_model_obj(self, obj, exclude=None):
 		#-== Convenience method that runs the /obj.full_clean() validation
 		# and logs any errors to both the logs and the HTML template context.
+		# @params
+		# obj: the Django model object to validate
+		# exclude: a list of field names to skip during validation
 
 		try:
-			obj.full_clean()
+			obj.full_clean(exclude=exclude)
 			return True
 		except ValidationError as exc:
 			self.logger.exception('Model validation failed')
@@ -212,6 +361,311 @@ class CrudMixin:
 		return False
 
 
+	#-== @method
+	def depth_queryset(self, modelclass, depth=0):
+		#-== @returns
+		# A queryset of the /modelclass which loads the related objects
+		# needed to call /-to_data(depth)-/ on its objects without further queries.
+
+		return modelclass.objects.select_related(*modelclass.related_paths(depth))
+
+	#-== @method
+	def cached_response(self, request, generation, last_modified, build_response):
+		#-== Provides a response from the cache for the current data /generation ,
+		# calling /build_response only when it is not cached yet.
+		# The response carries an /ETag made of the /generation and the request path,
+		# and the /last_modified time, so a conditional /GET from a client which
+		# already has the current data is answered with HTTP status 304 (Not Modified).
+		# @params
+		# request: the request to respond to
+		# generation: a number which changes every time the data changes
+		# last_modified: the datetime of the last change to the data
+		# build_response: a callable which returns the response when it is not cached
+		#
+		#-== The responses are stored in the cache named by the /RESPONSE_CACHE setting.
+		# Error responses and streaming responses are not stored.
+
+		etag, timestamp, key = self.cache_validators(request, generation, last_modified)
+		response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+		if response is None:
+			cache = caches[getattr(settings, 'RESPONSE_CACHE', 'default')]
+			content = cache.get(key)
+			if content is not None:
+				response = HttpResponse(content)
+			else:
+				response = build_response()
+				if response.status_code == 200 and not response.streaming:
+					cache.set(key, response.content, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+		return self.add_cache_headers(response, etag, timestamp)
+
+	#-== @method
+	def cache_validators(self, request, generation, last_modified):
+		#-== @returns
+		# A tuple of the /ETag , the /-Last-Modified-/ timestamp and the cache key
+		# of the response to the /request for the data /generation , see /cached_response .
+
+		path_hash = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+		etag = '"{}-{}"'.format(generation, path_hash)
+		key = 'response:{}:{}:{}'.format(self.__class__.__qualname__, generation, path_hash)
+		return etag, int(last_modified.timestamp()), key
+
+	#-== @method
+	def add_cache_headers(self, response, etag, timestamp):
+		#-== Adds the /ETag and /-Last-Modified-/ headers to a successful /response .
+		# @returns
+		# The /response .
+
+		if response.status_code in [200, 304]:
+			response['ETag'] = etag
+			response['Last-Modified'] = http_date(timestamp)
+			response['Cache-Control'] = 'private, no-cache'
+		return response
+
+	#-== @method
+	def stream_json(self, qs, to_data=None):
+		#-== Sends the records of the queryset /qs as a JSON list, written while the
+		# records are read from the database instead of building the whole list first.
+		# The queryset is read with /iterator() , which uses a server-side cursor
+		# on databases which support it, so memory use stays the same for any number of records.
+		# @params
+		# qs: the queryset to send, of model objects, dictionaries from /values() ,
+		#			or tuples from /CompiledSerializer.rows
+		# to_data: a function which converts each record to a Python dictionary.
+		#			If /None , the records are sent as they are
+		# @returns
+		# A /StreamingHttpResponse of the JSON list.
+
+		chunk_size = getattr(settings, 'STREAM_CHUNK_SIZE', 2000)
+
+		def generate():
+			yield '['
+			separator = ''
+			chunk = []
+			for record in qs.iterator(chunk_size=chunk_size):
+				if to_data is not None:
+					record = to_data(record)
+				chunk.append(record)
+				if len(chunk) >= chunk_size:
+					# encode the whole chunk at once, without the enclosing brackets
+					yield separator + dumps(chunk)[1:-1]
+					separator = ','
+					chunk = []
+			if chunk:
+				yield separator + dumps(chunk)[1:-1]
+			yield ']'
+
+		return StreamingHttpResponse(generate())
+
+	#-== @method
+	def filter_queryset(self, qs, params, fields):
+		#-== Applies the column filters found in the /params to the queryset /qs .
+		# A filter is a parameter named after one of the /fields ,
+		# optionally followed by one of the /FILTER_LOOKUPS .
+		# *Example:* /-?farm__grower__name__icontains=acme&area__gte=10-/
+		# Parameters which do not name one of the /fields are ignored.
+		# @params
+		# qs: the queryset to filter
+		# params: the query parameters of the request
+		# fields: the list of field names which can be filtered
+		# @returns
+		# The filtered queryset, or /None if a filter is invalid.
+
+		filters = {}
+		for key, value in params.items():
+			if key in fields:
+				filters[key] = value
+				continue
+			name, _, lookup = key.rpartition('__')
+			if name not in fields:
+				continue
+			if lookup not in self.FILTER_LOOKUPS:
+				self.log_error('Unsupported filter: {}'.format(key))
+				return None
+			if lookup == 'isnull':
+				value = value.lower() in ['1', 'true', 'yes']
+			filters[key] = value
+		try:
+			return qs.filter(**filters)
+		except (ValueError, ValidationError) as exc:
+			self.log_error('Invalid filter value: {}'.format(exc))
+			return None
+
+	#-== @method
+	def sort_queryset(self, qs, sort, fields):
+		#-== Orders the queryset /qs by the /sort field, and then by primary key
+		# so that the order is stable. A /sort prefixed with /- is sorted descending.
+		# Empty values sort after all other values ascending, and before them descending.
+		# @returns
+		# The sorted queryset, or /None if /sort is not one of the /fields .
+
+		name = sort.lstrip('-')
+		if name not in fields:
+			self.log_error('Unsupported sort: {}'.format(sort))
+			return None
+		if sort.startswith('-'):
+			return qs.order_by(F(name).desc(nulls_first=True), '-pk')
+		return qs.order_by(F(name).asc(nulls_last=True), 'pk')
+
+	#-== @method
+	def paginate_queryset(self, qs, sort, limit, cursor=None):
+		#-== Provides one page of the queryset /qs , which must be ordered with /sort_queryset .
+		# The pages use keyset pagination: the /cursor holds the sort value and primary key
+		# of the last row of the previous page, so the database can seek directly to the
+		# next page through the index instead of counting past an offset.
+		# @params
+		# qs: a queryset of dictionaries from /values() , including the /sort field and /pk
+		# sort: the sort used for /qs
+		# limit: the maximum number of rows on the page
+		# cursor: the /next value of the previous page, or /None for the first page
+		# @returns
+		# A tuple of the list of rows and the cursor for the next page
+		# ( /None if this is the last page), or /None if the /cursor is invalid.
+
+		qs = self.seek_queryset(qs, sort, cursor)
+		if qs is None:
+			return None
+		rows = list(qs[:limit + 1])
+		return self.page_rows(rows, sort, limit)
+
+	#-== @method
+	def seek_queryset(self, qs, sort, cursor):
+		#-== Filters the queryset /qs to the rows after the /cursor , see /paginate_queryset .
+		# @returns
+		# The filtered queryset, or /None if the /cursor is invalid.
+
+		name = sort.lstrip('-')
+		descending = sort.startswith('-')
+		if cursor:
+			try:
+				value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+			except (ValueError, TypeError, binascii.Error):
+				self.log_error('Invalid cursor: {}'.format(cursor))
+				return None
+			if descending and value is None:
+				after = Q(**{name + '__isnull': True, 'pk__lt': pk}) | Q(**{name + '__isnull': False})
+			elif descending:
+				after = Q(**{name + '__lt': value}) | Q(**{name: value, 'pk__lt': pk})
+			elif value is None:
+				after = Q(**{name + '__isnull': True, 'pk__gt': pk})
+			else:
+				after = (Q(**{name + '__gt': value}) | Q(**{name: value, 'pk__gt': pk})
+					| Q(**{name + '__isnull': True}))
+			# the values are converted to the types of the model fields when the filter is added,
+			# so a cursor with a value of the wrong type is rejected here
+			try:
+				qs = qs.filter(after)
+			except (ValueError, TypeError, ValidationError):
+				self.log_error('Invalid cursor: {}'.format(cursor))
+				return None
+		return qs
+
+	#-== @method
+	def page_rows(self, rows, sort, limit):
+		#-== Cuts the /rows read for a page down to the /limit , see /paginate_queryset .
+		# @params
+		# rows: up to /-limit + 1-/ rows, the last of which only shows that there is a next page
+		# @returns
+		# A tuple of the list of rows and the cursor for the next page.
+
+		name = sort.lstrip('-')
+		next_cursor = None
+		if len(rows) > limit:
+			rows = rows[:limit]
+			last = rows[-1]
+			keyset = json.dumps([last[name], last['pk']])
+			next_cursor = base64.urlsafe_b64encode(keyset.encode('utf-8')).decode('ascii')
+		return rows, next_cursor
+
+
+#-== @class
+class AsyncCrudMixin(CrudMixin):
+	#-== The /CrudMixin for an /AsyncBaseView , with coroutine versions of the
+	# methods which read the database, using the async ORM.
+	# See !https://docs.djangoproject.com/en/4.2/topics/async/#queries-the-orm
+
+	#-== @method
+	async def acached_response(self, request, generation, last_modified, build_response):
+		#-== The coroutine version of /CrudMixin.cached_response .
+		# @params
+		# build_response: a coroutine function which returns the response when it is not cached
+
+		etag, timestamp, key = self.cache_validators(request, generation, last_modified)
+		response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+		if response is None:
+			cache = caches[getattr(settings, 'RESPONSE_CACHE', 'default')]
+			content = await cache.aget(key)
+			if content is not None:
+				response = HttpResponse(content)
+			else:
+				response = await build_response()
+				if response.status_code == 200 and not response.streaming:
+					await cache.aset(key, response.content, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+		return self.add_cache_headers(response, etag, timestamp)
+
+	#-== @method
+	def astream_json(self, request, qs, to_data=None):
+		#-== The version of /CrudMixin.stream_json for an async view.
+		# Under ASGI the records are read a chunk at a time in a thread and the response is an
+		# asynchronous generator, so the event loop is free while each chunk is read and sent.
+		# Under WSGI the response is the generator of /stream_json , since Django
+		# would read a whole asynchronous generator into memory to send it.
+		# @params
+		# request: the request to respond to
+		# qs: the queryset to send
+		# to_data: a function which converts each record to a Python dictionary
+		# @returns
+		# A /StreamingHttpResponse of the JSON list.
+
+		if not isinstance(request, ASGIRequest):
+			return self.stream_json(qs, to_data)
+		chunk_size = getattr(settings, 'STREAM_CHUNK_SIZE', 2000)
+
+		async def generate():
+			yield '['
+			separator = ''
+			async for chunk in self.aread_chunks(qs.iterator(chunk_size=chunk_size), chunk_size):
+				if to_data is not None:
+					chunk = [to_data(record) for record in chunk]
+				yield separator + dumps(chunk)[1:-1]
+				separator = ','
+			yield ']'
+
+		return StreamingHttpResponse(generate())
+
+	#-== @method
+	async def aread_chunks(self, items, chunk_size):
+		#-== Yields lists of up to /chunk_size of the /items , a synchronous iterator
+		# such as /-qs.iterator()-/ , each list read in the thread of the request with /sync_to_async .
+		# Reading a chunk at a time keeps the hops between the event loop and the thread few,
+		# and the thread keeps the database connection of the request, like /aiterator() does.
+		# /aiterator() itself is not used, as in Django 4.2 it runs the query of a
+		# /values_list queryset on the event loop.
+		# The /items are closed in the same thread when the generator is closed,
+		# so a server-side cursor is released if the client goes away.
+
+		read_chunk = sync_to_async(lambda: list(itertools.islice(items, chunk_size)))
+		try:
+			while True:
+				chunk = await read_chunk()
+				if not chunk:
+					break
+				yield chunk
+		finally:
+			close = getattr(items, 'close', None)
+			if close is not None:
+				await sync_to_async(close)()
+
+	#-== @method
+	async def apaginate_queryset(self, qs, sort, limit, cursor=None):
+		#-== The coroutine version of /CrudMixin.paginate_queryset .
+
+		qs = self.seek_queryset(qs, sort, cursor)
+		if qs is None:
+			return None
+		rows = [row async for row in qs[:limit + 1]]
+		return self.page_rows(rows, sort, limit)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 #-== @class
 class LoginView(UnauthenticatedView):
@@ -249,4 +703,33 @@ class LogoutView(BaseView):
 
 	def get(self, request, *args, **kwargs):
 		logout(request)
-		return HttpResponse('logged out')
\ No newline at end of file
+		return HttpResponse('logged out')
+
+#-== @class
+class MetricsView(UnauthenticatedView):
+	#-== Shows the request metrics of this process, see /core.metrics .
+	# Only available to the addresses in the /INTERNAL_IPS setting.
+	# Each server process keeps its own metrics, so with several workers
+	# a request only shows the metrics of the worker which answered it.
+
+	#-== @method
+	def check_perms(self, request, *args, **kwargs):
+		#-== Raises a /PermissionDenied exception for requests which
+		# do not come from one of the /INTERNAL_IPS .
+
+		if request.META.get('REMOTE_ADDR') not in getattr(settings, 'INTERNAL_IPS', []):
+			raise PermissionDenied
+
+	#-== @method
+	# GET
+	#-== Provides the latency histogram and the means of the query count, database time,
+	# serialization time and response size of each view and HTTP method,
+	# keyed as /-"FieldList GET"-/ . Requests to this view are not included.
+	# Add /-?reset=1-/ to clear the metrics after reading them.
+
+	def get(self, request, *args, **kwargs):
+		data = metrics.registry.to_data()
+		data.pop('{} GET'.format(self.__class__.__qualname__), None)
+		if request.GET.get('reset'):
+			metrics.registry.reset()
+		return HttpResponse(dumps(data), content_type='application/json')
@@ -1,4 +1,5 @@
 #! /bin/sh
 
 python3 manage.py migrate
-python3 manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+# runs the server of the SERVER_MODE setting, which replaces this shell to receive the container signals
+exec python3 manage.py serve
\ No newline at end of file
@@ -1,6 +1,25 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class FieldMgmtConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'field_mgmt'
+
+    def ready(self):
+        from field_mgmt.models import DatasetGeneration, Farm, FarmRollup, Field, FieldListing, Grower
+
+        # any change to the field data invalidates the cached responses
+        for model in [Grower, Farm, Field]:
+            post_save.connect(DatasetGeneration.bump, sender=model, dispatch_uid='bump_generation_save')
+            post_delete.connect(DatasetGeneration.bump, sender=model, dispatch_uid='bump_generation_delete')
+
+        # keep the flattened field list in sync with the models
+        post_save.connect(FieldListing.field_saved, sender=Field, dispatch_uid='listing_field_save')
+        post_save.connect(FieldListing.farm_saved, sender=Farm, dispatch_uid='listing_farm_save')
+        post_save.connect(FieldListing.grower_saved, sender=Grower, dispatch_uid='listing_grower_save')
+        post_delete.connect(FieldListing.field_deleted, sender=Field, dispatch_uid='listing_field_delete')
+
+        # keep the area and field count of each farm up to date
+        post_save.connect(FarmRollup.field_saved, sender=Field, dispatch_uid='rollup_field_save')
+        post_delete.connect(FarmRollup.field_deleted, sender=Field, dispatch_uid='rollup_field_delete')
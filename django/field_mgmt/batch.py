@@ -0,0 +1,228 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from field_mgmt.models import DatasetGeneration, Farm, FarmRollup, Field, FieldListing
+
+#-== @h1
+# Batch Field Operations
+#-== /field_mgmt.batch.py
+#________________________________________
+
+#-== @class
+class FieldBatch:
+	#-== Applies a list of create, update and delete operations to /Field records.
+	# All of the operations are checked against the database with a couple of
+	# set-based lookups and then written with /bulk_create , /bulk_update
+	# and a single /DELETE , inside one transaction.
+	# @attributes
+	# CREATE, UPDATE, DELETE: the supported values of the /op key of an operation
+	# OK, INVALID, NOT_FOUND, CONFLICT: the possible /status of an operation result
+	# EDITABLE_FIELDS: the keys allowed in the /data of an operation
+	# max_size: the maximum number of operations, read from the /FIELD_BATCH_MAX_SIZE setting by default
+	# errors: the list of error messages for operations which were not applied
+	# farm_ids: the primary keys of the existing farms referenced by the batch, read by /apply
+	#
+	#-== Each operation is a dictionary such as:
+	# /-{"op": "update", "pk": 12, "version": 3, "data": {"area": 41.5}}-/
+	# Updates and deletes must provide the /version of the record they were based on.
+	# Like the optimistic locking of /ConcurrentModel , an operation with an outdated
+	# /version is not applied and is reported with the /CONFLICT status.
+	# Operations which fail are skipped, the rest of the batch is still applied.
+
+	CREATE = 'create'
+	UPDATE = 'update'
+	DELETE = 'delete'
+
+	OK = 'ok'
+	INVALID = 'invalid'
+	NOT_FOUND = 'not_found'
+	CONFLICT = 'conflict'
+
+	EDITABLE_FIELDS = ['name', 'area', 'farm_id']
+
+	def __init__(self, max_size=None, logger=None):
+		if max_size is None:
+			max_size = getattr(settings, 'FIELD_BATCH_MAX_SIZE', 1000)
+		self.max_size = max_size
+		self.logger = logger or logging.getLogger('django.arva.FieldBatch')
+		self.errors = []
+		self.farm_ids = set()
+
+	#-== @method
+	def log_error(self, error_msg):
+		#-== Logs the /error_msg and adds it to the list of batch errors.
+
+		self.logger.error(error_msg)
+		self.errors.append(error_msg)
+
+	#-== @method
+	def check_operations(self, operations):
+		#-== Checks that /operations is a list of no more than /max_size items.
+		# @returns
+		# /True if the batch can be applied, otherwise /False .
+
+		if not isinstance(operations, list):
+			self.log_error('The batch must be a list of operations')
+			return False
+		if len(operations) > self.max_size:
+			self.log_error('The batch has {} operations, the maximum is {}'.format(len(operations), self.max_size))
+			return False
+		return True
+
+	#-== @method
+	def apply(self, operations):
+		#-== Applies the /operations in a single transaction.
+		# The records to update or delete are locked with /select_for_update
+		# while their versions are compared.
+		# @returns
+		# A list with a result dictionary for each operation, with the keys:
+		# @deflist
+		# op: the operation
+		# pk: the primary key of the record, including for created records
+		# status: one of /OK , /INVALID , /NOT_FOUND or /CONFLICT
+		# errors: the list of error messages for the operation
+		# data: the record as returned by /to_data once the batch is applied, for creates and updates
+
+		with transaction.atomic():
+			pks = {op.get('pk') for op in operations if isinstance(op, dict) and op.get('op') in (self.UPDATE, self.DELETE)}
+			existing = Field.objects.select_for_update().in_bulk([pk for pk in pks if isinstance(pk, int)])
+			farm_ids = set()
+			for op in operations:
+				if isinstance(op, dict) and isinstance(op.get('data'), dict):
+					farm_ids.add(op['data'].get('farm_id'))
+			farm_ids = {pk for pk in farm_ids if isinstance(pk, int)}
+			self.farm_ids = set(Farm.objects.filter(pk__in=farm_ids).values_list('pk', flat=True))
+
+			created = []
+			updated = {}
+			deleted = {}
+			results = []
+			for index, op in enumerate(operations):
+				result = self.prepare_operation(op, existing, deleted)
+				if result['status'] != self.OK:
+					self.log_error('Operation {}: {}'.format(index, ' '.join(result['errors'])))
+				elif result['op'] == self.CREATE:
+					created.append(result['obj'])
+				elif result['op'] == self.UPDATE:
+					updated[result['obj'].pk] = result['obj']
+				else:
+					deleted[result['obj'].pk] = result['obj']
+					updated.pop(result['obj'].pk, None)
+				results.append(result)
+
+			Field.objects.bulk_create(created)
+			if updated:
+				now = timezone.now()
+				for field in updated.values():
+					field.updated = now
+				Field.objects.bulk_update(updated.values(), ['name', 'area', 'farm', 'version', 'updated'])
+			if deleted:
+				# _raw_delete skips the collector, which would otherwise load the
+				# records again to send a post_delete signal for each of them
+				queryset = Field.objects.filter(pk__in=deleted.keys())
+				queryset._raw_delete(queryset.db)
+				FieldListing.remove(pk__in=deleted.keys())
+			if created or updated:
+				FieldListing.refresh(pk__in=[field.pk for field in created] + list(updated))
+			if created or updated or deleted:
+				changed = created + list(updated.values()) + list(deleted.values())
+				FarmRollup.refresh({field.farm_id for field in changed}
+					| {getattr(field, 'loaded_farm_id', None) for field in changed})
+				DatasetGeneration.bump()
+
+		for result in results:
+			obj = result.pop('obj', None)
+			if obj is not None:
+				result['pk'] = obj.pk
+				if result['op'] != self.DELETE:
+					result['data'] = obj.to_data()
+		return results
+
+	#-== @method
+	def prepare_operation(self, op, existing, deleted):
+		#-== Checks a single operation and applies it to the /Field object in memory.
+		# @params
+		# op: the operation dictionary
+		# existing: a dictionary of the locked /Field objects by primary key
+		# deleted: a dictionary of the /Field objects deleted by earlier operations of the batch
+		# @returns
+		# The result dictionary of the operation, with the /Field object under the /obj key
+		# if the operation is to be written.
+
+		if not isinstance(op, dict):
+			return self.result(None, None, self.INVALID, 'Each operation must be an object')
+		action = op.get('op')
+		pk = op.get('pk')
+		if action not in (self.CREATE, self.UPDATE, self.DELETE):
+			return self.result(action, pk, self.INVALID, 'op: must be one of create, update or delete')
+
+		data = op.get('data', {})
+		if action != self.DELETE:
+			if not isinstance(data, dict):
+				return self.result(action, pk, self.INVALID, 'data: must be an object')
+			unknown = [key for key in data if key not in self.EDITABLE_FIELDS + ['pk', 'version']]
+			if unknown:
+				return self.result(action, pk, self.INVALID, 'data: unknown fields {}'.format(', '.join(unknown)))
+
+		if action == self.CREATE:
+			obj = Field()
+		else:
+			if not isinstance(pk, int):
+				return self.result(action, pk, self.INVALID, 'pk: is required')
+			if not isinstance(op.get('version'), int):
+				return self.result(action, pk, self.INVALID, 'version: is required')
+			obj = existing.get(pk)
+			if obj is None or pk in deleted:
+				return self.result(action, pk, self.NOT_FOUND, 'No field with pk: {}'.format(pk))
+			if obj.version != op['version']:
+				return self.result(action, pk, self.CONFLICT,
+					'Record has been modified, current version is {}'.format(obj.version))
+			if action == self.DELETE:
+				return self.result(action, pk, self.OK, obj=obj)
+
+		original = {key: getattr(obj, key) for key in self.EDITABLE_FIELDS}
+		errors = self.apply_data(obj, data)
+		if errors:
+			for key, value in original.items():
+				setattr(obj, key, value)
+			return self.result(action, pk, self.INVALID, *errors)
+		if action == self.UPDATE:
+			obj.version += 1
+		return self.result(action, pk, self.OK, obj=obj)
+
+	#-== @method
+	def apply_data(self, obj, data):
+		#-== Sets the /EDITABLE_FIELDS from /data on the /obj and validates it.
+		# The farm is checked against the farms looked up for the whole batch,
+		# so the validation does not query the database.
+		# @returns
+		# A list of error messages, empty if the object is valid.
+
+		for key in self.EDITABLE_FIELDS:
+			if key in data:
+				setattr(obj, key, data[key])
+		errors = []
+		if obj.farm_id is None:
+			errors.append('farm: This field cannot be null.')
+		elif obj.farm_id not in self.farm_ids and 'farm_id' in data:
+			errors.append('farm: farm instance with id {} does not exist.'.format(obj.farm_id))
+		try:
+			obj.full_clean(exclude=['farm'])
+		except ValidationError as exc:
+			for key, val in exc.message_dict.items():
+				errors.append('{}: {}'.format(key, ' '.join(val)))
+		return errors
+
+	#-== @method
+	def result(self, action, pk, status, *errors, obj=None):
+		#-== @returns
+		# The result dictionary of an operation.
+
+		result = {'op': action, 'pk': pk, 'status': status, 'errors': list(errors)}
+		if obj is not None:
+			result['obj'] = obj
+		return result
@@ -0,0 +1,1019 @@
+import csv, logging, multiprocessing, os, tempfile, time, zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.core.validators import MinValueValidator
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from field_mgmt.models import DatasetGeneration, FarmRollup, FieldListing, Grower, Farm, Field
+from field_mgmt.natural_keys import unique_keys_enforced
+
+#-== @h1
+# Bulk Import Engine
+#-== /field_mgmt.importer.py
+#________________________________________
+
+#-== @class
+class ResolutionCache:
+	#-== A bounded cache of the records resolved by name during an import.
+	# The least recently used entries are dropped once /max_size is reached.
+	# @attributes
+	# AMBIGUOUS: the value cached for a name which matches multiple records
+	# max_size: the maximum number of entries, read from the /IMPORT_CACHE_SIZE setting by default
+
+	AMBIGUOUS = object()
+
+	def __init__(self, max_size=None):
+		if max_size is None:
+			max_size = getattr(settings, 'IMPORT_CACHE_SIZE', 100000)
+		self.max_size = max_size
+		self.entries = OrderedDict()
+
+	def __len__(self):
+		return len(self.entries)
+
+	#-== @method
+	def get_many(self, keys):
+		#-== @returns
+		# A dictionary with the cached value of each of the /keys which are in the cache.
+
+		found = {}
+		for key in keys:
+			if key in self.entries:
+				self.entries.move_to_end(key)
+				found[key] = self.entries[key]
+		return found
+
+	#-== @method
+	def clear(self):
+		#-== Removes every entry.
+
+		self.entries.clear()
+
+	#-== @method
+	def set_many(self, values):
+		#-== Adds the /values dictionary to the cache,
+		# dropping the least recently used entries beyond /max_size .
+
+		for key, value in values.items():
+			self.entries[key] = value
+			self.entries.move_to_end(key)
+		while len(self.entries) > self.max_size:
+			self.entries.popitem(last=False)
+
+
+#-== @class
+class ImportStage:
+	#-== The measurements of one stage of an import, added up over all of its batches.
+	# @attributes
+	# seconds: the time spent in the stage
+	# count: the number of rows or records handled by the stage
+	# queries: the number of database queries run by the stage
+
+	def __init__(self, seconds=0.0, count=0, queries=0):
+		self.seconds = seconds
+		self.count = count
+		self.queries = queries
+
+	#-== @method
+	def to_data(self):
+		#-== @returns
+		# A dictionary of the measurements, with the number of rows or records per second.
+
+		return {
+			'seconds': round(self.seconds, 6),
+			'count': self.count,
+			'per_second': round(self.count / self.seconds, 1) if self.count and self.seconds else None,
+			'queries': self.queries,
+		}
+
+
+#-== @class
+class ImportTimings:
+	#-== Measures the time, the number of rows or records and the database queries
+	# of each stage of an import, such as /parse , /validate , /-grower lookup-/ or /-field write-/ .
+	# @attributes
+	# stages: a dictionary of /ImportStage by name, in the order the stages were first run
+	# seconds: the time taken by the whole import, see /measure
+	# queries: the number of queries run by the whole import
+
+	def __init__(self):
+		self.stages = {}
+		self.seconds = 0.0
+		self.queries = 0
+
+	#-== @method
+	@contextmanager
+	def stage(self, name, count=0):
+		#-== Adds the time and queries of the block, and the /count , to the stage /name .
+		# The block is given the /ImportStage , so it can add a count which is only known at the end.
+
+		stage = self.stages.get(name)
+		if stage is None:
+			stage = self.stages[name] = ImportStage()
+		stage.count += count
+
+		def count_query(execute, sql, params, many, context):
+			stage.queries += 1
+			return execute(sql, params, many, context)
+
+		started = time.perf_counter()
+		try:
+			with connection.execute_wrapper(count_query):
+				yield stage
+		finally:
+			stage.seconds += time.perf_counter() - started
+
+	#-== @method
+	@contextmanager
+	def measure(self):
+		#-== Measures the block as the whole import.
+
+		def count_query(execute, sql, params, many, context):
+			self.queries += 1
+			return execute(sql, params, many, context)
+
+		started = time.perf_counter()
+		try:
+			with connection.execute_wrapper(count_query):
+				yield self
+		finally:
+			self.seconds += time.perf_counter() - started
+
+	#-== @method
+	def merge(self, data):
+		#-== Adds the stages of the /data returned by /to_data for another import.
+
+		for name, values in data['stages'].items():
+			stage = self.stages.get(name)
+			if stage is None:
+				stage = self.stages[name] = ImportStage()
+			stage.seconds += values['seconds']
+			stage.count += values['count']
+			stage.queries += values['queries']
+
+	#-== @method
+	def to_data(self):
+		#-== @returns
+		# A dictionary with the /seconds and /queries of the whole import, and the measurements
+		# of each stage under /stages . The time of the whole import which is not in any stage,
+		# such as starting and committing the transactions, is under /other_seconds .
+
+		return {
+			'seconds': round(self.seconds, 6),
+			'queries': self.queries,
+			'other_seconds': round(max(self.seconds - sum(stage.seconds for stage in self.stages.values()), 0), 6),
+			'stages': {name: stage.to_data() for name, stage in self.stages.items()},
+		}
+
+
+#-== @class
+class BulkImporter:
+	#-== Imports grower, farm and field records in batches.
+	# Instead of querying and saving each row individually,
+	# the rows of a batch are resolved against the database
+	# with a few set-based lookups and written with /bulk_create and /bulk_update .
+	# @attributes
+	# GROWER_COLUMNS: the optional columns which are copied onto new /Grower objects
+	# RECORD_COLUMN: an optional column with the record number to use in error messages
+	# batch_size: the number of rows resolved and written together
+	# records_read: the number of rows read from the import
+	# records_processed: the number of rows which were stored in the database
+	# errors: the list of error messages for rejected rows
+	# grower_cache: a /ResolutionCache of growers by name
+	# farm_cache: a /ResolutionCache of farms by grower primary key and name
+	# timings: the /ImportTimings of the stages of the import
+	#
+	#-== The rules for each row are the same as the original row-by-row import.
+	# New growers, farms and fields are created, existing fields have their /area updated,
+	# and a row is rejected if its grower, farm, or field name matches multiple records.
+
+	GROWER_COLUMNS = ['street_addr', 'city', 'state', 'zip_code', 'country']
+	RECORD_COLUMN = '_record'
+
+	def __init__(self, batch_size=None, logger=None):
+		if batch_size is None:
+			batch_size = getattr(settings, 'IMPORT_BATCH_SIZE', 1000)
+		self.batch_size = batch_size
+		self.grower_cache = ResolutionCache()
+		self.farm_cache = ResolutionCache()
+		self.logger = logger or logging.getLogger('django.arva.BulkImporter')
+		self.records_read = 0
+		self.records_processed = 0
+		self.errors = []
+		self.timings = ImportTimings()
+
+	#-== @method
+	def log_error(self, error_msg):
+		#-== Logs the /error_msg and adds it to the list of import errors.
+
+		self.logger.error(error_msg)
+		self.errors.append(error_msg)
+
+	#-== @method
+	def results(self):
+		#-== @returns
+		# A dictionary with the counters, errors and timings of the import,
+		# suitable to be sent as the JSON response of an import.
+
+		return {
+			'records_read': self.records_read,
+			'records_processed': self.records_processed,
+			'success': not self.errors,
+			'errors': self.errors,
+			'timings': self.timings.to_data(),
+		}
+
+	#-== @method
+	def check_required_columns(self, columns):
+		#-== Checks that all column names required for the import
+		# are in the /columns parameter.
+		# @returns
+		# /True if all required names are found, or /False if not.
+
+		columns = columns or []
+		passed = True
+		if 'grower_name' not in columns:
+			passed = False
+			self.log_error('No "grower_name" column defined')
+		if 'farm_name' not in columns:
+			self.log_error('No "farm_name" column defined')
+			passed = False
+		if 'field_name' not in columns:
+			self.log_error('No "field_name" column defined')
+			passed = False
+		if 'area' not in columns:
+			self.log_error('No area column defined')
+			passed = False
+		return passed
+
+	#-== @method
+	def import_csv(self, reader, progress=None):
+		#-== Imports the rows of a /csv.DictReader if it has the required columns.
+		# The upload is decoded and parsed while it is imported, so a record which is not
+		# valid UTF-8 or CSV is only found once the batches before it have been committed.
+		# Reading stops at that record and it is reported as an error, see /read_rows ,
+		# and the records before it are kept.
+		# @params
+		# reader: the /csv.DictReader of the upload
+		# progress: an optional callable which is given the importer after each batch
+
+		try:
+			columns = reader.fieldnames
+		except (UnicodeDecodeError, csv.Error) as exc:
+			self.log_error('The CSV header could not be read: {}'.format(exc))
+			return
+		if self.check_required_columns(columns):
+			self.import_rows(self.read_rows(reader), progress=progress)
+
+	#-== @method
+	def read_rows(self, rows):
+		#-== Yields the /rows until one of them cannot be decoded or parsed,
+		# which is logged as an error with its record number.
+		# The rows after it are not read.
+
+		rows = iter(rows)
+		record = 0
+		while True:
+			try:
+				row = next(rows)
+			except StopIteration:
+				return
+			except (UnicodeDecodeError, csv.Error) as exc:
+				self.log_error('Record {}: Could not be read, the import stopped at this record: {}'.format(record + 1, exc))
+				return
+			record += 1
+			yield row
+
+	#-== @method
+	def import_rows(self, rows, progress=None):
+		#-== Imports an iterable of /rows (dictionaries keyed by column name),
+		# taking /batch_size rows at a time.
+		# Each batch is written in its own transaction, see /import_batch .
+		# @params
+		# rows: the rows to import
+		# progress: an optional callable which is given the importer after each batch
+
+		rows = iter(rows)
+		while True:
+			# the rows are read and parsed from the CSV as they are taken
+			with self.timings.stage('parse') as stage:
+				batch = list(islice(rows, self.batch_size))
+				stage.count += len(batch)
+			if not batch:
+				break
+			self.import_batch(batch)
+			if progress is not None:
+				progress(self)
+
+	#-== @method
+	def import_batch(self, rows):
+		#-== Resolves and writes a single batch of /rows in one transaction,
+		# so the writes of a batch are committed together.
+		# Rows which fail /validate_rows are rejected before any lookups.
+		#
+		#-== If the database rejects a write of the batch, the transaction is rolled back
+		# and the rows are written again one at a time with /write_rows_separately ,
+		# so only the rows the database rejects are reported as errors.
+		# The errors logged by the rolled back attempt are dropped first, as the rows are resolved again.
+		#
+		#-== The bulk queries do not send model signals, so the /DatasetGeneration
+		# is incremented in the transaction of each batch. Cached lists are then replaced
+		# as soon as a batch is committed, even while a long import is still running,
+		# or if it stops on an error before the last batch.
+
+		first_record = self.records_read + 1
+		self.records_read += len(rows)
+		for index, row in enumerate(rows):
+			row.setdefault(self.RECORD_COLUMN, first_record + index)
+		with self.timings.stage('validate', len(rows)):
+			rows = self.validate_rows(rows, first_record)
+		mark = len(self.errors)
+		try:
+			with transaction.atomic():
+				fields = self.write_rows(rows)
+				with self.timings.stage('derived tables'):
+					self.refresh_derived_tables(fields)
+					DatasetGeneration.bump()
+		except DatabaseError as exc:
+			self.logger.warning('Batch from record {} failed, writing its rows one at a time: {}'.format(first_record, exc))
+			del self.errors[mark:]
+			with transaction.atomic():
+				fields = self.write_rows_separately(rows)
+				with self.timings.stage('derived tables'):
+					self.refresh_derived_tables(fields)
+					DatasetGeneration.bump()
+		self.records_processed += sum(1 for field in fields if field is not None)
+
+	#-== @method
+	def write_rows(self, rows):
+		#-== Resolves and writes the /rows .
+		# Growers are resolved and created first, so that farms can reference them,
+		# then farms, and finally the fields are created or updated.
+		# @returns
+		# The result of /resolve_fields .
+
+		growers = self.resolve_growers(rows)
+		farms = self.resolve_farms(rows, growers)
+		return self.resolve_fields(rows, farms)
+
+	#-== @method
+	def write_rows_separately(self, rows):
+		#-== Writes the /rows one at a time, each in its own savepoint,
+		# so a row which the database rejects only rolls back its own writes.
+		# The caches are cleared whenever a savepoint is rolled back,
+		# as they may hold records which were created in it.
+		# @returns
+		# A list with the result of /resolve_fields for each row, or /None if the row was rejected.
+
+		self.clear_caches()
+		results = []
+		for row in rows:
+			try:
+				with transaction.atomic():
+					results.extend(self.write_rows([row]))
+			except DatabaseError as exc:
+				self.clear_caches()
+				self.log_error('Record {}: {}'.format(row[self.RECORD_COLUMN], exc))
+				results.append(None)
+		return results
+
+	#-== @method
+	def clear_caches(self):
+		#-== Empties the /grower_cache and the /farm_cache .
+
+		self.grower_cache.clear()
+		self.farm_cache.clear()
+
+	#-== @method
+	def validate_rows(self, rows, first_record):
+		#-== Validates the columns of a batch of /rows against the model fields they populate.
+		# Each column is checked over the whole batch at once, instead of
+		# creating a model object and running /full_clean() for each row.
+		# The names must not be blank, text values must fit the /max_length of their field
+		# and the /area must be a number allowed by the /MinValueValidator of /Field.area .
+		# @params
+		# rows: the batch of rows to validate
+		# first_record: the record number of the first row, used in the error messages
+		# @returns
+		# The list of rows which passed, with the /area converted to a float.
+
+		row_errors = [[] for row in rows]
+
+		for column, model_field in self.text_columns():
+			values = [row.get(column) for row in rows]
+			max_length = model_field.max_length
+			for index, value in enumerate(values):
+				if value is None or value == '':
+					if not model_field.blank:
+						row_errors[index].append('{}: This field cannot be blank.'.format(column))
+				elif len(value) > max_length:
+					row_errors[index].append('{}: Ensure this value has at most {} characters (it has {}).'.format(
+						column, max_length, len(value)))
+
+		min_area, min_area_message = self.min_area()
+		areas = []
+		for index, value in enumerate(row.get('area') for row in rows):
+			try:
+				area = float(value)
+			except (TypeError, ValueError):
+				row_errors[index].append('area: "{}" value must be a float.'.format(value))
+				area = None
+			else:
+				if not area >= min_area:
+					row_errors[index].append('area: {}'.format(min_area_message))
+			areas.append(area)
+
+		valid_rows = []
+		for index, (row, area, errors) in enumerate(zip(rows, areas, row_errors)):
+			if errors:
+				for error in errors:
+					record = row.get(self.RECORD_COLUMN) or first_record + index
+					self.log_error('Record {}: {}'.format(record, error))
+				continue
+			row['area'] = area
+			valid_rows.append(row)
+		return valid_rows
+
+	#-== @method
+	def text_columns(self):
+		#-== @returns
+		# A list of the text columns of the import paired with the model field they populate.
+
+		columns = [
+			('grower_name', Grower._meta.get_field('name')),
+			('farm_name', Farm._meta.get_field('name')),
+			('field_name', Field._meta.get_field('name')),
+		]
+		for column in self.GROWER_COLUMNS:
+			columns.append((column, Grower._meta.get_field(column)))
+		return columns
+
+	#-== @method
+	def min_area(self):
+		#-== @returns
+		# The minimum value and error message of the /MinValueValidator on /Field.area .
+
+		for validator in Field._meta.get_field('area').validators:
+			if isinstance(validator, MinValueValidator):
+				return validator.limit_value, validator.message
+		return float('-inf'), ''
+
+	#-== @method
+	def resolve_growers(self, rows):
+		#-== Finds or creates the /Grower for each row.
+		# Only the names which are not in the /grower_cache are looked up in the database.
+		# @returns
+		# A list with a /Grower object for each row,
+		# or /None if the row is to be rejected.
+
+		names = {row['grower_name'] for row in rows}
+		resolved = self.grower_cache.get_many(names)
+		missing = names - resolved.keys()
+		with self.timings.stage('grower lookup', len(missing)):
+			for grower in Grower.objects.filter(name__in=missing):
+				if grower.name in resolved:
+					resolved[grower.name] = ResolutionCache.AMBIGUOUS
+				else:
+					resolved[grower.name] = grower
+
+		created = []
+		results = []
+		for row in rows:
+			grower_name = row['grower_name']
+			grower = resolved.get(grower_name)
+			if grower is ResolutionCache.AMBIGUOUS:
+				self.log_error('Multiple growers with name: {}'.format(grower_name))
+				grower = None
+			elif grower is None:
+				self.logger.info('No grower with name, creating new grower: {}'.format(grower_name))
+				grower = Grower(name=grower_name)
+				for column in self.GROWER_COLUMNS:
+					self.set_value(grower, row, column)
+				resolved[grower_name] = grower
+				created.append(grower)
+			results.append(grower)
+
+		with self.timings.stage('grower write', len(created)):
+			Grower.objects.bulk_create(created)
+		self.grower_cache.set_many(resolved)
+		return results
+
+	#-== @method
+	def resolve_farms(self, rows, growers):
+		#-== Finds or creates the /Farm for each row, using the /growers resolved for the rows.
+		# Only the farms which are not in the /farm_cache are looked up in the database.
+		# @returns
+		# A list with a /Farm object for each row,
+		# or /None if the row is to be rejected.
+
+		keys = {(grower.pk, row['farm_name']) for row, grower in zip(rows, growers) if grower is not None}
+		resolved = self.farm_cache.get_many(keys)
+		missing = keys - resolved.keys()
+		grower_ids = {key[0] for key in missing}
+		names = {key[1] for key in missing}
+		with self.timings.stage('farm lookup', len(missing)):
+			for farm in Farm.objects.filter(grower_id__in=grower_ids, name__in=names):
+				key = (farm.grower_id, farm.name)
+				if key not in missing:
+					continue
+				if key in resolved:
+					resolved[key] = ResolutionCache.AMBIGUOUS
+				else:
+					resolved[key] = farm
+
+		created = []
+		results = []
+		for row, grower in zip(rows, growers):
+			farm = None
+			if grower is None:
+				results.append(farm)
+				continue
+			farm_name = row['farm_name']
+			key = (grower.pk, farm_name)
+			farm = resolved.get(key)
+			if farm is ResolutionCache.AMBIGUOUS:
+				self.log_error('Multiple farms with name: {}'.format(farm_name))
+				farm = None
+			elif farm is None:
+				self.logger.info('No farm with name, creating new farm: {}'.format(farm_name))
+				farm = Farm(name=farm_name, grower=grower)
+				resolved[key] = farm
+				created.append(farm)
+			results.append(farm)
+
+		with self.timings.stage('farm write', len(created)):
+			Farm.objects.bulk_create(created)
+		self.farm_cache.set_many(resolved)
+		return results
+
+	#-== @method
+	def resolve_fields(self, rows, farms):
+		#-== Creates or updates the /Field for each row, using the /farms resolved for the rows.
+		# @returns
+		# A list with a /Field object for each row,
+		# or /None if the row is to be rejected.
+
+		farm_ids = {farm.pk for farm in farms if farm is not None}
+		names = {row['field_name'] for row, farm in zip(rows, farms) if farm is not None}
+		existing = {}
+		with self.timings.stage('field lookup', len(names)):
+			for field in Field.objects.filter(farm_id__in=farm_ids, name__in=names):
+				existing.setdefault((field.farm_id, field.name), []).append(field)
+
+		created = {}
+		updated = {}
+		results = []
+		for row, farm in zip(rows, farms):
+			field = None
+			if farm is None:
+				results.append(field)
+				continue
+			field_name = row['field_name']
+			key = (farm.pk, field_name)
+			matches = existing.get(key, [])
+			if len(matches) > 1:
+				self.log_error('Multiple field with name: {}'.format(field_name))
+			elif len(matches) == 1 or key in created:
+				field = matches[0] if matches else created[key]
+				field.area = row['area']
+				if matches:
+					updated[key] = field
+			else:
+				self.logger.warning('No field with name, creating new field: {}'.format(field_name))
+				field = Field(name=field_name, area=row['area'], farm=farm)
+				created[key] = field
+			results.append(field)
+
+		with self.timings.stage('field write', len(created) + len(updated)):
+			Field.objects.bulk_create(created.values())
+			if updated:
+				now = timezone.now()
+				for field in updated.values():
+					field.version += 1
+					field.updated = now
+				Field.objects.bulk_update(updated.values(), ['area', 'version', 'updated'])
+		return results
+
+	#-== @method
+	def refresh_derived_tables(self, fields):
+		#-== Refreshes the /FieldListing rows and the /FarmRollup counts
+		# of the /fields returned by /resolve_fields .
+
+		fields = [field for field in fields if field is not None]
+		FieldListing.refresh(pk__in=[field.pk for field in fields])
+		FarmRollup.refresh({field.farm_id for field in fields})
+
+	#-== @method
+	def set_value(self, obj, row, field_name):
+		#-== Checks the /row for a /field_name and updates the /obj if it finds it.
+
+		if field_name in row.keys():
+			setattr(obj, field_name, row[field_name])
+
+
+#-== @class
+class ParallelImporter(BulkImporter):
+	#-== Splits the import into shards by grower name
+	# and imports the shards in a pool of worker processes.
+	# Since every row of a grower lands in the same shard,
+	# the grower, farm and field records of one shard are never touched by another.
+	# @attributes
+	# workers: the number of shards and worker processes
+	#
+	#-== The counters and errors of each shard are merged, so the /results
+	# are the same as the /BulkImporter , although the errors are grouped by shard.
+	# @note
+	# SQLite only allows one writer at a time, so with SQLite
+	# the rows are imported in this process like the /BulkImporter .
+
+	def __init__(self, workers=None, batch_size=None, logger=None):
+		super().__init__(batch_size=batch_size, logger=logger)
+		if workers is None:
+			workers = getattr(settings, 'IMPORT_PARALLEL_WORKERS', None) or os.cpu_count() or 1
+		self.workers = workers
+
+	#-== @method
+	def can_run_parallel(self):
+		#-== @returns
+		# /True if the database can take writes from several processes at once.
+
+		return self.workers > 1 and connection.vendor != 'sqlite'
+
+	#-== @method
+	def import_rows(self, rows, progress=None):
+		#-== Writes the /rows to shard files and imports each shard in a worker process.
+		# @params
+		# rows: the rows to import
+		# progress: an optional callable which is given the importer after each shard
+
+		if not self.can_run_parallel():
+			return super().import_rows(rows, progress=progress)
+
+		# the rows are parsed from the CSV while they are written to the shards
+		with self.timings.stage('shard'):
+			paths = self.write_shards(rows)
+		try:
+			# worker processes open their own connections
+			connections.close_all()
+			context = multiprocessing.get_context('spawn')
+			with ProcessPoolExecutor(max_workers=len(paths) or 1, mp_context=context,
+					initializer=django.setup) as pool:
+				futures = [pool.submit(import_shard, path, self.batch_size) for path in paths]
+				for future in as_completed(futures):
+					self.merge_results(future.result())
+					if progress is not None:
+						progress(self)
+		finally:
+			for path in paths:
+				os.remove(path)
+
+	#-== @method
+	def write_shards(self, rows):
+		#-== Distributes the /rows into temporary CSV files using a hash of the grower name.
+		# The original record number is kept in the /RECORD_COLUMN of each shard.
+		# @returns
+		# The paths of the shard files which received rows.
+
+		shards = [None] * self.workers
+		fieldnames = None
+		try:
+			for record, row in enumerate(rows, 1):
+				if fieldnames is None:
+					fieldnames = [key for key in row.keys() if key is not None]
+					fieldnames.append(self.RECORD_COLUMN)
+				row[self.RECORD_COLUMN] = record
+				grower_name = row['grower_name'] or ''
+				index = zlib.crc32(grower_name.encode('utf-8')) % self.workers
+				if shards[index] is None:
+					shard = tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='',
+						prefix='import-shard-', suffix='.csv', delete=False)
+					writer = csv.DictWriter(shard, fieldnames, extrasaction='ignore')
+					writer.writeheader()
+					shards[index] = (shard, writer)
+				shards[index][1].writerow(row)
+		finally:
+			for shard in shards:
+				if shard is not None:
+					shard[0].close()
+		return [shard[0].name for shard in shards if shard is not None]
+
+	#-== @method
+	def merge_results(self, results):
+		#-== Adds the /results of a shard to the counters, errors and timings of this import.
+		# The stages of the shards are added up, so with several workers
+		# their times can add up to more than the time of the whole import.
+
+		self.records_read += results['records_read']
+		self.records_processed += results['records_processed']
+		self.errors.extend(results['errors'])
+		self.timings.merge(results['timings'])
+
+
+#-== @class
+class CopyImporter(BulkImporter):
+	#-== Loads the rows into a temporary staging table with Postgres /-COPY FROM STDIN-/
+	# and resolves the growers, farms and fields with set-based SQL.
+	# The rules are the same as the /BulkImporter : the rows are validated
+	# with /validate_rows while they are copied, rows with ambiguous names are rejected
+	# with the same error messages, missing records are created,
+	# and existing fields get the /area of the last row which names them.
+	# @attributes
+	# STAGING_TABLE: the name of the temporary staging table
+	# @note
+	# The whole import runs in one transaction. With any other database than Postgres
+	# the rows are imported by the /BulkImporter instead.
+
+	STAGING_TABLE = 'field_mgmt_import_staging'
+	STAGING_COLUMNS = ['grower_name', 'street_addr', 'city', 'state', 'zip_code',
+		'country', 'farm_name', 'field_name']
+
+	#-== @method
+	def import_rows(self, rows, progress=None):
+		#-== Copies the /rows into the staging table and merges them into the model tables.
+		# @params
+		# rows: the rows to import
+		# progress: an optional callable which is given the importer once the rows are copied
+
+		if connection.vendor != 'postgresql':
+			return super().import_rows(rows, progress=progress)
+
+		with transaction.atomic():
+			with connection.cursor() as cursor:
+				self.create_staging_table(cursor)
+				self.copy_rows(cursor, rows)
+				if progress is not None:
+					progress(self)
+				with self.timings.stage('grower merge'):
+					self.merge_growers(cursor)
+				with self.timings.stage('farm merge'):
+					self.merge_farms(cursor)
+				with self.timings.stage('field merge'):
+					self.merge_fields(cursor)
+				cursor.execute('SELECT count(*) FROM {}'.format(self.STAGING_TABLE))
+				self.records_processed += cursor.fetchone()[0]
+				with self.timings.stage('derived tables'):
+					staged_farms = RawSQL('SELECT DISTINCT farm_id FROM {}'.format(self.STAGING_TABLE), [])
+					FieldListing.refresh(farm_id__in=staged_farms)
+					FarmRollup.count_fields(Field.objects.filter(farm_id__in=staged_farms), staged_farms)
+					DatasetGeneration.bump()
+
+	#-== @method
+	def create_staging_table(self, cursor):
+		#-== Creates the staging table, which is dropped when the transaction ends.
+
+		columns = ', '.join('{} text'.format(column) for column in self.STAGING_COLUMNS)
+		cursor.execute(
+			'CREATE TEMPORARY TABLE {} (record bigint, {}, area double precision, '
+			'grower_id bigint, farm_id bigint) ON COMMIT DROP'.format(self.STAGING_TABLE, columns))
+
+	#-== @method
+	def copy_rows(self, cursor, rows):
+		#-== Validates the /rows in batches and streams the valid ones into the staging table.
+
+		columns = ['record'] + self.STAGING_COLUMNS + ['area']
+		statement = 'COPY {} ({}) FROM STDIN'.format(self.STAGING_TABLE, ', '.join(columns))
+		rows = iter(rows)
+		with cursor.cursor.copy(statement) as copy:
+			while True:
+				with self.timings.stage('parse') as stage:
+					batch = list(islice(rows, self.batch_size))
+					stage.count += len(batch)
+				if not batch:
+					break
+				first_record = self.records_read + 1
+				self.records_read += len(batch)
+				for index, row in enumerate(batch):
+					row.setdefault(self.RECORD_COLUMN, first_record + index)
+				with self.timings.stage('validate', len(batch)):
+					batch = self.validate_rows(batch, first_record)
+				with self.timings.stage('copy', len(batch)):
+					for row in batch:
+						values = [row[self.RECORD_COLUMN]]
+						values.extend(row.get(column) for column in self.STAGING_COLUMNS)
+						values.append(row['area'])
+						copy.write_row(values)
+		with self.timings.stage('copy'):
+			cursor.execute('ANALYZE {}'.format(self.STAGING_TABLE))
+
+	#-== @method
+	def reject_ambiguous(self, cursor, sql, message):
+		#-== Logs the /message for each staged row found by the /sql query
+		# ( /record and name columns) and removes those rows from the staging table.
+
+		cursor.execute(sql)
+		records = []
+		for record, name in cursor.fetchall():
+			self.log_error(message.format(name))
+			records.append(record)
+		if records:
+			cursor.execute('DELETE FROM {} WHERE record = ANY(%s)'.format(self.STAGING_TABLE), [records])
+
+	#-== @method
+	def merge_growers(self, cursor):
+		#-== Rejects rows with ambiguous grower names, creates the missing growers
+		# from the first row which names them, and sets the /grower_id of the staged rows.
+
+		staging = self.STAGING_TABLE
+		growers = Grower._meta.db_table
+		self.reject_ambiguous(cursor,
+			'SELECT s.record, s.grower_name FROM {staging} s WHERE s.grower_name IN '
+			'(SELECT name FROM {growers} GROUP BY name HAVING count(*) > 1) ORDER BY s.record'.format(
+				staging=staging, growers=growers),
+			'Multiple growers with name: {}')
+		columns = ', '.join(self.GROWER_COLUMNS)
+		cursor.execute(
+			'INSERT INTO {growers} (created, updated, version, name, {columns}) '
+			'SELECT DISTINCT ON (s.grower_name) now(), now(), 1, s.grower_name, {staged_columns} '
+			'FROM {staging} s WHERE NOT EXISTS (SELECT 1 FROM {growers} g WHERE g.name = s.grower_name) '
+			'ORDER BY s.grower_name, s.record'.format(
+				growers=growers, staging=staging, columns=columns,
+				staged_columns=', '.join('s.' + column for column in self.GROWER_COLUMNS)))
+		cursor.execute(
+			'UPDATE {staging} s SET grower_id = g.id FROM {growers} g WHERE g.name = s.grower_name'.format(
+				staging=staging, growers=growers))
+
+	#-== @method
+	def merge_farms(self, cursor):
+		#-== Rejects rows with ambiguous farm names, creates the missing farms,
+		# and sets the /farm_id of the staged rows.
+
+		staging = self.STAGING_TABLE
+		farms = Farm._meta.db_table
+		self.reject_ambiguous(cursor,
+			'SELECT s.record, s.farm_name FROM {staging} s WHERE (s.grower_id, s.farm_name) IN '
+			'(SELECT grower_id, name FROM {farms} GROUP BY grower_id, name HAVING count(*) > 1) '
+			'ORDER BY s.record'.format(staging=staging, farms=farms),
+			'Multiple farms with name: {}')
+		cursor.execute(
+			'INSERT INTO {farms} (created, updated, version, name, grower_id) '
+			'SELECT DISTINCT now(), now(), 1, s.farm_name, s.grower_id FROM {staging} s '
+			'WHERE NOT EXISTS (SELECT 1 FROM {farms} f WHERE f.grower_id = s.grower_id AND f.name = s.farm_name)'.format(
+				farms=farms, staging=staging))
+		cursor.execute(
+			'UPDATE {staging} s SET farm_id = f.id FROM {farms} f '
+			'WHERE f.grower_id = s.grower_id AND f.name = s.farm_name'.format(staging=staging, farms=farms))
+
+	#-== @method
+	def merge_fields(self, cursor):
+		#-== Rejects rows with ambiguous field names, updates the /area of existing fields
+		# and creates the missing fields, using the last row which names each field.
+
+		staging = self.STAGING_TABLE
+		fields = Field._meta.db_table
+		self.reject_ambiguous(cursor,
+			'SELECT s.record, s.field_name FROM {staging} s WHERE (s.farm_id, s.field_name) IN '
+			'(SELECT farm_id, name FROM {fields} GROUP BY farm_id, name HAVING count(*) > 1) '
+			'ORDER BY s.record'.format(staging=staging, fields=fields),
+			'Multiple field with name: {}')
+		last_rows = (
+			'SELECT DISTINCT ON (farm_id, field_name) farm_id, field_name, area FROM {staging} '
+			'ORDER BY farm_id, field_name, record DESC'.format(staging=staging))
+		cursor.execute(
+			'UPDATE {fields} f SET area = s.area, version = f.version + 1, updated = now() '
+			'FROM ({last_rows}) s WHERE f.farm_id = s.farm_id AND f.name = s.field_name'.format(
+				fields=fields, last_rows=last_rows))
+		cursor.execute(
+			'INSERT INTO {fields} (created, updated, version, name, area, farm_id) '
+			'SELECT now(), now(), 1, s.field_name, s.area, s.farm_id FROM ({last_rows}) s '
+			'WHERE NOT EXISTS (SELECT 1 FROM {fields} f WHERE f.farm_id = s.farm_id AND f.name = s.field_name)'.format(
+				fields=fields, last_rows=last_rows))
+
+
+#-== @class
+class UpsertImporter(BulkImporter):
+	#-== Imports the rows in batches like the /BulkImporter , relying on the unique indexes
+	# of the natural keys (see /field_mgmt.natural_keys.py ) instead of checking for duplicates.
+	# Growers and farms are inserted with /-ON CONFLICT DO NOTHING-/ and read back by name,
+	# and the fields are written with a single /-INSERT ... ON CONFLICT DO UPDATE-/ per batch,
+	# which sets the /area of the last row naming each field and increments its /version .
+	# @note
+	# The import is refused if the unique indexes have not been created
+	# with /-manage.py natural_keys --enforce-/ .
+
+	#-== @method
+	def import_rows(self, rows, progress=None):
+		#-== Imports the /rows if the natural keys are enforced.
+
+		if not unique_keys_enforced():
+			self.log_error('Unique natural keys are not enforced, run manage.py natural_keys --enforce')
+			return
+		return super().import_rows(rows, progress=progress)
+
+	#-== @method
+	def resolve_growers(self, rows):
+		#-== Inserts the growers which are not in the /grower_cache , skipping existing names,
+		# and reads them back by name.
+		# New growers get the /GROWER_COLUMNS of the first row which names them.
+		# @returns
+		# A list with a /Grower object for each row.
+
+		names = {row['grower_name'] for row in rows}
+		resolved = self.grower_cache.get_many(names)
+		missing = {}
+		for row in rows:
+			grower_name = row['grower_name']
+			if grower_name not in resolved and grower_name not in missing:
+				grower = Grower(name=grower_name)
+				for column in self.GROWER_COLUMNS:
+					self.set_value(grower, row, column)
+				missing[grower_name] = grower
+
+		if missing:
+			with self.timings.stage('grower write', len(missing)):
+				Grower.objects.bulk_create(missing.values(), ignore_conflicts=True)
+			with self.timings.stage('grower lookup', len(missing)):
+				for grower in Grower.objects.filter(name__in=missing.keys()):
+					resolved[grower.name] = grower
+		self.grower_cache.set_many(resolved)
+		return [resolved[row['grower_name']] for row in rows]
+
+	#-== @method
+	def resolve_farms(self, rows, growers):
+		#-== Inserts the farms which are not in the /farm_cache , skipping existing names,
+		# and reads them back by grower and name.
+		# @returns
+		# A list with a /Farm object for each row.
+
+		keys = [(grower.pk, row['farm_name']) for row, grower in zip(rows, growers)]
+		resolved = self.farm_cache.get_many(set(keys))
+		missing = {key: Farm(grower_id=key[0], name=key[1]) for key in keys if key not in resolved}
+
+		if missing:
+			with self.timings.stage('farm write', len(missing)):
+				Farm.objects.bulk_create(missing.values(), ignore_conflicts=True)
+			grower_ids = {key[0] for key in missing}
+			names = {key[1] for key in missing}
+			with self.timings.stage('farm lookup', len(missing)):
+				for farm in Farm.objects.filter(grower_id__in=grower_ids, name__in=names):
+					key = (farm.grower_id, farm.name)
+					if key in missing:
+						resolved[key] = farm
+		self.farm_cache.set_many(resolved)
+		return [resolved[key] for key in keys]
+
+	#-== @method
+	def resolve_fields(self, rows, farms):
+		#-== Creates or updates the /Field for each row with /-INSERT ... ON CONFLICT DO UPDATE-/ .
+		# @returns
+		# A list with the natural key of the field for each row.
+
+		areas = {}
+		results = []
+		for row, farm in zip(rows, farms):
+			key = (farm.pk, row['field_name'])
+			areas[key] = row['area']
+			results.append(key)
+		if not areas:
+			return results
+
+		meta = Field._meta
+		quote = connection.ops.quote_name
+		columns = ['created', 'updated', 'version', 'name', 'area', 'farm']
+		column_names = ', '.join(quote(meta.get_field(name).column) for name in columns)
+		now = meta.get_field('updated').get_db_prep_save(timezone.now(), connection)
+		values = [(now, now, 1, name, area, farm_id) for (farm_id, name), area in areas.items()]
+		table = quote(meta.db_table)
+		chunk_size = connection.ops.bulk_batch_size(columns, values)
+		with self.timings.stage('field write', len(values)), connection.cursor() as cursor:
+			for start in range(0, len(values), chunk_size):
+				chunk = values[start:start + chunk_size]
+				placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(chunk))
+				cursor.execute(
+					'INSERT INTO {table} ({columns}) VALUES {placeholders} '
+					'ON CONFLICT ({farm}, {name}) DO UPDATE SET {area} = EXCLUDED.{area}, '
+					'{version} = {table}.{version} + 1, {updated} = EXCLUDED.{updated}'.format(
+						table=table, columns=column_names, placeholders=placeholders,
+						farm=quote(meta.get_field('farm').column), name=quote('name'), area=quote('area'),
+						version=quote('version'), updated=quote('updated')),
+					[value for row in chunk for value in row])
+		return results
+
+	#-== @method
+	def refresh_derived_tables(self, fields):
+		#-== Refreshes the /FieldListing rows and the /FarmRollup counts
+		# of the fields named by the natural keys in /fields .
+
+		fields = [key for key in fields if key is not None]
+		farm_ids = {key[0] for key in fields}
+		FieldListing.refresh(farm_id__in=farm_ids, name__in={key[1] for key in fields})
+		FarmRollup.refresh(farm_ids)
+
+
+#-== @function
+def import_shard(path, batch_size):
+	#-== Imports a single shard file in a worker process.
+	# @returns
+	# The /results of the /BulkImporter for the shard.
+
+	importer = BulkImporter(batch_size=batch_size)
+	with open(path, encoding='utf-8', newline='') as shard, importer.timings.measure():
+		importer.import_rows(csv.DictReader(shard))
+	connections.close_all()
+	return importer.results()
@@ -0,0 +1,150 @@
+import codecs, csv, logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from field_mgmt.importer import BulkImporter
+from field_mgmt.models import ImportJob
+
+#-== @h1
+# Background Import Jobs
+#-== /field_mgmt.jobs.py
+#________________________________________
+#
+#-== Imports which are submitted as an /ImportJob are processed outside of the request.
+# The /ImportJob table acts as the queue, so no external broker is required.
+# The /IMPORT_JOB_WORKER setting selects who picks up the jobs:
+# @deflist
+# thread: a small thread pool inside the web server process runs the job as soon as it is submitted
+# queue: jobs stay /PENDING until a /-manage.py process_imports-/ worker claims them
+#
+#-== A running job sets its /updated time after each batch of rows, as a heartbeat.
+# A job whose worker stopped, such as a thread of a server process which was replaced,
+# stays /RUNNING without a heartbeat, so once it is older than the /IMPORT_JOB_STALE_SECONDS
+# setting it is marked as /FAILED by /fail_stale_jobs .
+
+logger = logging.getLogger('django.arva.ImportJobs')
+
+_executor = None
+
+
+#-== @function
+def submit_job(job):
+	#-== Queues the /job to be processed once the current transaction commits.
+
+	if getattr(settings, 'IMPORT_JOB_WORKER', 'thread') != 'thread':
+		return
+	global _executor
+	if _executor is None:
+		workers = getattr(settings, 'IMPORT_JOB_THREADS', 1)
+		_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import-job')
+	transaction.on_commit(lambda: _executor.submit(run_claimed_job, job.pk))
+
+
+#-== @function
+def run_claimed_job(job_pk):
+	#-== Claims the job with /job_pk and runs it.
+	# The job is skipped if another worker has already claimed it.
+
+	try:
+		job = claim_job(job_pk)
+		if job is not None:
+			run_job(job)
+	finally:
+		connections.close_all()
+
+
+#-== @function
+def claim_job(job_pk):
+	#-== Marks a /PENDING job as /RUNNING .
+	# The status change is a conditional update,
+	# so only one worker can claim a given job.
+	# @returns
+	# The claimed /ImportJob object, or /None if it was not pending.
+
+	claimed = ImportJob.objects.filter(pk=job_pk, status=ImportJob.PENDING).update(
+		status=ImportJob.RUNNING, updated=timezone.now())
+	if not claimed:
+		return None
+	return ImportJob.objects.get(pk=job_pk)
+
+
+#-== @function
+def claim_next_job():
+	#-== Claims the oldest /PENDING job, after failing the stale jobs.
+	# @returns
+	# The claimed /ImportJob object, or /None if there are no pending jobs.
+
+	fail_stale_jobs()
+	pending = ImportJob.objects.filter(status=ImportJob.PENDING).order_by('created')
+	for job_pk in pending.values_list('pk', flat=True)[:10]:
+		job = claim_job(job_pk)
+		if job is not None:
+			return job
+	return None
+
+
+#-== @function
+def fail_stale_jobs(job_pk=None):
+	#-== Marks the /RUNNING jobs without a heartbeat for /IMPORT_JOB_STALE_SECONDS as /FAILED ,
+	# and removes their uploaded files. The rows of the batches they finished are kept,
+	# so the jobs are not run again.
+	# The status change is a conditional update, so a job which saves its progress meanwhile is left running.
+	# @params
+	# job_pk: only check the job with this primary key, rather than every running job
+	# @returns
+	# The number of jobs which were marked as failed.
+
+	cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'IMPORT_JOB_STALE_SECONDS', 600))
+	stale = ImportJob.objects.filter(status=ImportJob.RUNNING, updated__lt=cutoff)
+	if job_pk is not None:
+		stale = stale.filter(pk=job_pk)
+	failed = 0
+	for job in stale:
+		errors = job.errors + ['Import failed: the import stopped without finishing, '
+			'the records processed before it stopped were kept']
+		if not stale.filter(pk=job.pk, updated=job.updated).update(
+				status=ImportJob.FAILED, errors=errors, upload='', updated=timezone.now()):
+			continue
+		logger.warning('Import job {} has had no progress since {}, it was marked as failed'.format(job.pk, job.updated))
+		job.upload.delete(save=False)
+		failed += 1
+	return failed
+
+
+#-== @function
+def run_job(job):
+	#-== Imports the CSV file of a claimed /job ,
+	# saving the counters and errors after each batch of rows.
+	# The uploaded file is removed when the import has finished.
+
+	importer = BulkImporter(logger=logger)
+
+	def save_progress(importer):
+		ImportJob.objects.filter(pk=job.pk).update(
+			records_read=importer.records_read,
+			records_processed=importer.records_processed,
+			errors=importer.errors,
+			updated=timezone.now(),
+		)
+
+	status = ImportJob.COMPLETE
+	try:
+		with job.upload.open('rb') as upload:
+			reader = csv.DictReader(codecs.iterdecode(upload, 'utf-8'))
+			importer.import_csv(reader, progress=save_progress)
+	except Exception as exc:
+		logger.exception('Import job {} failed'.format(job.pk))
+		importer.errors.append('Import failed: {}'.format(exc))
+		status = ImportJob.FAILED
+
+	job.upload.delete(save=False)
+	job.status = status
+	job.records_read = importer.records_read
+	job.records_processed = importer.records_processed
+	job.errors = importer.errors
+	job.save()
+	return job
@@ -0,0 +1,917 @@
+import asyncio, datetime, http.client, io, itertools, json, os, platform, random, signal, statistics, subprocess, sys, tempfile, threading, time, tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.test import Client
+
+from core.management.commands.serve import available_cpus, default_workers
+from field_mgmt.models import Field
+from field_mgmt.synthetic import SyntheticData
+from server.base_settings import postgres_database
+
+#-== @h1
+# API Benchmark Command
+#-== /field_mgmt.management.commands.benchmark_api.py
+#________________________________________
+
+#-== @class
+class Command(BaseCommand):
+	#-== Measures the API on synthetic data, from a single client or under concurrent load,
+	# and writes the results to a JSON baseline file, which a later run can be compared against.
+	# Run with /-manage.py benchmark_api --fields 100000 --output baseline.json-/
+	# and then /-manage.py benchmark_api --fields 100000 --compare baseline.json-/ .
+	#
+	#-== The /--mode-/ sets how the requests are sent:
+	# @deflist
+	# client: each endpoint is sent its requests one after the other through the Django test client,
+	#			which runs the full request handling without a server, on each of the /--databases-/
+	# handlers: the requests are sent to the Django WSGI and ASGI handlers in this process, without a server.
+	#			Under WSGI each request is handled by one of /--threads-/ worker threads and holds its thread
+	#			until the whole response has been read. Under ASGI every request is handled on one event loop,
+	#			and the synchronous work, such as the queries of the async ORM, is run in threads by Django.
+	#			A client reads each chunk of a response after /--read-delay-/ milliseconds, to stand for a slow network
+	# servers: each server of the /serve command is started with /-manage.py serve --mode <mode>-/ on /--port-/ ,
+	#			with the current settings, and stopped with /SIGTERM once it has been measured.
+	#			The clients send their requests over keep-alive HTTP connections
+	# connections: the requests are sent through the test client from worker threads, as with a threaded server,
+	#			with each way of handling the Postgres connections of /postgres_database
+	#
+	#-== Except in the /client mode, each endpoint is measured at each level of /--concurrency-/ ,
+	# with that many clients each sending its next request once it has read the previous response.
+	# An endpoint is sent /--requests-/ requests in total at each level, or requests for /--duration-/ seconds,
+	# after /--warmup-/ requests which are not measured. The results of each run are:
+	# @deflist
+	# requests_per_second: the requests answered per second, leaving out the time taken to prepare them
+	#			in the /client mode
+	# p50_ms, p90_ms, p95_ms, p99_ms, max_ms: the latency percentiles
+	# queries: the mean number of database queries per request, in the /client mode
+	# peak_memory_kb: the peak memory allocated by Python during a request, in the /client mode,
+	#			measured with /tracemalloc over /--memory-requests-/ separate requests
+	# max_threads: the most threads running in the process during the run, in the /handlers mode
+	# failures: the number of requests which did not succeed, which is always 0:
+	#			a run with a failed request stops the benchmark, see /measure
+	#
+	#-== The results of each database, handler, server or connection handling are compared
+	# with the first one measured, and with the same results in the /--compare-/ file.
+	#
+	#-== Each list request has a unique query string, so none is answered from the response cache
+	# (see /CrudMixin.cached_response ). The records created by the benchmark are removed, and the imports
+	# only add growers which are removed at the end, so the synthetic data can be used by the next run.
+	#
+	#-== /--databases-/ names the entries of the /DATABASES setting to measure in the /client mode,
+	# such as a SQLite and a local Postgres database, each of which is migrated and filled with the same data.
+	# @note
+	# Use separate databases for the benchmark, the synthetic records are kept for the next run.
+	# The concurrent clients run on the same host as the server and take some of its CPU time,
+	# so compare the results with each other rather than reading them as the capacity of the host.
+
+	help = 'Benchmarks the API endpoints on synthetic data, alone or under concurrent load, and writes or compares a baseline file'
+
+	MODES = ['client', 'handlers', 'servers', 'connections']
+	HANDLERS = ['wsgi', 'asgi']
+	SERVERS = ['runserver', 'wsgi', 'asgi']
+	CONNECTIONS = ['pool', 'persistent', 'per_request']
+	ENDPOINTS = ['FarmList.get', 'Index.get', 'Index.get filtered', 'Index.get stream', 'FieldRecord.get',
+		'Index.post', 'FieldRecord.patch', 'FieldRecord.put', 'FieldRecord.delete', 'ImportData.post']
+	# the endpoints which the handlers and servers modes can send, as plain GET requests
+	READ_ENDPOINTS = ['FarmList.get', 'Index.get', 'Index.get filtered', 'Index.get stream', 'FieldRecord.get']
+	DEFAULT_ENDPOINTS = {
+		'client': ENDPOINTS,
+		'handlers': READ_ENDPOINTS,
+		'servers': READ_ENDPOINTS,
+		'connections': ['Index.get', 'ImportData.post'],
+	}
+	# the key of the results of each mode, by database, handler, server or connection handling
+	RESULT_GROUPS = {'client': 'databases', 'handlers': 'handlers', 'servers': 'servers', 'connections': 'connections'}
+	SORTS = ['farm__grower__name', '-area', 'name', 'farm__name']
+	PERCENTILES = [50, 90, 95, 99]
+
+	def add_arguments(self, parser):
+		parser.add_argument('--mode', choices=self.MODES, default='client',
+			help='How the requests are sent: one at a time through the test client, to the WSGI and ASGI handlers, '
+				'to the servers of the serve command, or with each handling of the Postgres connections')
+		parser.add_argument('--fields', type=int, default=10000,
+			help='Number of synthetic fields, from 10000 up to 10000000')
+		parser.add_argument('--skew', type=float, default=1.0,
+			help='Skew of the number of farms per grower and fields per farm, 0 for the same number everywhere')
+		parser.add_argument('--seed', type=int, default=0,
+			help='Seed of the synthetic data and of the requests')
+		parser.add_argument('--databases', nargs='+', default=['default'],
+			help='The DATABASES entries to measure in the client mode')
+		parser.add_argument('--handlers', nargs='+', choices=self.HANDLERS, default=self.HANDLERS,
+			help='The handlers to measure in the handlers mode')
+		parser.add_argument('--servers', nargs='+', choices=self.SERVERS, default=self.SERVERS,
+			help='The server modes to measure in the servers mode')
+		parser.add_argument('--connections', nargs='+', choices=self.CONNECTIONS, default=self.CONNECTIONS,
+			help='The connection handling to measure in the connections mode, see postgres_database in the settings')
+		parser.add_argument('--endpoints', nargs='+', choices=self.ENDPOINTS,
+			help='The endpoints to measure, by default those of the mode')
+		parser.add_argument('--requests', type=int, default=200,
+			help='Number of requests sent to each endpoint, in total at each level of concurrency')
+		parser.add_argument('--duration', type=float,
+			help='Seconds to send requests to each endpoint at each level of concurrency, instead of --requests')
+		parser.add_argument('--warmup', type=int, default=10,
+			help='Number of requests sent to each endpoint before measuring it')
+		parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 10, 50],
+			help='Numbers of clients sending requests at the same time, except in the client mode')
+		parser.add_argument('--import-requests', type=int, default=10,
+			help='Number of requests sent to the import')
+		parser.add_argument('--import-rows', type=int, default=1000,
+			help='Number of CSV rows in each import request')
+		parser.add_argument('--memory-requests', type=int, default=5,
+			help='Number of requests sent to each endpoint to measure the peak memory in the client mode')
+		parser.add_argument('--threads', type=int, default=8,
+			help='Number of worker threads of the WSGI handler in the handlers mode')
+		parser.add_argument('--read-delay', type=float, default=0,
+			help='Milliseconds a client takes to read each chunk of a response in the handlers mode')
+		parser.add_argument('--workers', type=int,
+			help='Worker processes of the gunicorn servers, instead of the SERVER_WORKERS setting')
+		parser.add_argument('--port', type=int, default=8765,
+			help='Local port the servers listen on')
+		parser.add_argument('--output',
+			help='Path of the JSON file to write the results to')
+		parser.add_argument('--compare',
+			help='Path of a JSON file written by an earlier run to compare the results to')
+		parser.add_argument('--tolerance', type=float, default=0.2,
+			help='Relative increase of the median latency or the query count reported as a regression')
+
+	def handle(self, *args, **options):
+		mode = options['mode']
+		self.endpoints = options['endpoints'] or self.DEFAULT_ENDPOINTS[mode]
+		if mode in ['handlers', 'servers']:
+			unsupported = [name for name in self.endpoints if name not in self.READ_ENDPOINTS]
+			if unsupported:
+				raise CommandError('The {} mode only sends GET requests, it cannot measure: {}'.format(
+					mode, ', '.join(unsupported)))
+		if mode != 'client' and options['databases'] != ['default']:
+			raise CommandError('The databases are only measured in the client mode')
+		unknown = [alias for alias in options['databases'] if alias not in settings.DATABASES]
+		if unknown:
+			raise CommandError('Unknown databases: {}'.format(', '.join(unknown)))
+		if mode == 'connections' and connection.vendor != 'postgresql':
+			raise CommandError('The connections mode needs a Postgres database')
+
+		self.options = options
+		self.data = SyntheticData(options['fields'], skew=options['skew'], seed=options['seed'])
+		results = {
+			'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+			'python': platform.python_version(),
+			'django': django.get_version(),
+			'cpus': available_cpus(),
+			'mode': mode,
+			'fields': options['fields'],
+			'skew': options['skew'],
+			'seed': options['seed'],
+			'requests': options['requests'],
+			'duration': options['duration'],
+			'import_rows': options['import_rows'],
+		}
+		if mode != 'client':
+			results['concurrency'] = options['concurrency']
+		if mode == 'handlers':
+			results.update(threads=options['threads'], read_delay_ms=options['read_delay'])
+		# the list requests of this run are told apart from those of earlier runs,
+		# whose responses may still be in a shared cache
+		self.run_id = '{:x}'.format(time.time_ns())
+		self.host = self.allowed_host()
+		self.sent = itertools.count(1)
+		variants = results[self.RESULT_GROUPS[mode]] = {}
+		getattr(self, 'run_' + mode)(variants)
+		self.compare_variants(variants)
+
+		if options['output']:
+			with open(options['output'], 'w', encoding='utf-8') as output:
+				json.dump(results, output, indent=2)
+			self.stdout.write('Results written to {}'.format(options['output']))
+		if options['compare']:
+			with open(options['compare'], encoding='utf-8') as baseline:
+				self.compare(json.load(baseline), results, options['tolerance'])
+
+	#-== @method
+	def allowed_host(self):
+		#-== @returns
+		# A host name allowed by the /ALLOWED_HOSTS setting, sent as the /Host of every request.
+		# The test client would send /testserver , which is only allowed in the tests.
+
+		for host in settings.ALLOWED_HOSTS:
+			if host == '*':
+				break
+			if host.startswith('.'):
+				return host[1:]
+			return host
+		# with DEBUG on, an empty ALLOWED_HOSTS allows localhost
+		return 'localhost'
+
+	#-== @method
+	def run_client(self, variants):
+		#-== Measures each endpoint through the test client on each of the /--databases-/ .
+
+		default = dict(settings.DATABASES['default'])
+		try:
+			for alias in self.options['databases']:
+				self.use_database(settings.DATABASES[alias])
+				self.prepare(alias)
+				try:
+					variants[alias] = {'vendor': connection.vendor,
+						'endpoints': self.run_endpoints(alias, self.run_sequential)}
+				finally:
+					self.remove_created()
+		finally:
+			self.use_database(default)
+
+	#-== @method
+	def run_handlers(self, variants):
+		#-== Measures each endpoint under the WSGI and the ASGI handler.
+
+		self.prepare()
+		for handler in self.options['handlers']:
+			self.variant = handler
+			variants[handler] = {'vendor': connection.vendor,
+				'endpoints': self.run_endpoints(handler, self.run_async)}
+
+	#-== @method
+	def run_servers(self, variants):
+		#-== Measures each endpoint served by each server mode of the /serve command.
+
+		self.prepare()
+		# the servers open connections of their own, which could lock a SQLite database
+		connection.close()
+		for mode in self.options['servers']:
+			workers = self.options['workers'] or getattr(settings, 'SERVER_WORKERS', 0) or default_workers(mode)
+			with self.server(mode, workers):
+				variants[mode] = {'vendor': connection.vendor, 'workers': 1 if mode == 'runserver' else workers,
+					'endpoints': self.run_endpoints(mode, self.run_threads)}
+
+	#-== @method
+	def run_connections(self, variants):
+		#-== Measures each endpoint with each way of handling the connections
+		# to the /default database, see /postgres_database .
+
+		default = dict(settings.DATABASES['default'])
+		database = {key: value for key, value in connection.settings_dict.items()
+			if key in ('NAME', 'USER', 'PASSWORD', 'HOST', 'PORT', 'CONN_HEALTH_CHECKS')}
+		options = {key: value for key, value in connection.settings_dict['OPTIONS'].items() if key != 'pool'}
+		self.prepare()
+		try:
+			for handling in self.options['connections']:
+				self.use_database(postgres_database(handling, OPTIONS=dict(options), **database))
+				variants[handling] = {'vendor': connection.vendor,
+					'endpoints': self.run_endpoints(handling, self.run_threads)}
+		finally:
+			self.use_database(default)
+			self.remove_created()
+
+	#-== @method
+	def use_database(self, database):
+		#-== Replaces the /default database with the /database settings.
+		# Connections and pools of the previous database are closed first.
+
+		default = connections['default']
+		if hasattr(default, 'close_pool'):
+			default.close_pool()
+		connections.close_all()
+		connections.settings['default'] = connections.configure_settings({'default': dict(database)})['default']
+		del connections['default']
+
+	#-== @method
+	def prepare(self, alias='default'):
+		#-== Migrates the current database, generates the synthetic data if it is not there yet,
+		# and logs in the benchmark user, whose session cookie is sent with the requests without the test client.
+
+		call_command('migrate', verbosity=0, interactive=False)
+		if not self.data.exists():
+			self.stdout.write('{}: creating {} growers, {} farms and {} fields'.format(alias,
+				len(self.data.grower_farms), len(self.data.farm_fields), self.data.field_count))
+			self.data.generate(lambda written: self.stdout.write('  {} fields'.format(written)))
+		self.user, created = User.objects.get_or_create(username='benchmark')
+		self.client = Client(HTTP_HOST=self.host)
+		self.client.force_login(self.user)
+		self.cookie = '{}={}'.format(settings.SESSION_COOKIE_NAME,
+			self.client.cookies[settings.SESSION_COOKIE_NAME].value)
+		self.rng = random.Random(self.options['seed'])
+		self.field_pks = list(self.data.records().values_list('pk', flat=True)[:100000])
+		self.farm_ids = list(Field.objects.filter(pk__in=self.field_pks[:1000]).values_list('farm_id', flat=True))
+		self.growers = [self.data.grower_name(number) for number in range(len(self.data.grower_farms))]
+
+	#-== @method
+	def run_endpoints(self, variant, run_level):
+		#-== Measures each endpoint with /run_level , once in the /client mode,
+		# or at each level of /--concurrency-/ otherwise.
+		# @params
+		# variant: the name of the database, handler, server or connection handling being measured
+		# run_level: the method which sends the requests, see /run_sequential
+		# @returns
+		# The dictionary of results of each endpoint, and in the concurrent modes of each level of concurrency.
+
+		client_mode = self.options['mode'] == 'client'
+		levels = [1] if client_mode else self.options['concurrency']
+		endpoints = {}
+		for name in self.endpoints:
+			# the requests of each endpoint are numbered from 0, so the updates and the deletes
+			# find the fields created by the same numbers of Index.post
+			self.numbers = itertools.count()
+			count = self.options['import_requests'] if name == 'ImportData.post' else self.options['requests']
+			if self.options['warmup']:
+				run_level(name, max(levels), min(self.options['warmup'], count))
+			runs = {}
+			for concurrency in levels:
+				result = runs[str(concurrency)] = run_level(name, concurrency, count, self.options['duration'])
+				if client_mode:
+					result['peak_memory_kb'] = self.peak_memory(name, min(self.options['memory_requests'], count))
+				self.stdout.write('{} {}: {}'.format(variant, self.label(name, None if client_mode else concurrency),
+					self.summary(result)))
+			endpoints[name] = runs['1'] if client_mode else runs
+		return endpoints
+
+	#-== @method
+	def load_limit(self, count, duration=None):
+		#-== @returns
+		# A function which tells whether another request is to be sent: until /count requests
+		# have been sent, or if /duration is set, until /duration seconds after it is first called.
+		# It can be called from several threads.
+
+		if duration:
+			deadline = []
+			def more():
+				if not deadline:
+					deadline.append(time.perf_counter() + duration)
+				return time.perf_counter() < deadline[0]
+			return more
+		remaining = itertools.count(count, -1)
+		return lambda: next(remaining) > 0
+
+	#-== The /run_ methods below send /count requests (or requests for /duration seconds) to the
+	# endpoint /name from /concurrency clients, and return the dictionary of results of /measure .
+
+	#-== @method
+	def run_sequential(self, name, concurrency, count, duration=None):
+		#-== Sends the requests one after the other through the test client,
+		# counting the queries of each request.
+
+		more = self.load_limit(count, duration)
+		timings = []
+		queries = []
+		failed = []
+
+		def count_query(execute, sql, params, many, context):
+			queries[-1] += 1
+			return execute(sql, params, many, context)
+
+		while more():
+			request = self.prepare_request(self.client, name, next(self.numbers))
+			queries.append(0)
+			started = time.perf_counter()
+			with connection.execute_wrapper(count_query):
+				response = request()
+			timings.append(time.perf_counter() - started)
+			if response.status_code != 200:
+				failed.append(response.status_code)
+		return self.measure(name, timings, sum(timings), failed, queries=round(statistics.mean(queries or [0]), 2))
+
+	#-== @method
+	def peak_memory(self, name, count):
+		#-== Sends /count requests to the endpoint /name through the test client.
+		# The peak memory is measured over separate requests, since /tracemalloc
+		# slows down every allocation.
+		# @returns
+		# The largest peak memory of a request in KiB.
+
+		peak = 0
+		for number in range(count):
+			request = self.prepare_request(self.client, name, next(self.numbers))
+			tracemalloc.start()
+			try:
+				request()
+				peak = max(peak, tracemalloc.get_traced_memory()[1])
+			finally:
+				tracemalloc.stop()
+		return round(peak / 1024, 1)
+
+	#-== @method
+	def run_async(self, name, concurrency, count, duration=None):
+		#-== Sends the requests to the handler being measured, from clients running on one event loop.
+		# Requests to the WSGI handler are run by a pool of /--threads-/ threads.
+
+		return asyncio.run(self.arun_async(name, concurrency, count, duration))
+
+	#-== @method
+	async def arun_async(self, name, concurrency, count, duration=None):
+		#-== The coroutine of /run_async .
+
+		if self.variant == 'wsgi':
+			application = get_wsgi_application()
+			pool = ThreadPoolExecutor(max_workers=self.options['threads'])
+			send = lambda path: asyncio.get_running_loop().run_in_executor(pool, self.send_wsgi, application, path)
+		else:
+			application = get_asgi_application()
+			send = lambda path: self.send_asgi(application, path)
+		more = self.load_limit(count, duration)
+		timings = []
+		failed = []
+		max_threads = threading.active_count()
+
+		async def client():
+			nonlocal max_threads
+			while more():
+				path = self.request_path(name)
+				started = time.perf_counter()
+				status = await send(path)
+				timings.append(time.perf_counter() - started)
+				if status != 200:
+					failed.append(status)
+				max_threads = max(max_threads, threading.active_count())
+
+		started = time.perf_counter()
+		try:
+			await asyncio.gather(*[client() for number in range(concurrency)])
+		finally:
+			if self.variant == 'wsgi':
+				pool.shutdown()
+		return self.measure(name, timings, time.perf_counter() - started, failed, max_threads=max_threads)
+
+	#-== @method
+	def run_threads(self, name, concurrency, count, duration=None):
+		#-== Sends the requests from a thread for each client, over an HTTP connection to the server
+		# in the /servers mode, and through a test client of its own otherwise.
+		# The clients connect and log in before the run starts.
+
+		lock = threading.Lock()
+		timings = []
+		failed = []
+		more = started = None
+
+		def start():
+			nonlocal more, started
+			more = self.load_limit(count, duration)
+			started = time.perf_counter()
+
+		ready = threading.Barrier(concurrency + 1, action=start)
+
+		def client():
+			try:
+				prepare, close = self.http_session() if self.options['mode'] == 'servers' else self.client_session()
+			except BaseException:
+				ready.abort()
+				raise
+			try:
+				ready.wait()
+				while True:
+					with lock:
+						if not more():
+							break
+						request = prepare(name, next(self.numbers))
+					request_started = time.perf_counter()
+					status = request()
+					elapsed = time.perf_counter() - request_started
+					with lock:
+						timings.append(elapsed)
+						if status != 200:
+							failed.append(status)
+			except threading.BrokenBarrierError:
+				pass
+			finally:
+				close()
+
+		threads = [threading.Thread(target=client) for number in range(concurrency)]
+		for thread in threads:
+			thread.start()
+		try:
+			ready.wait()
+		except threading.BrokenBarrierError:
+			raise CommandError('A client could not connect, see the error above')
+		finally:
+			for thread in threads:
+				thread.join()
+		return self.measure(name, timings, time.perf_counter() - started, failed)
+
+	#-== @method
+	def http_session(self):
+		#-== Opens a keep-alive HTTP connection to the server.
+		# @returns
+		# A pair of a function which prepares the request number /number to the endpoint /name ,
+		# returning a callable which sends it and returns its HTTP status,
+		# and a function which closes the connection.
+
+		session = http.client.HTTPConnection('127.0.0.1', self.options['port'], timeout=60)
+
+		def prepare(name, number):
+			path = self.request_path(name)
+
+			def send():
+				# like a browser, a client sends a request again once if the server closed
+				# the kept-alive connection, which it does when a worker is replaced
+				for attempt in range(2):
+					try:
+						session.request('GET', path, headers={'Host': self.host, 'Cookie': self.cookie})
+						response = session.getresponse()
+						response.read()
+						return response.status
+					except (OSError, http.client.HTTPException):
+						session.close()
+				return None
+
+			return send
+
+		return prepare, session.close
+
+	#-== @method
+	def client_session(self):
+		#-== Logs in a test client of its own for a client thread, see /http_session .
+
+		client = Client(HTTP_HOST=self.host)
+		client.force_login(self.user)
+
+		def prepare(name, number):
+			request = self.prepare_request(client, name, number)
+			return lambda: request().status_code
+
+		return prepare, connections.close_all
+
+	#-== @method
+	def server(self, mode, workers):
+		#-== Starts /-manage.py serve-/ in the server /mode and waits until it answers.
+		# @returns
+		# A context manager which stops the server when it exits.
+
+		command = self
+
+		class Server:
+			def __enter__(self):
+				self.log = tempfile.TemporaryFile()
+				argv = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'serve', '--mode', mode,
+					'--bind', '127.0.0.1:{}'.format(command.options['port']), '--workers', str(workers), '--noreload']
+				env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+				self.process = subprocess.Popen(argv, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+				try:
+					command.wait_for_server(self.process, self.log)
+				except BaseException:
+					self.__exit__()
+					raise
+				return self
+
+			def __exit__(self, *exc_info):
+				self.process.send_signal(signal.SIGTERM)
+				try:
+					self.process.wait(getattr(settings, 'SERVER_GRACEFUL_TIMEOUT', 30) + 5)
+				except subprocess.TimeoutExpired:
+					self.process.kill()
+					self.process.wait()
+				self.log.close()
+
+		return Server()
+
+	#-== @method
+	def wait_for_server(self, process, log, timeout=60):
+		#-== Waits until the server started as /process answers an HTTP request.
+		# Raises a /CommandError with the end of its /log if it exits or does not answer in time.
+
+		started = time.perf_counter()
+		while time.perf_counter() - started < timeout:
+			if process.poll() is not None:
+				break
+			client = http.client.HTTPConnection('127.0.0.1', self.options['port'], timeout=5)
+			try:
+				client.request('GET', '/core/metrics/')
+				client.getresponse().read()
+				return
+			except (OSError, http.client.HTTPException):
+				time.sleep(0.2)
+			finally:
+				client.close()
+		log.seek(0)
+		output = log.read().decode('utf-8', 'replace')[-2000:]
+		raise CommandError('The server did not start:\n{}'.format(output))
+
+	#-== @method
+	def send_wsgi(self, application, path):
+		#-== Handles the request for /path with the WSGI /application in the current thread,
+		# and reads the response a chunk at a time.
+		# @returns
+		# The HTTP status of the response.
+
+		path, query = path.split('?', 1)
+		environ = {
+			'REQUEST_METHOD': 'GET',
+			'SCRIPT_NAME': '',
+			'PATH_INFO': path,
+			'QUERY_STRING': query,
+			'SERVER_NAME': self.host,
+			'SERVER_PORT': '80',
+			'SERVER_PROTOCOL': 'HTTP/1.1',
+			'REMOTE_ADDR': '127.0.0.1',
+			'HTTP_HOST': self.host,
+			'HTTP_COOKIE': self.cookie,
+			'wsgi.version': (1, 0),
+			'wsgi.url_scheme': 'http',
+			'wsgi.input': io.BytesIO(),
+			'wsgi.errors': io.StringIO(),
+			'wsgi.multithread': True,
+			'wsgi.multiprocess': False,
+			'wsgi.run_once': False,
+		}
+		status = []
+		response = application(environ, lambda line, headers, exc_info=None: status.append(line))
+		try:
+			for chunk in response:
+				if self.options['read_delay']:
+					time.sleep(self.options['read_delay'] / 1000)
+		finally:
+			response.close()
+		return int(status[0].split(' ', 1)[0])
+
+	#-== @method
+	async def send_asgi(self, application, path):
+		#-== Handles the request for /path with the ASGI /application ,
+		# and reads the response a chunk at a time.
+		# @returns
+		# The HTTP status of the response.
+
+		path, query = path.split('?', 1)
+		scope = {
+			'type': 'http',
+			'asgi': {'version': '3.0'},
+			'http_version': '1.1',
+			'method': 'GET',
+			'scheme': 'http',
+			'path': path,
+			'raw_path': path.encode('ascii'),
+			'query_string': query.encode('ascii'),
+			'root_path': '',
+			'headers': [(b'host', self.host.encode('ascii')), (b'cookie', self.cookie.encode('ascii'))],
+			'client': ('127.0.0.1', 50000),
+			'server': (self.host, 80),
+		}
+		finished = asyncio.Event()
+		status = []
+		received = False
+
+		async def receive():
+			nonlocal received
+			if not received:
+				received = True
+				return {'type': 'http.request', 'body': b'', 'more_body': False}
+			# the client stays connected until it has read the response
+			await finished.wait()
+			return {'type': 'http.disconnect'}
+
+		async def send(message):
+			if message['type'] == 'http.response.start':
+				status.append(message['status'])
+			elif message['type'] == 'http.response.body':
+				if self.options['read_delay']:
+					await asyncio.sleep(self.options['read_delay'] / 1000)
+				if not message.get('more_body', False):
+					finished.set()
+
+		try:
+			await application(scope, receive, send)
+		finally:
+			finished.set()
+		return status[0]
+
+	#-== @method
+	def measure(self, name, timings, elapsed, failed, **extra):
+		#-== Summarizes the request /timings of a run of the endpoint /name , which took /elapsed seconds.
+		# Raises a /CommandError if any request failed, so error responses are never
+		# measured and written to a baseline as if they were the endpoint.
+		# @params
+		# failed: the HTTP status of each request which did not succeed,
+		#			or /None if the server closed the connection
+		# extra: other results of the run, such as the /queries
+		# @returns
+		# The dictionary of results of the run.
+
+		if failed:
+			raise CommandError('{} of {} requests to {} failed, with HTTP status {}'.format(
+				len(failed), len(timings), name, ', '.join(sorted({str(status) for status in failed}))))
+		result = {
+			'requests': len(timings),
+			'requests_per_second': round(len(timings) / elapsed, 2) if elapsed else 0,
+		}
+		if len(timings) > 1:
+			cuts = statistics.quantiles(timings, n=100, method='inclusive')
+			for percentile in self.PERCENTILES:
+				result['p{}_ms'.format(percentile)] = round(cuts[percentile - 1] * 1000, 3)
+		else:
+			for percentile in self.PERCENTILES:
+				result['p{}_ms'.format(percentile)] = round(sum(timings) * 1000, 3)
+		result['max_ms'] = round(max(timings, default=0) * 1000, 3)
+		result.update(extra)
+		result['failures'] = 0
+		return result
+
+	#-== @method
+	def summary(self, result):
+		#-== @returns
+		# A line of text with the main results of a run.
+
+		parts = ['{requests_per_second} requests/s', 'median {p50_ms} ms', '95th percentile {p95_ms} ms']
+		if 'queries' in result:
+			parts.append('{queries} queries')
+		if 'peak_memory_kb' in result:
+			parts.append('{peak_memory_kb} KiB peak')
+		if 'max_threads' in result:
+			parts.append('{max_threads} threads')
+		return ', '.join(parts).format(**result)
+
+	#-== @method
+	def label(self, name, concurrency=None):
+		#-== @returns
+		# The name of the run of the endpoint /name at the level of /concurrency .
+
+		return name if concurrency is None else '{}, {} clients'.format(name, concurrency)
+
+	#-== @method
+	def each_result(self, endpoints):
+		#-== Yields the label and the results of each run in the /endpoints results of /run_endpoints .
+
+		for name, runs in endpoints.items():
+			if 'requests' in runs:
+				yield self.label(name), runs
+				continue
+			for concurrency, result in runs.items():
+				yield self.label(name, concurrency), result
+
+	#-== @method
+	def compare_variants(self, variants):
+		#-== Writes the throughput and median latency of each database, handler, server or connection handling
+		# relative to the first one measured.
+
+		if len(variants) < 2:
+			return
+		(base_variant, base_runs), *others = variants.items()
+		base_results = dict(self.each_result(base_runs['endpoints']))
+		for variant, runs in others:
+			for label, result in self.each_result(runs['endpoints']):
+				base = base_results.get(label)
+				if base is None:
+					continue
+				self.stdout.write('{} {}: {:+.1%} requests/s, median {:+.1%} against {}'.format(variant, label,
+					relative(result['requests_per_second'], base['requests_per_second']),
+					relative(result['p50_ms'], base['p50_ms']), base_variant))
+
+	#-== @method
+	def compare(self, baseline, results, tolerance):
+		#-== Writes the change of the median latency, the throughput and the query count
+		# of each run against the same run in the /baseline .
+		# Raises a /CommandError listing the regressions, so the exit status can fail a build,
+		# or if the baseline or the results recorded failed requests.
+
+		group = self.RESULT_GROUPS[results['mode']]
+		for name, measured in [(self.options['compare'], baseline), ('this run', results)]:
+			failed = ['{} {}'.format(variant, label) for variant, runs in measured.get(group, {}).items()
+				for label, result in self.each_result(runs['endpoints']) if result.get('failures')]
+			if failed:
+				raise CommandError('The results of {} recorded failed requests, they cannot be compared: {}'.format(
+					name, ', '.join(failed)))
+
+		mode = results['mode']
+		if baseline.get('mode', 'client') != mode:
+			self.stdout.write('The baseline was measured in the {} mode'.format(baseline.get('mode', 'client')))
+		if (baseline.get('fields'), baseline.get('skew'), baseline.get('seed')) != (
+				results['fields'], results['skew'], results['seed']):
+			self.stdout.write('The baseline was measured on different synthetic data')
+		regressions = []
+		for variant, runs in results[group].items():
+			base_runs = baseline.get(group, {}).get(variant)
+			if base_runs is None:
+				continue
+			base_results = dict(self.each_result(base_runs['endpoints']))
+			for label, result in self.each_result(runs['endpoints']):
+				base = base_results.get(label)
+				if base is None:
+					continue
+				latency = relative(result['p50_ms'], base['p50_ms'])
+				line = '{} {}: median {:+.1%}, throughput {:+.1%}'.format(variant, label, latency,
+					relative(result['requests_per_second'], base['requests_per_second']))
+				if 'queries' in result and 'queries' in base:
+					line += ', queries {} -> {}'.format(base['queries'], result['queries'])
+					if result['queries'] > base['queries'] * (1 + tolerance):
+						regressions.append('{} {}: {} -> {} queries'.format(variant, label, base['queries'], result['queries']))
+				self.stdout.write(line)
+				if latency > tolerance:
+					regressions.append('{} {}: median {} ms -> {} ms'.format(variant, label, base['p50_ms'], result['p50_ms']))
+		if regressions:
+			raise CommandError('Regressions against {}:\n{}'.format(self.options['compare'], '\n'.join(regressions)))
+
+	#-== @method
+	def request_path(self, name):
+		#-== @returns
+		# The path and query string of the next request to the read endpoint /name .
+		# Each path has a unique /request parameter, which the views ignore.
+
+		query = {'request': '{}-{}'.format(self.run_id, next(self.sent))}
+		if name == 'FarmList.get':
+			return '/manage/farms/?' + urlencode(query)
+		if name == 'Index.get':
+			query.update(limit=100, sort=self.rng.choice(self.SORTS))
+			return '/manage/fields/?' + urlencode(query)
+		if name == 'Index.get filtered':
+			query.update(limit=100, farm__grower__name=self.rng.choice(self.growers))
+			return '/manage/fields/?' + urlencode(query)
+		if name == 'Index.get stream':
+			query.update(stream=1, farm__grower__name=self.rng.choice(self.growers))
+			return '/manage/fields/?' + urlencode(query)
+		return '/manage/fields/{}/?'.format(self.rng.choice(self.field_pks)) + urlencode(query)
+
+	#-== @method
+	def prepare_request(self, client, name, number):
+		#-== Prepares the request /number of the endpoint /name , to be sent with the test /client .
+		# @returns
+		# A callable which sends the request, reads the whole response and returns it.
+		# Only the callable is measured.
+
+		if name in self.READ_ENDPOINTS:
+			path = self.request_path(name)
+			return lambda: read_response(client.get(path))
+		return getattr(self, 'send_' + name.replace('.', '_').lower())(client, number)
+
+	#-== The /send_ methods prepare the request /number of an endpoint which writes,
+	# see /prepare_request .
+
+	#-== @method
+	def send_index_post(self, client, number):
+		data = {'pk': None, 'version': 0, 'name': self.created_name(number),
+			'area': 10, 'farm_id': self.rng.choice(self.farm_ids)}
+		return lambda: client.post('/manage/fields/', json.dumps(data), content_type='application/json')
+
+	#-== @method
+	def send_fieldrecord_patch(self, client, number):
+		field = self.created_field(number)
+		data = {'version': field.version, 'area': field.area + 1}
+		return lambda: client.patch('/manage/fields/{}/'.format(field.pk),
+			json.dumps(data), content_type='application/json')
+
+	#-== @method
+	def send_fieldrecord_put(self, client, number):
+		field = self.created_field(number)
+		data = {'version': field.version, 'name': field.name, 'area': field.area + 1, 'farm_id': field.farm_id}
+		return lambda: client.put('/manage/fields/{}/'.format(field.pk),
+			json.dumps(data), content_type='application/json')
+
+	#-== @method
+	def send_fieldrecord_delete(self, client, number):
+		field = self.created_field(number)
+		return lambda: client.delete('/manage/fields/{}/'.format(field.pk))
+
+	#-== @method
+	def send_importdata_post(self, client, number):
+		# the concurrent imports add growers of their own, so they do not create the same records
+		new_prefix = None if self.options['mode'] == 'client' else '{} import {}-'.format(self.data.prefix, number)
+		content = self.data.import_csv(self.options['import_rows'], seed=self.options['seed'] + number,
+			new_prefix=new_prefix)
+		return lambda: client.post('/manage/import/', content, content_type='text/csv')
+
+	#-== @method
+	def created_name(self, number):
+		#-== @returns
+		# The name of the field created by the /Index.post request /number .
+
+		return '{} created {:07d}'.format(self.data.prefix, number)
+
+	#-== @method
+	def created_field(self, number):
+		#-== @returns
+		# The /Field created by the /Index.post request /number , or a new one
+		# if that request was not sent, so the updates and deletes always have a record.
+
+		name = self.created_name(number)
+		field = Field.objects.filter(name=name).first()
+		if field is None:
+			field = Field.objects.create(name=name, area=10, farm_id=self.rng.choice(self.farm_ids))
+		return field
+
+	#-== @method
+	def remove_created(self):
+		#-== Removes the fields created by the benchmark and the growers added by the imports.
+
+		Field.objects.filter(name__startswith=self.created_name(0)[:-7]).delete()
+		self.data.remove(self.data.prefix + ' import ')
+
+
+#-== @function
+def relative(value, base):
+	#-== @returns
+	# The relative change of /value from /base , or 0 if /base is 0.
+
+	return value / base - 1 if base else 0
+
+
+#-== @function
+def read_response(response):
+	#-== Reads the whole content of a streamed /response of the test client.
+	# @returns
+	# The /response .
+
+	if response.streaming:
+		for chunk in response.streaming_content:
+			pass
+	return response
@@ -0,0 +1,107 @@
+import random, statistics, time
+
+from django.db import connection
+from django.core.management.base import BaseCommand
+
+from field_mgmt.models import Grower, Farm, Field
+from field_mgmt.natural_keys import drop_unique_keys, enforce_unique_keys, unique_keys_enforced
+from field_mgmt.synthetic import SyntheticData
+
+#-== @h1
+# Lookup Benchmark Command
+#-== /field_mgmt.management.commands.benchmark_lookups.py
+#________________________________________
+
+#-== @class
+class Command(BaseCommand):
+	#-== Measures the cost of the lookups the import and the field list make,
+	# on a database filled with synthetic growers, farms and fields.
+	# Run with /-manage.py benchmark_lookups --fields 1000000-/ .
+	#
+	#-== The synthetic records are generated by /SyntheticData , only if the database
+	# does not hold them yet, so the command can be run again without regenerating them.
+	# With /--compare-/ each lookup is also measured with the natural key indexes removed,
+	# including the unique ones, and the indexes are created again afterwards.
+	# @note
+	# Use a separate database for the benchmark, the synthetic records are not removed.
+
+	help = 'Benchmarks the name lookups and the sorted field list on synthetic data'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--fields', type=int, default=1000000,
+			help='Number of synthetic fields the database should contain')
+		parser.add_argument('--skew', type=float, default=0,
+			help='Skew of the number of farms per grower and fields per farm, 0 for the same number everywhere')
+		parser.add_argument('--lookups', type=int, default=100,
+			help='Number of growers and farms looked up at once, like a batch of the import')
+		parser.add_argument('--repeat', type=int, default=5,
+			help='Number of times each lookup is measured')
+		parser.add_argument('--compare', action='store_true',
+			help='Also measure the lookups without the natural key indexes')
+
+	def handle(self, *args, **options):
+		self.data = SyntheticData(options['fields'], skew=options['skew'], prefix='Benchmark')
+		if not self.data.exists():
+			self.stdout.write('Creating {} growers, {} farms and {} fields'.format(
+				len(self.data.grower_farms), len(self.data.farm_fields), self.data.field_count))
+			self.data.generate()
+		self.stdout.write('{} growers, {} farms, {} fields'.format(
+			Grower.objects.count(), Farm.objects.count(), Field.objects.count()))
+		self.run_lookups(options['lookups'], options['repeat'], 'with indexes')
+		if options['compare']:
+			indexes = self.natural_key_indexes()
+			enforced = unique_keys_enforced()
+			if enforced:
+				drop_unique_keys()
+			with connection.schema_editor() as schema_editor:
+				for modelclass, index in indexes:
+					schema_editor.remove_index(modelclass, index)
+			try:
+				self.run_lookups(options['lookups'], options['repeat'], 'without indexes')
+			finally:
+				with connection.schema_editor() as schema_editor:
+					for modelclass, index in indexes:
+						schema_editor.add_index(modelclass, index)
+				if enforced:
+					enforce_unique_keys()
+
+	#-== @method
+	def natural_key_indexes(self):
+		#-== @returns
+		# A list of the models paired with each of their /Meta.indexes .
+
+		return [(modelclass, index) for modelclass in (Grower, Farm, Field)
+			for index in modelclass._meta.indexes]
+
+	#-== @method
+	def run_lookups(self, lookups, repeat, label):
+		#-== Measures each lookup /repeat times and writes the median time and the query plan.
+
+		growers = list(Grower.objects.values_list('pk', 'name'))
+		farms = list(Farm.objects.values_list('pk', 'grower_id', 'name'))
+		sample_growers = random.sample(growers, min(lookups, len(growers)))
+		sample_farms = random.sample(farms, min(lookups, len(farms)))
+		field_names = [self.data.field_name(number) for number in range(0, 100, 7)]
+
+		queries = [
+			('grower by name', Grower.objects.filter(name__in=[name for pk, name in sample_growers])),
+			('farm by grower and name', Farm.objects.filter(
+				grower_id__in=[grower_id for pk, grower_id, name in sample_farms],
+				name__in={name for pk, grower_id, name in sample_farms})),
+			('field by farm and name', Field.objects.filter(
+				farm_id__in=[pk for pk, grower_id, name in sample_farms], name__in=field_names)),
+			('field list sorted by grower name', Field.objects.order_by('farm__grower__name', 'pk')[:100]),
+		]
+		self.stdout.write('Lookups {}:'.format(label))
+		for name, qs in queries:
+			timings = []
+			for attempt in range(repeat):
+				started = time.perf_counter()
+				rows = len(list(qs.values_list('pk', flat=True)))
+				timings.append(time.perf_counter() - started)
+			self.stdout.write('  {}: {:.2f} ms for {} rows'.format(name, statistics.median(timings) * 1000, rows))
+			for line in qs.values_list('pk', flat=True).explain().splitlines():
+				# the plans repeat the looked up values, which are cut to keep the output readable
+				if len(line) > 120:
+					line = line[:117] + '...'
+				self.stdout.write('      ' + line)
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from field_mgmt.natural_keys import (NATURAL_KEY_MODELS, drop_unique_keys,
+	duplicate_keys, enforce_unique_keys, unique_keys_enforced)
+
+#-== @h1
+# Natural Keys Command
+#-== /field_mgmt.management.commands.natural_keys.py
+#________________________________________
+
+#-== @class
+class Command(BaseCommand):
+	#-== Reports whether the natural keys of the growers, farms and fields are unique,
+	# and creates or removes the unique indexes which enforce them.
+	# See /field_mgmt.natural_keys.py for details.
+
+	help = 'Reports, enforces or drops the unique indexes on the grower, farm and field names'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--enforce', action='store_true',
+			help='Create the unique indexes, if there are no duplicate names')
+		parser.add_argument('--drop', action='store_true',
+			help='Remove the unique indexes')
+
+	def handle(self, *args, **options):
+		if options['enforce'] and options['drop']:
+			raise CommandError('Use either --enforce or --drop')
+		if options['drop']:
+			drop_unique_keys()
+		elif options['enforce']:
+			duplicates = enforce_unique_keys()
+			if duplicates:
+				for modelclass, keys in duplicates.items():
+					self.report_duplicates(modelclass, keys)
+				raise CommandError('Remove the duplicate names before enforcing unique keys')
+		else:
+			for modelclass in NATURAL_KEY_MODELS:
+				self.report_duplicates(modelclass, duplicate_keys(modelclass))
+		state = 'enforced' if unique_keys_enforced() else 'not enforced'
+		self.stdout.write('Unique natural keys are {}'.format(state))
+
+	#-== @method
+	def report_duplicates(self, modelclass, keys):
+		#-== Writes the number of duplicate natural keys of /modelclass and the first few of them.
+
+		count = keys.count()
+		self.stdout.write('{}: {} duplicate keys'.format(modelclass.__name__, count))
+		for key in keys[:10]:
+			self.stdout.write('    {}'.format(key))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from field_mgmt.jobs import claim_next_job, run_job
+
+#-== @h1
+# Import Worker Command
+#-== /field_mgmt.management.commands.process_imports.py
+#________________________________________
+
+#-== @class
+class Command(BaseCommand):
+	#-== Processes pending /ImportJob objects from the database queue.
+	# Run with /-manage.py process_imports-/ when the /IMPORT_JOB_WORKER setting is /queue .
+	# Several workers can run at the same time, each job is only claimed once.
+
+	help = 'Processes pending background import jobs'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--once', action='store_true',
+			help='Process the pending jobs and exit instead of polling')
+		parser.add_argument('--poll-interval', type=float, default=5.0,
+			help='Seconds to wait between checks for new jobs')
+
+	def handle(self, *args, **options):
+		while True:
+			job = claim_next_job()
+			if job is not None:
+				self.stdout.write('Processing import job {}'.format(job.pk))
+				job = run_job(job)
+				self.stdout.write('Import job {} {}: {} of {} records processed'.format(
+					job.pk, job.status, job.records_processed, job.records_read))
+				continue
+			if options['once']:
+				break
+			time.sleep(options['poll_interval'])
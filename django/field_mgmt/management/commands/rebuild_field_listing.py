@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from field_mgmt.models import FarmRollup, FieldListing
+
+#-== @h1
+# Rebuild Field Listing Command
+#-== /field_mgmt.management.commands.rebuild_field_listing.py
+#________________________________________
+
+#-== @class
+class Command(BaseCommand):
+	#-== Rebuilds the flattened /FieldListing table from the /Field , /Farm and /Grower tables,
+	# and recounts the /FarmRollup of every farm.
+	# Run with /-manage.py rebuild_field_listing-/ after enabling the /FIELD_LISTING_TABLE setting,
+	# or if the tables are suspected to be out of sync.
+
+	help = 'Rebuilds the flattened field listing and the farm rollups from scratch'
+
+	def handle(self, *args, **options):
+		FieldListing.rebuild()
+		self.stdout.write('Field listing rebuilt with {} records'.format(FieldListing.objects.count()))
+		FarmRollup.rebuild()
+		self.stdout.write('Farm rollups rebuilt for {} farms'.format(FarmRollup.objects.count()))
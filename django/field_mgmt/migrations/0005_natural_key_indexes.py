@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('field_mgmt', '0004_datasetgeneration'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='farm',
+            index=models.Index(fields=['grower', 'name'], name='farm_grower_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='field',
+            index=models.Index(fields=['farm', 'name'], name='field_farm_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grower',
+            index=models.Index(fields=['name'], name='grower_name_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('field_mgmt', '0005_natural_key_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FieldListing',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('area', models.FloatField(null=True)),
+                ('farm_id', models.BigIntegerField(db_index=True)),
+                ('farm_name', models.CharField(max_length=100)),
+                ('grower_id', models.BigIntegerField(db_index=True)),
+                ('grower_name', models.CharField(max_length=100)),
+                ('street_addr', models.CharField(max_length=100, null=True)),
+                ('city', models.CharField(max_length=100, null=True)),
+                ('state', models.CharField(max_length=100, null=True)),
+                ('zip_code', models.CharField(max_length=100, null=True)),
+                ('country', models.CharField(max_length=100, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['grower_name', 'id'], name='listing_grower_name_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+
+def count_fields(apps, schema_editor):
+    Field = apps.get_model('field_mgmt', 'Field')
+    FarmRollup = apps.get_model('field_mgmt', 'FarmRollup')
+    counts = (Field.objects.order_by().values('farm_id')
+        .annotate(field_count=Count('pk'), total_area=Sum('area')))
+    FarmRollup.objects.bulk_create([FarmRollup(farm_id=row['farm_id'], field_count=row['field_count'],
+        total_area=row['total_area'] or 0) for row in counts.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('field_mgmt', '0006_fieldlisting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FarmRollup',
+            fields=[
+                ('farm', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup', serialize=False, to='field_mgmt.farm')),
+                ('field_count', models.BigIntegerField(default=0)),
+                ('total_area', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_fields, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,10 @@
 
-from django.db import models
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.core.validators import MinValueValidator
 
 from core.models import CoreModel, ConcurrentModel
@@ -30,34 +35,17 @@ class Grower(CoreModel, ConcurrentModel):
 	zip_code = models.CharField(max_length=100, null=True, blank=True)
 	country = models.CharField(max_length=100, null=True, blank=True)
 
-	def __str__(self):
-		return self.name
+	data_fields = ['pk', 'version', 'created', 'updated', 'name',
+		'street_addr', 'city', 'state', 'zip_code', 'country']
+	natural_key = ['name']
 
-	#-== @method
-	def to_data(self, depth=0):
-		#-== Wrangles the model object data into a Python dictionary that can be easily serialized.
+	class Meta:
+		indexes = [
+			models.Index(fields=['name'], name='grower_name_idx'),
+		]
 
-		#-== @params
-		# depth: how many nested levels down to traverse
-
-		#-== The /depth parameter controls how /ForeignKey or other relational fields are wrangled.
-		# If /-depth == 0-/ then these fields will simply provide the primary key of the related object.
-		# *Example:* /-'related_object_id': 23-/
-		# If /depth is greater than zero, the related object will also call its /to_data method.
-
-		data = {
-			'pk': self.pk,
-			'version': self.version,
-			'created': str(self.created),
-			'updated': str(self.updated),
-			'name': self.name,
-			'street_addr': self.street_addr,
-			'city': self.city,
-			'state': self.state,
-			'zip_code': self.zip_code,
-			'country': self.country,
-		}
-		return data
+	def __str__(self):
+		return self.name
 
 
 #-== @class
@@ -73,32 +61,16 @@ class Farm(CoreModel, ConcurrentModel):
 	name = models.CharField(max_length=100, null=False, blank=False)
 	grower = models.ForeignKey(Grower, on_delete=models.CASCADE , null=False)
 
-	def __str__(self):
-		return self.name
-
-	#-== @method
-	def to_data(self, depth=0):
-		#-== Wrangles the model object data into a Python dictionary that can be easily serialized.
-
-		#-== @params
-		# depth: how many nested levels down to traverse
+	data_fields = ['pk', 'version', 'created', 'updated', 'name', 'grower']
+	natural_key = ['grower', 'name']
 
-		#-== The /depth parameter controls how /ForeignKey or other relational fields are wrangled.
-		# If /-depth == 0-/ then these fields will simply provide the primary key of the related object.
-		# *Example:* /-'related_object_id': 23-/
-		# If /depth is greater than zero, the related object will also call its /to_data method.
+	class Meta:
+		indexes = [
+			models.Index(fields=['grower', 'name'], name='farm_grower_name_idx'),
+		]
 
-		data = {
-			'pk': self.pk,
-			'version': self.version,
-			'created': str(self.created),
-			'updated': str(self.updated),
-			'name': self.name,
-			'grower': self.grower_id
-		}
-		if depth > 0:
-			data['grower'] = self.grower.to_data(depth-1)
-		return data
+	def __str__(self):
+		return self.name
 
 
 #-== @class
@@ -115,30 +87,366 @@ class Field(CoreModel, ConcurrentModel):
 	area = models.FloatField(null=False, validators=[MinValueValidator(0.0001, message='Area must be at least 0.0001 acres.')])
 	farm = models.ForeignKey(Farm, on_delete=models.CASCADE , null=False)
 
+	data_fields = ['pk', 'version', 'created', 'updated', 'name', 'area', 'farm']
+	natural_key = ['farm', 'name']
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['farm', 'name'], name='field_farm_name_idx'),
+		]
+
 	def __str__(self):
-		return '{} - {}'.format(self.farm.name, self.name)
+		# the farm is only named if it was loaded with the field,
+		# so logging a field never runs a query for its farm
+		if Field.farm.is_cached(self):
+			return '{} - {}'.format(self.farm.name, self.name)
+		return 'Farm {} - {}'.format(self.farm_id, self.name)
 
 	#-== @method
-	def to_data(self, depth=0):
-		#-== Wrangles the model object data into a Python dictionary that can be easily serialized.
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		#-== Remembers the farm the field was loaded with as /loaded_farm_id ,
+		# so the /FarmRollup of that farm can be recounted if the field is moved.
 
-		#-== @params
-		# depth: how many nested levels down to traverse
+		instance = super().from_db(db, field_names, values)
+		instance.loaded_farm_id = instance.__dict__.get('farm_id')
+		return instance
+
+
+#-== @function
+def insert_from_query(modelclass, queryset, columns):
+	#-== Inserts the rows of a /values_list /queryset into the table of /modelclass
+	# with a single /-INSERT ... SELECT-/ statement, so the rows never leave the database.
+	# @params
+	# modelclass: the model to insert the rows into
+	# queryset: the /values_list queryset which selects the rows
+	# columns: the field names of /modelclass , in the order of the /queryset values
+
+	try:
+		sql, params = queryset.query.sql_with_params()
+	except EmptyResultSet:
+		return
+	quote = connection.ops.quote_name
+	names = ', '.join(quote(modelclass._meta.get_field(column).column) for column in columns)
+	with connection.cursor() as cursor:
+		cursor.execute('INSERT INTO {} ({}) {}'.format(quote(modelclass._meta.db_table), names, sql), params)
+
+
+#-== @class
+class FieldListing(models.Model):
+	#-== A flattened, read-only copy of the field list, with one row per /Field
+	# holding the field, farm and grower columns which the list shows.
+	# When the /FIELD_LISTING_TABLE setting is enabled, the field list reads from
+	# this table with a single-table scan instead of joining the three models.
+	#
+	#-== The rows are kept in sync incrementally: saving or deleting a /Field , /Farm
+	# or /Grower refreshes the rows of the affected fields, and the imports and the
+	# batch operations refresh the rows of the fields they wrote.
+	# The whole table can be rebuilt with /-manage.py rebuild_field_listing-/ .
+
+	# -== *Model Fields:*
+	# @deflist
+	# id: the primary key of the /Field
+	# farm_id: the primary key of the /Farm of the field
+	# grower_id: the primary key of the /Grower of the farm
+	# <other fields>: copies of the field, farm and grower columns
+
+	id = models.BigIntegerField(primary_key=True)
+	name = models.CharField(max_length=100)
+	area = models.FloatField(null=True)
+	farm_id = models.BigIntegerField(db_index=True)
+	farm_name = models.CharField(max_length=100)
+	grower_id = models.BigIntegerField(db_index=True)
+	grower_name = models.CharField(max_length=100)
+	street_addr = models.CharField(max_length=100, null=True)
+	city = models.CharField(max_length=100, null=True)
+	state = models.CharField(max_length=100, null=True)
+	zip_code = models.CharField(max_length=100, null=True)
+	country = models.CharField(max_length=100, null=True)
+
+	# the /Field lookup each column is copied from
+	SOURCE_LOOKUPS = {
+		'id': 'pk',
+		'name': 'name',
+		'area': 'area',
+		'farm_id': 'farm_id',
+		'farm_name': 'farm__name',
+		'grower_id': 'farm__grower_id',
+		'grower_name': 'farm__grower__name',
+		'street_addr': 'farm__grower__street_addr',
+		'city': 'farm__grower__city',
+		'state': 'farm__grower__state',
+		'zip_code': 'farm__grower__zip_code',
+		'country': 'farm__grower__country',
+	}
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['grower_name', 'id'], name='listing_grower_name_idx'),
+		]
+
+	def __str__(self):
+		return '{} - {}'.format(self.farm_name, self.name)
+
+	#-== @method
+	@classmethod
+	def enabled(cls):
+		#-== @returns
+		# /True if the /FIELD_LISTING_TABLE setting is enabled.
+
+		return getattr(settings, 'FIELD_LISTING_TABLE', False)
+
+	#-== @method
+	@classmethod
+	def records(cls):
+		#-== @returns
+		# A queryset of the table which is annotated with the /Field lookups of
+		# the columns, such as /farm__grower__name , so it can be filtered, sorted
+		# and serialized with the same names as a /Field queryset.
+
+		aliases = {lookup: F(column) for column, lookup in cls.SOURCE_LOOKUPS.items()
+			if lookup != column and column != 'id'}
+		return cls.objects.annotate(**aliases)
+
+	#-== @method
+	@classmethod
+	def refresh(cls, **filters):
+		#-== Replaces the rows of the fields matching the /filters , which are /Field lookups,
+		# with a single /-INSERT ... SELECT-/ from the joined models.
+		# Does nothing unless the table is /enabled .
+
+		if cls.enabled():
+			cls.copy_fields(Field.objects.filter(**filters))
+
+	#-== @method
+	@classmethod
+	def remove(cls, **filters):
+		#-== Deletes the rows matching the /filters , if the table is /enabled .
+
+		if cls.enabled():
+			cls.objects.filter(**filters).delete()
+
+	#-== @method
+	@classmethod
+	def rebuild(cls):
+		#-== Replaces the whole table with the current fields.
+
+		cls.copy_fields(Field.objects.all(), replace_all=True)
+
+	#-== @method
+	@classmethod
+	def copy_fields(cls, fields, replace_all=False):
+		#-== Deletes the rows of the /fields queryset and copies them again from the joined models.
+
+		with transaction.atomic(savepoint=False):
+			if replace_all:
+				cls.objects.all().delete()
+			else:
+				cls.objects.filter(pk__in=fields.values('pk')).delete()
+			insert_from_query(cls, fields.values_list(*cls.SOURCE_LOOKUPS.values()), list(cls.SOURCE_LOOKUPS))
+
+	#-== @method
+	@classmethod
+	def field_saved(cls, instance, **kwargs):
+		#-== Signal receiver which refreshes the row of a saved /Field .
 
-		#-== The /depth parameter controls how /ForeignKey or other relational fields are wrangled.
-		# If /-depth == 0-/ then these fields will simply provide the primary key of the related object.
-		# *Example:* /-'related_object_id': 23-/
-		# If /depth is greater than zero, the related object will also call its /to_data method.
+		cls.refresh(pk=instance.pk)
+
+	#-== @method
+	@classmethod
+	def farm_saved(cls, instance, created=False, **kwargs):
+		#-== Signal receiver which refreshes the rows of the fields of a saved /Farm .
+
+		if not created:
+			cls.refresh(farm_id=instance.pk)
+
+	#-== @method
+	@classmethod
+	def grower_saved(cls, instance, created=False, **kwargs):
+		#-== Signal receiver which refreshes the rows of the fields of a saved /Grower .
+
+		if not created:
+			cls.refresh(farm__grower_id=instance.pk)
+
+	#-== @method
+	@classmethod
+	def field_deleted(cls, instance, **kwargs):
+		#-== Signal receiver which removes the row of a deleted /Field .
+		# Deleting a /Farm or /Grower deletes its fields first, which sends this signal for each of them.
+
+		cls.remove(pk=instance.pk)
+
+
+#-== @class
+class FarmRollup(models.Model):
+	#-== The number of fields and their total area for each /Farm .
+	# The summaries by grower, farm, state and country add these up,
+	# so they group the farms instead of every field.
+	#
+	#-== The rows are refreshed incrementally: saving or deleting a /Field recounts
+	# its farm (and its previous farm, if it was moved), and the imports and the batch
+	# operations recount the farms of the fields they wrote.
+	# A farm without a row has no fields.
+	# The whole table can be rebuilt with /-manage.py rebuild_field_listing-/ .
+
+	# -== *Model Fields:*
+	# @deflist
+	# farm: the /Farm , which is also the primary key
+	# field_count: the number of fields of the farm
+	# total_area: the sum of the /area of the fields of the farm
+
+	farm = models.OneToOneField(Farm, on_delete=models.CASCADE, primary_key=True, related_name='rollup')
+	field_count = models.BigIntegerField(default=0)
+	total_area = models.FloatField(default=0)
+
+	def __str__(self):
+		return 'Farm {}: {} fields'.format(self.farm_id, self.field_count)
+
+	#-== @method
+	@classmethod
+	def refresh(cls, farm_ids):
+		#-== Recounts the farms with the primary keys in /farm_ids
+		# with a single grouped /-INSERT ... SELECT-/ .
+
+		farm_ids = {farm_id for farm_id in farm_ids if farm_id is not None}
+		if farm_ids:
+			cls.count_fields(Field.objects.filter(farm_id__in=farm_ids), farm_ids)
+
+	#-== @method
+	@classmethod
+	def rebuild(cls):
+		#-== Recounts every farm.
+
+		cls.count_fields(Field.objects.all())
+
+	#-== @method
+	@classmethod
+	def count_fields(cls, fields, farm_ids=None):
+		#-== Replaces the rows of the /farm_ids with the counts of the /fields queryset.
+		# /farm_ids can be a collection or a subquery of primary keys, or /None to replace every row.
+
+		counts = (fields.order_by().values('farm_id')
+			.annotate(field_count=Count('pk'), total_area=Coalesce(Sum('area'), 0.0))
+			.values_list('farm_id', 'field_count', 'total_area'))
+		with transaction.atomic(savepoint=False):
+			if farm_ids is None:
+				cls.objects.all().delete()
+			else:
+				cls.objects.filter(farm_id__in=farm_ids).delete()
+			insert_from_query(cls, counts, ['farm', 'field_count', 'total_area'])
+
+	#-== @method
+	@classmethod
+	def field_saved(cls, instance, **kwargs):
+		#-== Signal receiver which recounts the farm of a saved /Field ,
+		# and the farm it was loaded with or had before a /versioned_update .
+
+		cls.refresh([instance.farm_id, getattr(instance, 'loaded_farm_id', None),
+			getattr(instance, 'previous_farm_id', None)])
+
+	#-== @method
+	@classmethod
+	def field_deleted(cls, instance, **kwargs):
+		#-== Signal receiver which recounts the farm of a deleted /Field .
+
+		cls.refresh([instance.farm_id])
+
+
+#-== @class
+class ImportJob(CoreModel):
+	#-== Tracks a CSV import which is processed in the background.
+	# The counters are updated after each batch of rows,
+	# so the progress of the import can be polled while it runs.
+
+	# -== *Model Fields:*
+	# @deflist
+	# status: one of /PENDING , /RUNNING , /COMPLETE , or /FAILED
+	# upload: the uploaded CSV file, removed once the import has finished
+	# records_read: the number of rows read from the CSV so far
+	# records_processed: the number of rows stored in the database so far
+	# errors: the list of error messages for rejected rows
+
+	PENDING = 'pending'
+	RUNNING = 'running'
+	COMPLETE = 'complete'
+	FAILED = 'failed'
+	STATUS_CHOICES = [
+		(PENDING, 'Pending'),
+		(RUNNING, 'Running'),
+		(COMPLETE, 'Complete'),
+		(FAILED, 'Failed'),
+	]
+
+	status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+	upload = models.FileField(upload_to='imports/', blank=True)
+	records_read = models.IntegerField(default=0)
+	records_processed = models.IntegerField(default=0)
+	errors = models.JSONField(default=list, blank=True)
+
+	def __str__(self):
+		return 'Import {} ({})'.format(self.pk, self.status)
+
+	#-== @method
+	def to_data(self, depth=0):
+		#-== Wrangles the model object data into a Python dictionary that can be easily serialized.
+		# The counters use the same keys as the response of a synchronous import.
 
 		data = {
 			'pk': self.pk,
-			'version': self.version,
 			'created': str(self.created),
 			'updated': str(self.updated),
-			'name': self.name,
-			'area': self.area,
-			'farm': self.farm_id,
+			'status': self.status,
+			'records_read': self.records_read,
+			'records_processed': self.records_processed,
+			'success': self.status == self.COMPLETE and not self.errors,
+			'errors': self.errors,
 		}
-		if depth > 0:
-			data['farm'] = self.farm.to_data(depth-1)
-		return data
\ No newline at end of file
+		return data
+
+
+#-== @class
+class DatasetGeneration(models.Model):
+	#-== A counter which is incremented every time a /Grower , /Farm
+	# or /Field is saved or deleted. Cached responses are keyed by the counter,
+	# so a change to the data makes every older cached response unreachable.
+	# There is a single row, with the primary key /CURRENT .
+
+	# -== *Model Fields:*
+	# @deflist
+	# value: the number of the current generation
+	# updated: datetime that the data last changed
+
+	CURRENT = 1
+
+	value = models.BigIntegerField(default=0)
+	updated = models.DateTimeField(default=timezone.now)
+
+	def __str__(self):
+		return 'Generation {}'.format(self.value)
+
+	#-== @method
+	@classmethod
+	def current(cls):
+		#-== @returns
+		# The /DatasetGeneration row, which is created if it does not exist yet.
+
+		generation, created = cls.objects.get_or_create(pk=cls.CURRENT)
+		return generation
+
+	#-== @method
+	@classmethod
+	async def acurrent(cls):
+		#-== The coroutine version of /current .
+
+		generation, created = await cls.objects.aget_or_create(pk=cls.CURRENT)
+		return generation
+
+	#-== @method
+	@classmethod
+	def bump(cls, **kwargs):
+		#-== Increments the generation counter in a single /UPDATE statement.
+		# The /kwargs allow this to be connected directly to model signals.
+
+		updated = cls.objects.filter(pk=cls.CURRENT).update(value=F('value') + 1, updated=timezone.now())
+		if not updated:
+			cls.objects.get_or_create(pk=cls.CURRENT, defaults={'value': 1})
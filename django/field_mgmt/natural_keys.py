@@ -0,0 +1,99 @@
+from django.db import connection
+from django.db.models import Count
+
+from field_mgmt.models import Grower, Farm, Field
+
+#-== @h1
+# Natural Keys
+#-== /field_mgmt.natural_keys.py
+#________________________________________
+#
+#-== The import identifies records by name: a /Grower by its /name ,
+# a /Farm by its grower and /name , and a /Field by its farm and /name .
+# These are the /natural_key of each model, and each one has an index.
+#
+#-== By default the natural keys are not unique, and the import rejects
+# rows whose names match multiple records. The keys can optionally be enforced
+# with unique indexes, which allows the /UpsertImporter to insert or update
+# records with /-INSERT ... ON CONFLICT-/ instead of looking them up first.
+# Use /-manage.py natural_keys --enforce-/ to create the unique indexes
+# and /-manage.py natural_keys --drop-/ to remove them again.
+
+NATURAL_KEY_MODELS = [Grower, Farm, Field]
+
+
+#-== @function
+def unique_index_name(modelclass):
+	#-== @returns
+	# The name of the unique index on the natural key of /modelclass .
+
+	return '{}_natural_key_uniq'.format(modelclass._meta.model_name)
+
+
+#-== @function
+def key_columns(modelclass):
+	#-== @returns
+	# The database columns of the natural key of /modelclass .
+
+	return [modelclass._meta.get_field(name).column for name in modelclass.natural_key]
+
+
+#-== @function
+def duplicate_keys(modelclass):
+	#-== @returns
+	# A queryset of the natural key values shared by more than one record,
+	# with the number of records in /count .
+
+	return (modelclass.objects.values(*modelclass.natural_key)
+		.annotate(count=Count('pk')).filter(count__gt=1)
+		.order_by(*modelclass.natural_key))
+
+
+#-== @function
+def unique_keys_enforced():
+	#-== @returns
+	# /True if the natural key of every model has a unique index.
+
+	with connection.cursor() as cursor:
+		for modelclass in NATURAL_KEY_MODELS:
+			constraints = connection.introspection.get_constraints(cursor, modelclass._meta.db_table)
+			columns = key_columns(modelclass)
+			if not any(constraint['unique'] and constraint['columns'] == columns
+					for constraint in constraints.values()):
+				return False
+	return True
+
+
+#-== @function
+def enforce_unique_keys():
+	#-== Creates the unique indexes on the natural keys.
+	# The indexes are only created if there are no duplicate keys.
+	# @returns
+	# A dictionary of the models which have duplicate keys,
+	# with the queryset from /duplicate_keys . Empty if the indexes were created.
+
+	duplicates = {}
+	for modelclass in NATURAL_KEY_MODELS:
+		keys = duplicate_keys(modelclass)
+		if keys.exists():
+			duplicates[modelclass] = keys
+	if duplicates:
+		return duplicates
+
+	quote = connection.ops.quote_name
+	with connection.cursor() as cursor:
+		for modelclass in NATURAL_KEY_MODELS:
+			cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({})'.format(
+				quote(unique_index_name(modelclass)), quote(modelclass._meta.db_table),
+				', '.join(quote(column) for column in key_columns(modelclass))))
+	return duplicates
+
+
+#-== @function
+def drop_unique_keys():
+	#-== Removes the unique indexes on the natural keys.
+
+	quote = connection.ops.quote_name
+	with connection.cursor() as cursor:
+		for modelclass in NATURAL_KEY_MODELS:
+			cursor.execute('DROP INDEX IF EXISTS {}'.format(quote(unique_index_name(modelclass))))
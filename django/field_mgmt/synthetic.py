@@ -0,0 +1,194 @@
+import csv, io, random
+
+from django.db import connection, transaction
+
+from field_mgmt.models import DatasetGeneration, FarmRollup, FieldListing, Grower, Farm, Field
+
+#-== @h1
+# Synthetic Data
+#-== /field_mgmt.synthetic.py
+#________________________________________
+#
+#-== Generates growers, farms and fields at any scale for the benchmark commands,
+# and import CSV content which names the same records.
+# The records only depend on the arguments of /SyntheticData , so a database
+# filled by an earlier run can be used again without regenerating it.
+
+
+#-== @function
+def skewed_counts(total, buckets, skew, rng):
+	#-== Splits /total into /buckets counts of at least one each.
+	# The counts follow a Zipf distribution: the bucket of rank /r gets a share
+	# proportional to /-1 / r ** skew-/ , so /skew 0 splits evenly and larger values
+	# give a few very large buckets. The ranks are shuffled with the random generator /rng .
+	# @returns
+	# The list of counts, which add up to /total .
+
+	weights = [1 / rank ** skew for rank in range(1, buckets + 1)]
+	rng.shuffle(weights)
+	scale = (total - buckets) / sum(weights)
+	counts = [1 + int(weight * scale) for weight in weights]
+	# the rounding leaves fewer than one per bucket to hand out
+	for index in range(total - sum(counts)):
+		counts[index] += 1
+	return counts
+
+
+#-== @class
+class SyntheticData:
+	#-== Describes a synthetic data set of /field_count fields.
+	# @attributes
+	# field_count: the number of fields
+	# skew: the Zipf exponent of the number of farms per grower and of fields per farm, see /skewed_counts
+	# seed: the seed of the random generator
+	# prefix: the start of every grower name, which tells the synthetic records apart
+	# grower_farms: the number of farms of each grower
+	# farm_fields: the number of fields of each farm, in the order of the growers
+	# batch_size: the number of growers written in each transaction
+	#
+	#-== On average a grower has /farms_per_grower farms and a farm has /fields_per_farm fields.
+
+	def __init__(self, field_count, skew=1.0, seed=0, prefix='Synthetic',
+			farms_per_grower=10, fields_per_farm=100, batch_size=1000):
+		self.field_count = field_count
+		self.skew = skew
+		self.seed = seed
+		self.prefix = prefix
+		self.batch_size = batch_size
+		rng = random.Random(seed)
+		farm_count = max(1, min(field_count, -(-field_count // fields_per_farm)))
+		grower_count = max(1, -(-farm_count // farms_per_grower))
+		self.grower_farms = skewed_counts(farm_count, grower_count, skew, rng)
+		self.farm_fields = skewed_counts(field_count, farm_count, skew, rng)
+
+	#-== @method
+	def grower_name(self, number):
+		#-== @returns
+		# The name of the grower /number .
+
+		return '{} grower {:07d}'.format(self.prefix, number)
+
+	#-== @method
+	def farm_name(self, number):
+		#-== @returns
+		# The name of the farm /number of a grower.
+
+		return 'Farm {:04d}'.format(number)
+
+	#-== @method
+	def field_name(self, number):
+		#-== @returns
+		# The name of the field /number of a farm.
+
+		return 'Field {:06d}'.format(number)
+
+	#-== @method
+	def records(self):
+		#-== @returns
+		# A queryset of the synthetic fields in the database.
+
+		return Field.objects.filter(farm__grower__name__startswith=self.prefix + ' grower ')
+
+	#-== @method
+	def exists(self):
+		#-== @returns
+		# /True if the database holds this data set.
+
+		last_grower = self.grower_name(len(self.grower_farms) - 1)
+		return (Grower.objects.filter(name=last_grower).exists()
+			and not Grower.objects.filter(name=self.grower_name(len(self.grower_farms))).exists()
+			and self.records().count() == self.field_count)
+
+	#-== @method
+	def generate(self, progress=None):
+		#-== Writes the growers, farms and fields of the data set with /bulk_create ,
+		# /batch_size growers at a time, and refreshes the derived tables of each batch.
+		# Any synthetic records with the same /prefix are removed first.
+		# @params
+		# progress: an optional callable which is given the number of fields written after each batch
+
+		self.remove()
+		rng = random.Random(self.seed)
+		farm_offset = 0
+		written = 0
+		for start in range(0, len(self.grower_farms), self.batch_size):
+			numbers = range(start, min(start + self.batch_size, len(self.grower_farms)))
+			with transaction.atomic():
+				growers = Grower.objects.bulk_create([Grower(name=self.grower_name(number),
+					city='City {}'.format(number % 1000), state='State {}'.format(number % 50),
+					country='Country {}'.format(number % 5)) for number in numbers])
+				farms = []
+				for grower, number in zip(growers, numbers):
+					farms.extend(Farm(name=self.farm_name(farm), grower_id=grower.pk)
+						for farm in range(self.grower_farms[number]))
+				farms = Farm.objects.bulk_create(farms)
+				fields = []
+				for farm, field_count in zip(farms, self.farm_fields[farm_offset:farm_offset + len(farms)]):
+					fields.extend(Field(name=self.field_name(field), area=round(rng.uniform(1, 500), 2),
+						farm_id=farm.pk) for field in range(field_count))
+					if len(fields) >= 10000:
+						Field.objects.bulk_create(fields)
+						written += len(fields)
+						fields = []
+				Field.objects.bulk_create(fields)
+				written += len(fields)
+				farm_ids = [farm.pk for farm in farms]
+				FieldListing.refresh(farm_id__in=farm_ids)
+				FarmRollup.refresh(farm_ids)
+			farm_offset += len(farms)
+			if progress is not None:
+				progress(written)
+		DatasetGeneration.bump()
+		if connection.vendor == 'postgresql':
+			# refresh the planner statistics after the bulk load
+			with connection.cursor() as cursor:
+				cursor.execute('ANALYZE')
+
+	#-== @method
+	def remove(self, prefix=None):
+		#-== Removes the growers whose names start with /prefix , by default the synthetic growers,
+		# with their farms and fields.
+
+		prefix = prefix or self.prefix + ' grower '
+		with transaction.atomic():
+			# the fields are removed with _raw_delete like the batch deletes,
+			# as the collector would send a signal for each of them
+			fields = Field.objects.filter(farm__grower__name__startswith=prefix)
+			fields._raw_delete(fields.db)
+			FieldListing.remove(grower_name__startswith=prefix)
+			Grower.objects.filter(name__startswith=prefix).delete()
+			DatasetGeneration.bump()
+
+	#-== @method
+	def import_csv(self, rows, new_fraction=0.2, seed=None, new_prefix=None):
+		#-== Builds the content of an import of /rows rows.
+		# Most rows update the area of existing synthetic fields, picked so that
+		# the growers and farms with more fields are named more often.
+		# The /new_fraction of the rows add fields to new growers named with /new_prefix
+		# (by default the /prefix followed by /-import-/ ), see /remove .
+		# @returns
+		# The CSV content as bytes.
+
+		rng = random.Random(self.seed if seed is None else seed)
+		new_prefix = new_prefix or self.prefix + ' import '
+		farm_starts = [0]
+		for farm_count in self.grower_farms:
+			farm_starts.append(farm_starts[-1] + farm_count)
+		grower_fields = [sum(self.farm_fields[start:end]) for start, end in zip(farm_starts, farm_starts[1:])]
+		output = io.StringIO()
+		writer = csv.writer(output, lineterminator='\n')
+		writer.writerow(['grower_name', 'street_addr', 'city', 'state', 'zip_code', 'country',
+			'farm_name', 'field_name', 'area'])
+		growers = rng.choices(range(len(self.grower_farms)), weights=grower_fields, k=rows)
+		for row, grower in enumerate(growers):
+			area = round(rng.uniform(1, 500), 2)
+			if rng.random() < new_fraction:
+				writer.writerow(['{}{:07d}'.format(new_prefix, row // 100), '', '', '', '', '',
+					self.farm_name(row // 10 % 10), self.field_name(row), area])
+				continue
+			farm_fields = self.farm_fields[farm_starts[grower]:farm_starts[grower + 1]]
+			farm = rng.choices(range(len(farm_fields)), weights=farm_fields)[0]
+			field = rng.randrange(farm_fields[farm])
+			writer.writerow([self.grower_name(grower), '', '', '', '', '',
+				self.farm_name(farm), self.field_name(field), area])
+		return output.getvalue().encode('utf-8')
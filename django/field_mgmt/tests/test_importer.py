@@ -0,0 +1,330 @@
+import csv, io, json, os, tempfile
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+
+from core.profiling import profile_to_file
+from field_mgmt.importer import BulkImporter
+from field_mgmt.models import DatasetGeneration, Farm, FarmRollup, Field, Grower
+
+#-== @h1
+# Importer Tests
+#-== /field_mgmt.tests.test_importer.py
+#________________________________________
+
+COLUMNS = ['grower_name', 'farm_name', 'field_name', 'area', 'state']
+
+
+#-== @function
+def csv_reader(rows, columns=COLUMNS):
+	#-== @returns
+	# A /csv.DictReader of the CSV text with the /columns and /rows .
+
+	text = io.StringIO()
+	writer = csv.writer(text)
+	writer.writerow(columns)
+	writer.writerows(rows)
+	text.seek(0)
+	return csv.DictReader(text)
+
+
+#-== @class
+class BulkImporterTests(TestCase):
+	#-== Tests the records created and updated by /BulkImporter .
+
+	def test_create(self):
+		importer = BulkImporter()
+		importer.import_csv(csv_reader([
+			['Mary Calahan', 'Coriander Fields', 'Field 1', '10.5', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Field 2', '4', 'KS'],
+			['Mary Calahan', 'Basil Acres', 'Field 1', '2', 'KS'],
+			['Joe Ortiz', 'Coriander Fields', 'Field 1', '7', 'NE'],
+		]))
+		self.assertEqual(importer.errors, [])
+		self.assertEqual(importer.records_read, 4)
+		self.assertEqual(importer.records_processed, 4)
+		self.assertEqual(Grower.objects.count(), 2)
+		self.assertEqual(Grower.objects.get(name='Joe Ortiz').state, 'NE')
+		self.assertEqual(Farm.objects.count(), 3)
+		self.assertEqual(Field.objects.count(), 4)
+		field = Field.objects.get(name='Field 1', farm__name='Coriander Fields', farm__grower__name='Mary Calahan')
+		self.assertEqual(field.area, 10.5)
+		rollup = FarmRollup.objects.get(farm=field.farm)
+		self.assertEqual(rollup.field_count, 2)
+		self.assertEqual(rollup.total_area, 14.5)
+
+	def test_update(self):
+		grower = Grower.objects.create(name='Mary Calahan', state='KS')
+		farm = Farm.objects.create(name='Coriander Fields', grower=grower)
+		field = Field.objects.create(name='Field 1', area=10.0, farm=farm)
+		generation = DatasetGeneration.current().value
+
+		importer = BulkImporter()
+		importer.import_csv(csv_reader([
+			['Mary Calahan', 'Coriander Fields', 'Field 1', '12', 'NE'],
+			['Mary Calahan', 'Coriander Fields', 'Field 2', '3', 'NE'],
+		]))
+		self.assertEqual(importer.errors, [])
+		self.assertEqual(importer.records_processed, 2)
+		self.assertEqual(Grower.objects.count(), 1)
+		# the grower columns are only copied onto new growers
+		self.assertEqual(Grower.objects.get().state, 'KS')
+		self.assertEqual(Farm.objects.count(), 1)
+		updated = Field.objects.get(pk=field.pk)
+		self.assertEqual(updated.area, 12.0)
+		self.assertEqual(updated.version, field.version + 1)
+		self.assertEqual(Field.objects.count(), 2)
+		self.assertGreater(DatasetGeneration.current().value, generation)
+
+	def test_repeated_rows(self):
+		importer = BulkImporter()
+		importer.import_csv(csv_reader([
+			['Mary Calahan', 'Coriander Fields', 'Field 1', '10', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Field 1', '11', 'KS'],
+		]))
+		self.assertEqual(importer.errors, [])
+		self.assertEqual(Field.objects.get().area, 11.0)
+
+	def test_ambiguous_grower(self):
+		Grower.objects.create(name='Mary Calahan')
+		Grower.objects.create(name='Mary Calahan')
+		importer = BulkImporter()
+		importer.import_csv(csv_reader([
+			['Mary Calahan', 'Coriander Fields', 'Field 1', '10', 'KS'],
+			['Joe Ortiz', 'Coriander Fields', 'Field 1', '7', 'NE'],
+		]))
+		self.assertEqual(importer.errors, ['Multiple growers with name: Mary Calahan'])
+		self.assertEqual(importer.records_processed, 1)
+		self.assertFalse(Farm.objects.filter(grower__name='Mary Calahan').exists())
+		self.assertTrue(Field.objects.filter(farm__grower__name='Joe Ortiz').exists())
+
+	def test_ambiguous_farm(self):
+		grower = Grower.objects.create(name='Mary Calahan')
+		Farm.objects.create(name='Coriander Fields', grower=grower)
+		Farm.objects.create(name='Coriander Fields', grower=grower)
+		importer = BulkImporter()
+		importer.import_csv(csv_reader([['Mary Calahan', 'Coriander Fields', 'Field 1', '10', 'KS']]))
+		self.assertEqual(importer.errors, ['Multiple farms with name: Coriander Fields'])
+		self.assertEqual(importer.records_processed, 0)
+		self.assertEqual(Field.objects.count(), 0)
+
+	def test_ambiguous_field(self):
+		grower = Grower.objects.create(name='Mary Calahan')
+		farm = Farm.objects.create(name='Coriander Fields', grower=grower)
+		Field.objects.create(name='Field 1', area=1.0, farm=farm)
+		Field.objects.create(name='Field 1', area=2.0, farm=farm)
+		importer = BulkImporter()
+		importer.import_csv(csv_reader([['Mary Calahan', 'Coriander Fields', 'Field 1', '10', 'KS']]))
+		self.assertEqual(importer.errors, ['Multiple field with name: Field 1'])
+		self.assertEqual(sorted(Field.objects.values_list('area', flat=True)), [1.0, 2.0])
+
+	def test_missing_columns(self):
+		importer = BulkImporter()
+		importer.import_csv(csv_reader([['Mary Calahan', 'Field 1']], columns=['grower_name', 'field_name']))
+		self.assertEqual(importer.errors, ['No "farm_name" column defined', 'No area column defined'])
+		self.assertEqual(importer.records_read, 0)
+		self.assertEqual(Grower.objects.count(), 0)
+
+
+#-== @class
+class RejectingImporter(BulkImporter):
+	#-== A /BulkImporter which writes every row, then fails like the database
+	# would if a row with the field name /-Broken-/ was written.
+
+	def write_rows(self, rows):
+		fields = super().write_rows(rows)
+		if any(row['field_name'] == 'Broken' for row in rows):
+			raise IntegrityError('Broken field')
+		return fields
+
+
+#-== @class
+class SavepointTests(TestCase):
+	#-== Tests the batches which the database rejects, which are written again
+	# one row at a time with /BulkImporter.write_rows_separately .
+
+	def test_rejected_row(self):
+		importer = RejectingImporter(batch_size=3)
+		importer.import_csv(csv_reader([
+			['Mary Calahan', 'Coriander Fields', 'Field 1', '10', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Broken', '10', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Field 3', '10', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Field 4', '10', 'KS'],
+		]))
+		self.assertEqual(importer.errors, ['Record 2: Broken field'])
+		self.assertEqual(importer.records_read, 4)
+		self.assertEqual(importer.records_processed, 3)
+		self.assertEqual(sorted(Field.objects.values_list('name', flat=True)), ['Field 1', 'Field 3', 'Field 4'])
+		self.assertEqual(FarmRollup.objects.get().field_count, 3)
+
+	def test_rolled_back_records(self):
+		# the grower and farm created by the rejected row are rolled back with it,
+		# so they are created again for the next row rather than taken from the caches
+		importer = RejectingImporter()
+		importer.import_csv(csv_reader([
+			['Mary Calahan', 'Coriander Fields', 'Field 1', '10', 'KS'],
+			['Joe Ortiz', 'Basil Acres', 'Broken', '10', 'NE'],
+			['Joe Ortiz', 'Basil Acres', 'Field 1', '10', 'NE'],
+		]))
+		self.assertEqual(importer.errors, ['Record 2: Broken field'])
+		self.assertEqual(importer.records_processed, 2)
+		self.assertEqual(Grower.objects.filter(name='Joe Ortiz').count(), 1)
+		self.assertTrue(Field.objects.filter(name='Field 1', farm__name='Basil Acres', farm__grower__name='Joe Ortiz').exists())
+		self.assertFalse(Field.objects.filter(name='Broken').exists())
+
+	def test_errors_reported_once(self):
+		# the rows are resolved again after the batch is rolled back,
+		# which must not repeat the errors of the rolled back attempt
+		Grower.objects.create(name='Dup')
+		Grower.objects.create(name='Dup')
+		importer = RejectingImporter()
+		importer.import_csv(csv_reader([
+			['Dup', 'Coriander Fields', 'Field 1', '10', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Broken', '10', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Field 3', '', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Field 4', '10', 'KS'],
+		]))
+		self.assertEqual(importer.errors, [
+			'Record 3: area: "" value must be a float.',
+			'Multiple growers with name: Dup',
+			'Record 2: Broken field',
+		])
+		self.assertEqual(importer.records_processed, 1)
+
+	def test_generation_bump(self):
+		generation = DatasetGeneration.current().value
+		importer = RejectingImporter(batch_size=2)
+		importer.import_csv(csv_reader([
+			['Mary Calahan', 'Coriander Fields', 'Field 1', '10', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Broken', '10', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Field 3', '10', 'KS'],
+		]))
+		# each committed batch increments the generation once
+		self.assertEqual(DatasetGeneration.current().value, generation + 2)
+
+
+#-== @class
+class ValidationTests(TestCase):
+	#-== Tests the rows rejected by /BulkImporter.validate_rows , and their record numbers.
+
+	def test_invalid_rows(self):
+		importer = BulkImporter(batch_size=2)
+		importer.import_csv(csv_reader([
+			['Mary Calahan', 'Coriander Fields', 'Field 1', '10', 'KS'],
+			['', 'Coriander Fields', 'Field 2', '10', 'KS'],
+			['Mary Calahan', 'x' * 101, 'Field 3', '10', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Field 4', 'ten', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Field 5', '0', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Field 6', '0.0001', 'KS'],
+		]))
+		self.assertEqual(importer.errors, [
+			'Record 2: grower_name: This field cannot be blank.',
+			'Record 3: farm_name: Ensure this value has at most 100 characters (it has 101).',
+			'Record 4: area: "ten" value must be a float.',
+			'Record 5: area: Area must be at least 0.0001 acres.',
+		])
+		self.assertEqual(importer.records_read, 6)
+		self.assertEqual(importer.records_processed, 2)
+		self.assertEqual(sorted(Field.objects.values_list('name', flat=True)), ['Field 1', 'Field 6'])
+
+	def test_several_errors(self):
+		importer = BulkImporter()
+		importer.import_csv(csv_reader([['Mary Calahan', 'Coriander Fields', '', '', 'KS']]))
+		self.assertEqual(importer.errors, [
+			'Record 1: field_name: This field cannot be blank.',
+			'Record 1: area: "" value must be a float.',
+		])
+
+	def test_optional_columns(self):
+		importer = BulkImporter()
+		importer.import_csv(csv_reader([
+			['Mary Calahan', 'Coriander Fields', 'Field 1', '10', ''],
+			['Joe Ortiz', 'Coriander Fields', 'Field 1', '10', 'x' * 101],
+		]))
+		self.assertEqual(importer.errors, ['Record 2: state: Ensure this value has at most 100 characters (it has 101).'])
+		self.assertEqual(importer.records_processed, 1)
+
+
+#-== @class
+class ReadErrorTests(TestCase):
+	#-== Tests the records of an upload which cannot be decoded or parsed.
+
+	def test_unreadable_record(self):
+		# a value longer than the field size limit of the csv module cannot be parsed
+		importer = BulkImporter(batch_size=2)
+		importer.import_csv(csv_reader([
+			['Mary Calahan', 'Coriander Fields', 'Field 1', '10', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Field 2', '10', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'x' * (csv.field_size_limit() + 1), '10', 'KS'],
+			['Mary Calahan', 'Coriander Fields', 'Field 4', '10', 'KS'],
+		]))
+		self.assertEqual(len(importer.errors), 1)
+		self.assertTrue(importer.errors[0].startswith('Record 3: Could not be read, the import stopped at this record:'))
+		# the batches before the unreadable record are kept
+		self.assertEqual(importer.records_read, 2)
+		self.assertEqual(importer.records_processed, 2)
+		self.assertEqual(Field.objects.count(), 2)
+
+	def test_undecodable_record(self):
+		# the upload is decoded a block at a time, so the header and the first
+		# records are read before the block with the latin-1 character
+		lines = [','.join(COLUMNS)]
+		lines += ['Mary Calahan,Coriander Fields,Field {},10,KS'.format(number) for number in range(1, 1001)]
+		lines.append('Mary Calahan,Coriander Fields,Field \xe9,10,KS')
+		upload = io.BytesIO('\n'.join(lines).encode('latin-1'))
+		importer = BulkImporter(batch_size=100)
+		importer.import_csv(csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8')))
+		self.assertEqual(len(importer.errors), 1)
+		self.assertTrue(importer.errors[0].startswith('Record {}: Could not be read'.format(importer.records_read + 1)))
+		self.assertGreater(importer.records_processed, 0)
+		self.assertEqual(Field.objects.count(), importer.records_processed)
+
+	def test_unreadable_header(self):
+		upload = io.BytesIO('grower_name,farm_name,field_name,area,\xe9tat\n'.encode('latin-1'))
+		importer = BulkImporter()
+		importer.import_csv(csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8')))
+		self.assertEqual(len(importer.errors), 1)
+		self.assertTrue(importer.errors[0].startswith('The CSV header could not be read:'))
+		self.assertEqual(importer.records_read, 0)
+
+
+#-== @class
+class ProfileTests(TestCase):
+	#-== Tests the profiling of imports.
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directory.cleanup)
+
+	def upload(self, user, profile):
+		self.client.force_login(user)
+		upload = io.BytesIO('{}\nMary Calahan,Coriander Fields,Field 1,10,KS\n'.format(','.join(COLUMNS)).encode())
+		upload.name = 'fields.csv'
+		return self.client.post('/manage/import/?profile={}'.format(profile), {'file': upload})
+
+	def test_disabled(self):
+		user = User.objects.create_user('staff', is_staff=True)
+		with override_settings(IMPORT_PROFILE_DIR=None):
+			self.assertEqual(self.upload(user, 'cprofile').status_code, 400)
+
+	def test_staff_only(self):
+		with override_settings(IMPORT_PROFILE_DIR=self.directory.name):
+			self.assertEqual(self.upload(User.objects.create_user('user'), 'cprofile').status_code, 403)
+			response = self.upload(User.objects.create_user('staff', is_staff=True), 'cprofile')
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(os.path.exists(os.path.join(self.directory.name, json.loads(response.content)['profile'])))
+
+	def test_max_events(self):
+		with profile_to_file('speedscope', self.directory.name, 'import', max_events=100) as path:
+			BulkImporter().import_csv(csv_reader([
+				['Mary Calahan', 'Coriander Fields', 'Field {}'.format(number), '10', 'KS'] for number in range(10)
+			]))
+		with open(path, encoding='utf-8') as profile:
+			profile = json.load(profile)
+		events = profile['profiles'][0]['events']
+		self.assertLessEqual(len(events), 100)
+		self.assertEqual(profile['name'], 'import (truncated)')
+		# every call which was opened is closed
+		self.assertEqual(sum(1 for event in events if event['type'] == 'O'),
+			sum(1 for event in events if event['type'] == 'C'))
@@ -0,0 +1,66 @@
+import json, tempfile
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from field_mgmt.jobs import claim_job, claim_next_job, fail_stale_jobs
+from field_mgmt.models import ImportJob
+
+#-== @h1
+# Import Job Tests
+#-== /field_mgmt.tests.test_jobs.py
+#________________________________________
+
+
+#-== @class
+@override_settings(IMPORT_JOB_STALE_SECONDS=600)
+class StaleJobTests(TestCase):
+	#-== Tests that running jobs whose worker stopped are marked as failed.
+
+	def setUp(self):
+		media = tempfile.TemporaryDirectory()
+		self.addCleanup(media.cleanup)
+		settings = self.settings(MEDIA_ROOT=media.name)
+		settings.enable()
+		self.addCleanup(settings.disable)
+
+	def running_job(self, seconds):
+		# a running job whose last heartbeat was /seconds ago
+		job = ImportJob()
+		job.upload.save('import.csv', ContentFile(b'grower_name,farm_name,field_name,area,state\n'))
+		claim_job(job.pk)
+		ImportJob.objects.filter(pk=job.pk).update(updated=timezone.now() - timedelta(seconds=seconds),
+			errors=['Record 2: Broken field'])
+		return job
+
+	def test_fail_stale_jobs(self):
+		stale = self.running_job(601)
+		running = self.running_job(60)
+		self.assertEqual(fail_stale_jobs(), 1)
+		stale.refresh_from_db()
+		self.assertEqual(stale.status, ImportJob.FAILED)
+		self.assertEqual(stale.errors[0], 'Record 2: Broken field')
+		self.assertTrue(stale.errors[1].startswith('Import failed:'))
+		self.assertFalse(stale.upload)
+		self.assertTrue(running.upload.storage.exists(running.upload.name))
+		running.refresh_from_db()
+		self.assertEqual(running.status, ImportJob.RUNNING)
+		self.assertEqual(fail_stale_jobs(), 0)
+
+	def test_claim_next_job(self):
+		stale = self.running_job(601)
+		self.assertIsNone(claim_next_job())
+		stale.refresh_from_db()
+		self.assertEqual(stale.status, ImportJob.FAILED)
+
+	def test_status(self):
+		stale = self.running_job(601)
+		self.running_job(601)
+		self.client.force_login(User.objects.create_user('tester'))
+		data = json.loads(self.client.get('/manage/import/jobs/{}/'.format(stale.pk)).content)
+		self.assertEqual(data['status'], ImportJob.FAILED)
+		# only the polled job is checked
+		self.assertEqual(ImportJob.objects.filter(status=ImportJob.RUNNING).count(), 1)
@@ -0,0 +1,129 @@
+import base64, json
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from field_mgmt.models import Farm, Field, FieldListing, Grower
+
+#-== @h1
+# Field List Pagination Tests
+#-== /field_mgmt.tests.test_keyset.py
+#________________________________________
+
+
+#-== @class
+@override_settings(FIELD_LISTING_TABLE=False)
+class KeysetPaginationTests(TestCase):
+	#-== Tests the pages of the field list read with the /limit and /cursor parameters,
+	# which must add up to the whole sorted list without skipping or repeating a record.
+
+	SORTS = ['name', '-name', 'area', '-area', 'farm__grower__state', '-farm__grower__state', 'pk', '-pk']
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = User.objects.create_user('tester', password='secret')
+		# repeated names, areas and states, so records with the same sort value span pages,
+		# and growers without a state, so the empty values span pages as well
+		for number, state in enumerate(['KS', None, 'NE', None, 'KS']):
+			grower = Grower.objects.create(name='Grower {}'.format(number), state=state)
+			farm = Farm.objects.create(name='Farm {}'.format(number), grower=grower)
+			for index in range(4):
+				Field.objects.create(name='Field {}'.format(index % 3), area=float(index % 2 + 1), farm=farm)
+
+	def setUp(self):
+		caches['default'].clear()
+		self.client.force_login(self.user)
+
+	def get(self, **params):
+		response = self.client.get('/manage/fields/', params)
+		return response.status_code, json.loads(response.content)
+
+	def expected(self, sort):
+		#-== @returns
+		# The primary keys of all records in the order of /sort , with the empty values
+		# after the others ascending and before them descending, then by primary key.
+
+		rows = list(Field.objects.values_list('pk', sort.lstrip('-')))
+		rows.sort(key=lambda row: (row[1] is None, row[1] or 0, row[0]), reverse=sort.startswith('-'))
+		return [row[0] for row in rows]
+
+	def read_pages(self, limit, **params):
+		#-== @returns
+		# The primary keys of the records on every page, and the number of pages.
+
+		pks = []
+		pages = 0
+		cursor = None
+		while True:
+			if cursor:
+				params['cursor'] = cursor
+			status, data = self.get(limit=limit, **params)
+			self.assertEqual(status, 200)
+			pages += 1
+			self.assertLessEqual(len(data['results']), limit)
+			pks.extend(row['pk'] for row in data['results'])
+			cursor = data['next']
+			if cursor is None:
+				return pks, pages
+
+	def check_sorts(self):
+		for sort in self.SORTS:
+			with self.subTest(sort=sort):
+				expected = self.expected(sort)
+				pks, pages = self.read_pages(3, sort=sort)
+				self.assertEqual(pks, expected)
+				self.assertEqual(pages, 7)
+				status, data = self.get(sort=sort)
+				self.assertEqual([row['pk'] for row in data], expected)
+
+	def test_sorts(self):
+		self.check_sorts()
+
+	@override_settings(FIELD_LISTING_TABLE=True)
+	def test_sorts_listing_table(self):
+		FieldListing.rebuild()
+		self.check_sorts()
+
+	def test_filtered_pages(self):
+		pks, pages = self.read_pages(2, sort='-area', farm__grower__state='KS')
+		expected = [pk for pk in self.expected('-area') if Field.objects.get(pk=pk).farm.grower.state == 'KS']
+		self.assertEqual(len(expected), 8)
+		self.assertEqual(pks, expected)
+
+	def test_exact_pages(self):
+		# the last full page has no cursor, rather than a cursor to an empty page
+		pks, pages = self.read_pages(5, sort='name')
+		self.assertEqual(len(pks), 20)
+		self.assertEqual(pages, 4)
+
+	def test_invalid_cursor(self):
+		status, data = self.get(limit=3, cursor='not a cursor')
+		self.assertEqual(status, 400)
+
+	def test_invalid_cursor_value(self):
+		# well-formed cursors whose values do not fit the types of the sorted field or the pk
+		for sort, keyset in [('area', ['abc', 1]), ('-area', ['abc', 1]), ('name', ['Field 1', 'abc']),
+				('pk', [[1], 1])]:
+			cursor = base64.urlsafe_b64encode(json.dumps(keyset).encode('utf-8')).decode('ascii')
+			for listing_table in (False, True):
+				with self.subTest(sort=sort, keyset=keyset, listing_table=listing_table), \
+						override_settings(FIELD_LISTING_TABLE=listing_table):
+					status, data = self.get(limit=3, sort=sort, cursor=cursor)
+					self.assertEqual(status, 400)
+
+	def test_invalid_sort(self):
+		status, data = self.get(limit=3, sort='farm__grower__created')
+		self.assertEqual(status, 400)
+
+	def test_invalid_limit(self):
+		for limit in ['0', '-1', 'ten']:
+			with self.subTest(limit=limit):
+				status, data = self.get(limit=limit)
+				self.assertEqual(status, 400)
+
+	@override_settings(FIELD_LIST_MAX_LIMIT=4)
+	def test_max_limit(self):
+		status, data = self.get(limit=100, sort='pk')
+		self.assertEqual(len(data['results']), 4)
+		self.assertIsNotNone(data['next'])
@@ -0,0 +1,118 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from field_mgmt.models import DatasetGeneration, Farm, Field, Grower
+from field_mgmt.views import FieldBatchRecords, FieldRecord, Index
+
+#-== @h1
+# Query Limit Tests
+#-== /field_mgmt.tests.test_query_limits.py
+#________________________________________
+
+
+#-== @class
+@override_settings(ASSERT_QUERY_COUNTS=True, FIELD_LISTING_TABLE=False)
+class QueryLimitTests(TransactionTestCase):
+	#-== Sends a request to each view with the /ASSERT_QUERY_COUNTS setting on, so a view
+	# which runs more queries than its /query_limits , such as a query per record, fails the test.
+	# Each request commits its own transaction, as it does when served,
+	# so the savepoints of a test transaction are not counted.
+
+	def setUp(self):
+		caches['default'].clear()
+		DatasetGeneration.current()
+		self.user = User.objects.create_user('tester', password='secret')
+		self.client.force_login(self.user)
+		# enough growers, farms and fields that a query per record goes over every limit
+		for grower_number in range(3):
+			grower = Grower.objects.create(name='Grower {}'.format(grower_number), state='KS')
+			for farm_number in range(3):
+				farm = Farm.objects.create(name='Farm {}'.format(farm_number), grower=grower)
+				for field_number in range(3):
+					Field.objects.create(name='Field {}'.format(field_number), area=10.0, farm=farm)
+		self.farm = Farm.objects.first()
+		self.field = Field.objects.first()
+
+	def send(self, method, path, data=None):
+		if data is None:
+			response = getattr(self.client, method)(path)
+		else:
+			response = getattr(self.client, method)(path, json.dumps(data), content_type='application/json')
+		self.assertEqual(response.status_code, 200)
+		return response
+
+	def test_farm_list(self):
+		self.send('get', '/manage/farms/')
+
+	def test_field_list(self):
+		self.assertEqual(len(json.loads(self.send('get', '/manage/fields/').content)), 27)
+		self.send('get', '/manage/fields/?limit=5&sort=-area')
+
+	@override_settings(FIELD_LISTING_TABLE=True)
+	def test_field_listing_table(self):
+		self.send('post', '/manage/fields/', {'pk': None, 'version': 0, 'name': 'New Field',
+			'area': 5.0, 'farm_id': self.farm.pk})
+		self.send('get', '/manage/fields/?limit=5')
+
+	@override_settings(STREAM_CHUNK_SIZE=10)
+	def test_field_list_stream(self):
+		# the records are read while the response is streamed, after the limit is checked,
+		# so the queries of the whole response are counted here: one per chunk of records
+		with CaptureQueriesContext(connection) as queries:
+			response = self.send('get', '/manage/fields/?stream=1')
+			records = json.loads(b''.join(response.streaming_content))
+		self.assertEqual(len(records), 27)
+		self.assertLessEqual(len(queries), Index.query_limits['get'] + 3)
+
+	def test_create_field(self):
+		self.send('post', '/manage/fields/', {'pk': None, 'version': 0, 'name': 'New Field',
+			'area': 5.0, 'farm_id': self.farm.pk})
+
+	def test_field_record(self):
+		path = '/manage/fields/{}/'.format(self.field.pk)
+		self.send('get', path)
+		data = json.loads(self.send('put', path, {'version': self.field.version, 'name': 'North Field',
+			'area': 12.0, 'farm_id': self.farm.pk}).content)
+		data = json.loads(self.send('patch', path, {'version': data['version'], 'area': 13.0}).content)
+		self.send('delete', path)
+
+	def test_batch(self):
+		fields = list(Field.objects.all()[:6])
+		operations = [{'op': 'create', 'data': {'name': 'New Field {}'.format(number),
+			'area': 5.0, 'farm_id': self.farm.pk}} for number in range(3)]
+		operations += [{'op': 'update', 'pk': field.pk, 'version': field.version, 'data': {'area': 20.0}}
+			for field in fields[:3]]
+		operations += [{'op': 'delete', 'pk': field.pk, 'version': field.version} for field in fields[3:]]
+		results = json.loads(self.send('post', '/manage/fields/batch/', operations).content)
+		self.assertEqual([result['status'] for result in results], ['ok'] * 9)
+		self.assertEqual(FieldBatchRecords.query_limits['post'], 12)
+
+	def test_limit_exceeded(self):
+		with mock.patch.object(FieldRecord, 'query_limits', {'get': 0}):
+			with self.assertRaisesRegex(AssertionError, 'FieldRecord GET ran 1 queries, the limit is 0'):
+				self.client.get('/manage/fields/{}/'.format(self.field.pk))
+
+
+#-== @class
+class FieldStrTests(TestCase):
+	#-== Tests that /Field.__str__ does not query the farm of the field.
+
+	@classmethod
+	def setUpTestData(cls):
+		grower = Grower.objects.create(name='Mary Calahan')
+		farm = Farm.objects.create(name='Coriander Fields', grower=grower)
+		cls.field = Field.objects.create(name='Field 1', area=10.0, farm=farm)
+
+	def test_str(self):
+		field = Field.objects.get(pk=self.field.pk)
+		with self.assertNumQueries(0):
+			self.assertEqual(str(field), 'Farm {} - Field 1'.format(field.farm_id))
+		field = Field.objects.select_related('farm').get(pk=self.field.pk)
+		with self.assertNumQueries(0):
+			self.assertEqual(str(field), 'Coriander Fields - Field 1')
@@ -0,0 +1,142 @@
+import json
+
+from concurrency.exceptions import RecordModifiedError
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from field_mgmt.models import DatasetGeneration, Farm, FarmRollup, Field, FieldListing, Grower
+
+#-== @h1
+# Versioned Update Tests
+#-== /field_mgmt.tests.test_versioned_update.py
+#________________________________________
+
+
+#-== @class
+@override_settings(FIELD_LISTING_TABLE=True)
+class VersionedUpdateTests(TestCase):
+	#-== Tests /ConcurrentModel.versioned_update with /Field records,
+	# and the tables kept in sync by the /post_save signal it sends.
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.grower = Grower.objects.create(name='Mary Calahan', state='KS')
+		cls.farm = Farm.objects.create(name='Coriander Fields', grower=cls.grower)
+		cls.other_farm = Farm.objects.create(name='Basil Acres', grower=cls.grower)
+		cls.field = Field.objects.create(name='Field 1', area=10.0, farm=cls.farm)
+		Field.objects.create(name='Field 2', area=5.0, farm=cls.farm)
+
+	def test_update(self):
+		obj = Field.versioned_update(self.field.pk, self.field.version, area=12.5)
+		self.assertEqual(obj.pk, self.field.pk)
+		self.assertEqual(obj.area, 12.5)
+		self.assertEqual(obj.version, self.field.version + 1)
+		stored = Field.objects.get(pk=self.field.pk)
+		self.assertEqual(stored.area, 12.5)
+		self.assertEqual(stored.version, self.field.version + 1)
+		self.assertGreater(stored.updated, self.field.updated)
+		self.assertEqual(stored.name, 'Field 1')
+
+	def test_stale_version(self):
+		Field.versioned_update(self.field.pk, self.field.version, area=12.5)
+		with self.assertRaises(RecordModifiedError):
+			Field.versioned_update(self.field.pk, self.field.version, area=20.0)
+		self.assertEqual(Field.objects.get(pk=self.field.pk).area, 12.5)
+
+	def test_missing_record(self):
+		with self.assertRaises(Field.DoesNotExist):
+			Field.versioned_update(self.field.pk + 1000, 1, area=12.5)
+
+	def test_previous_values(self):
+		obj = Field.versioned_update(self.field.pk, self.field.version, farm_id=self.other_farm.pk)
+		self.assertEqual(obj.farm_id, self.other_farm.pk)
+		self.assertEqual(obj.previous_farm_id, self.farm.pk)
+
+	def test_generation_bump(self):
+		generation = DatasetGeneration.current().value
+		Field.versioned_update(self.field.pk, self.field.version, area=12.5)
+		self.assertEqual(DatasetGeneration.current().value, generation + 1)
+
+	def test_failed_update_keeps_generation(self):
+		generation = DatasetGeneration.current().value
+		with self.assertRaises(RecordModifiedError):
+			Field.versioned_update(self.field.pk, self.field.version + 1, area=12.5)
+		self.assertEqual(DatasetGeneration.current().value, generation)
+
+	def test_field_listing(self):
+		FieldListing.rebuild()
+		Field.versioned_update(self.field.pk, self.field.version, name='North Field', farm_id=self.other_farm.pk)
+		row = FieldListing.objects.get(pk=self.field.pk)
+		self.assertEqual(row.name, 'North Field')
+		self.assertEqual(row.farm_id, self.other_farm.pk)
+		self.assertEqual(row.farm_name, 'Basil Acres')
+		self.assertEqual(row.grower_name, 'Mary Calahan')
+
+	def test_farm_rollup(self):
+		FarmRollup.rebuild()
+		Field.versioned_update(self.field.pk, self.field.version, area=30.0, farm_id=self.other_farm.pk)
+		# the field is counted in its new farm and no longer in its previous farm
+		old_rollup = FarmRollup.objects.get(farm=self.farm)
+		self.assertEqual(old_rollup.field_count, 1)
+		self.assertEqual(old_rollup.total_area, 5.0)
+		new_rollup = FarmRollup.objects.get(farm=self.other_farm)
+		self.assertEqual(new_rollup.field_count, 1)
+		self.assertEqual(new_rollup.total_area, 30.0)
+
+
+#-== @class
+class FieldRecordUpdateTests(TransactionTestCase):
+	#-== Tests the HTTP status of the /PUT and /PATCH requests of /FieldRecord .
+	# Each request commits its own transaction, as it does when served, so the
+	# deferred foreign key constraints are checked and the queries are counted as usual.
+
+	def setUp(self):
+		caches['default'].clear()
+		DatasetGeneration.current()
+		self.user = User.objects.create_user('tester', password='secret')
+		grower = Grower.objects.create(name='Mary Calahan')
+		self.farm = Farm.objects.create(name='Coriander Fields', grower=grower)
+		self.field = Field.objects.create(name='Field 1', area=10.0, farm=self.farm)
+		self.client.force_login(self.user)
+
+	def send(self, method, pk, data):
+		return getattr(self.client, method)('/manage/fields/{}/'.format(pk),
+			json.dumps(data), content_type='application/json')
+
+	def test_put(self):
+		response = self.send('put', self.field.pk, {'version': self.field.version,
+			'name': 'North Field', 'area': 11.0, 'farm_id': self.farm.pk})
+		self.assertEqual(response.status_code, 200)
+		data = json.loads(response.content)
+		self.assertEqual(data['name'], 'North Field')
+		self.assertEqual(data['version'], self.field.version + 1)
+		self.assertEqual(data['farm']['name'], 'Coriander Fields')
+
+	def test_patch(self):
+		response = self.send('patch', self.field.pk, {'version': self.field.version, 'area': 11.0})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(Field.objects.get(pk=self.field.pk).name, 'Field 1')
+
+	def test_stale_version(self):
+		self.send('patch', self.field.pk, {'version': self.field.version, 'area': 11.0})
+		response = self.send('patch', self.field.pk, {'version': self.field.version, 'area': 12.0})
+		self.assertEqual(response.status_code, 409)
+		self.assertEqual(Field.objects.get(pk=self.field.pk).area, 11.0)
+
+	def test_missing_record(self):
+		response = self.send('patch', self.field.pk + 1000, {'version': 1, 'area': 11.0})
+		self.assertEqual(response.status_code, 404)
+
+	def test_missing_version(self):
+		response = self.send('patch', self.field.pk, {'area': 11.0})
+		self.assertEqual(response.status_code, 400)
+
+	def test_invalid_area(self):
+		response = self.send('patch', self.field.pk, {'version': self.field.version, 'area': 0})
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(Field.objects.get(pk=self.field.pk).version, self.field.version)
+
+	def test_missing_farm(self):
+		response = self.send('patch', self.field.pk, {'version': self.field.version, 'farm_id': self.farm.pk + 1000})
+		self.assertEqual(response.status_code, 400)
@@ -5,6 +5,10 @@ from field_mgmt import views
 urlpatterns = [
 	path('farms/', views.FarmList.as_view(), name = 'farm_list'),
     path('fields/', views.Index.as_view(), name = 'all_fields'),
+    path('fields/batch/', views.FieldBatchRecords.as_view(), name = 'field_batch'),
     path('fields/<int:pk>/', views.FieldRecord.as_view(), name = 'single_field'),
+    path('summary/<str:group>/', views.FieldSummary.as_view(), name = 'field_summary'),
+    path('export/', views.ExportData.as_view(), name = 'export'),
     path('import/', views.ImportData.as_view(), name = 'import'),
+    path('import/jobs/<int:pk>/', views.ImportJobStatus.as_view(), name = 'import_job'),
 ]
@@ -1,9 +1,23 @@
-import csv, json
-
-from django.http import HttpResponse
-
-from core.views import BaseView, CrudMixin
-from field_mgmt.models import Grower, Farm, Field
+import codecs, csv, io, json, os
+from contextlib import ExitStack
+from itertools import islice
+
+from concurrency.exceptions import RecordModifiedError
+from django.conf import settings
+from django.core.files import File
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, StreamingHttpResponse
+
+from core.profiling import PROFILE_FORMATS, profile_to_file
+from core.serializers import dumps, get_serializer
+from core.views import AsyncBaseView, AsyncCrudMixin, BaseView, CrudMixin
+from field_mgmt.batch import FieldBatch
+from field_mgmt.importer import BulkImporter, CopyImporter, ParallelImporter, UpsertImporter
+from field_mgmt.jobs import fail_stale_jobs, submit_job
+from field_mgmt.models import DatasetGeneration, Farm, Field, FieldListing, ImportJob
 
 #-== @h1
 # Field Management Views
@@ -11,26 +25,39 @@ from field_mgmt.models import Grower, Farm, Field
 #________________________________________
 
 #-== @class
-class FarmList(BaseView, CrudMixin):
+class FarmList(AsyncBaseView, AsyncCrudMixin):
 	#-== Provides a list of /Farm objects.
 
+	query_limits = {'get': 2}
+
 	#-==@method
 	# GET
 	#-== Provides a list of all /Farm objects in the database.
+	# If the /stream query parameter is set, the list is streamed with /AsyncCrudMixin.astream_json .
+	# Responses are cached until the data changes, see /CrudMixin.cached_response .
+	# The database is read with the async ORM, see /AsyncBaseView .
 
-	def get(self, request, *args, **kwargs):
+	async def get(self, request, *args, **kwargs):
+		generation = await DatasetGeneration.acurrent()
+		return await self.acached_response(request, generation.value, generation.updated,
+			lambda: self.list_farms(request))
+
+	#-== @method
+	async def list_farms(self, request):
+		#-== Builds the response with the list of /Farm objects.
+		# The rows are serialized by the /CompiledSerializer , without creating model objects.
+
+		serializer = get_serializer(Farm, depth=2)
 		qs = Farm.objects.all()
-		qs = qs.select_related('grower')
-		results = []
-		for obj in qs:
-			data = obj.to_data(depth=2)
-			results.append(data)
-		datastr = json.dumps(results)
+		if request.GET.get('stream'):
+			return self.astream_json(request, serializer.rows(qs), serializer.build)
+		results = await serializer.aserialize(qs)
+		datastr = dumps(results)
 		return HttpResponse(datastr)
 
 
 #-== @class
-class Index(BaseView, CrudMixin):
+class Index(AsyncBaseView, AsyncCrudMixin):
 	#-== Provides a list of field records,
 	# as well as the ability to create a new field record.
 
@@ -38,18 +65,73 @@ class Index(BaseView, CrudMixin):
 		   'farm__grower__name', 'farm__grower__street_addr',
 		   'farm__grower__city', 'farm__grower__state',
 		   'farm__grower__zip_code', 'farm__grower__country']
-	
+	DEFAULT_SORT = 'farm__grower__name'
+	query_limits = {'get': 2, 'post': 9}
+
 
 	#-==@method
 	# GET
 	#-== Provides a list of all /Field objects in the database.
+	# The list can be filtered, sorted and paginated with query parameters:
+	# @deflist
+	# sort: one of the /RECORD_FIELDS , prefixed with /- to sort descending (default: /farm__grower__name )
+	# limit: the number of records on a page, up to the /FIELD_LIST_MAX_LIMIT setting
+	# cursor: the /next value from the previous page
+	# <field>[__<lookup>]: a filter on one of the /RECORD_FIELDS , see /CrudMixin.filter_queryset
+	#
+	#-== Without /limit the response is a list of every matching record,
+	# which is streamed with /AsyncCrudMixin.astream_json if the /stream parameter is set.
+	# With /limit the response is an object with the page of records in /results
+	# and the cursor of the next page in /next , which is /null on the last page.
+	#
+	#-== Responses are cached until the data changes, see /CrudMixin.cached_response .
+	# When the /FIELD_LISTING_TABLE setting is enabled, the records are read from
+	# the flattened /FieldListing table instead of joining the /Field , /Farm and /Grower tables.
+	# The database is read with the async ORM, see /AsyncBaseView .
+
+	async def get(self, request, *args, **kwargs):
+		generation = await DatasetGeneration.acurrent()
+		return await self.acached_response(request, generation.value, generation.updated,
+			lambda: self.list_records(request))
+
+	#-== @method
+	async def list_records(self, request):
+		#-== Builds the response with the list of /Field records for the query parameters.
 
-	def get(self, request, *args, **kwargs):
 		# get all records according to filters and sorting
-		qs = Field.objects.all()
-		qs = qs.select_related('farm', 'farm__grower')
-		data = list(qs.values(*self.RECORD_FIELDS))
-		datastr = json.dumps(data)
+		if FieldListing.enabled():
+			qs = FieldListing.records()
+		else:
+			qs = Field.objects.all()
+		qs = self.filter_queryset(qs, request.GET, self.RECORD_FIELDS)
+		if qs is None:
+			return self.http_error(status_code=400)
+		sort = request.GET.get('sort', self.DEFAULT_SORT)
+		qs = self.sort_queryset(qs, sort, self.RECORD_FIELDS)
+		if qs is None:
+			return self.http_error(status_code=400)
+
+		if 'limit' not in request.GET:
+			serializer = get_serializer(Field, fields=tuple(self.RECORD_FIELDS))
+			if request.GET.get('stream'):
+				return self.astream_json(request, serializer.rows(qs), serializer.build)
+			data = await serializer.aserialize(qs)
+		else:
+			qs = qs.values(*self.RECORD_FIELDS)
+			try:
+				limit = int(request.GET['limit'])
+			except ValueError:
+				limit = 0
+			if limit < 1:
+				self.log_error('Invalid limit: {}'.format(request.GET['limit']))
+				return self.http_error(status_code=400)
+			limit = min(limit, getattr(settings, 'FIELD_LIST_MAX_LIMIT', 1000))
+			page = await self.apaginate_queryset(qs, sort, limit, request.GET.get('cursor'))
+			if page is None:
+				return self.http_error(status_code=400)
+			rows, next_cursor = page
+			data = {'results': rows, 'next': next_cursor}
+		datastr = dumps(data)
 		return HttpResponse(datastr)
 
 	#-==@method
@@ -65,68 +147,102 @@ class Index(BaseView, CrudMixin):
 		self.validate_model_obj(newobj)
 		if self.errors:
 			return self.http_error(status_code=400)
-		newobj.save()
+		# the listing and the rollup are refreshed by the post_save receivers,
+		# in the same transaction as the new field
+		with transaction.atomic():
+			newobj.save()
+		newobj = self.depth_queryset(Field, depth=2).get(pk=newobj.pk)
 		objdata = newobj.to_data(depth=2)
-		datastr = json.dumps(objdata)
+		datastr = dumps(objdata)
 		return HttpResponse(datastr)
 
 
 #-== @class
-class FieldRecord(BaseView, CrudMixin):
+class FieldRecord(AsyncBaseView, AsyncCrudMixin):
 	#-== Provide information for a single /Field object,
 	# as well as the ability to create, update and delete the /Field object.
 
+	query_limits = {'get': 1, 'put': 9, 'patch': 9, 'delete': 7}
+
 	#-==@method
 	# GET
-	#-== Provides the data of a single /Field object.
+	#-== Provides the data of a single /Field object,
+	# read with the async ORM (see /AsyncBaseView ).
 	# @params
 	# pk: the primary key of the field, read from the URL
 
-	def get(self, request, pk, *args, **kwargs):
+	async def get(self, request, pk, *args, **kwargs):
 		# show a single field record
-		obj = Field.objects.get(pk=pk)
+		obj = await self.depth_queryset(Field, depth=2).aget(pk=pk)
 		data = obj.to_data(depth=2)
-		datastr = json.dumps(data)
+		datastr = dumps(data)
 		return HttpResponse(datastr)
 	
 	#-==@method
 	# PUT
 	#-== Update all fields of a /Field object.
+	# The JSON data must include the /version the change is based on,
+	# see /update_record .
 	# @params
 	# pk: the primary key of the field, read from the URL
 
 	def put(self, request, pk, *args, **kwargs):
 		# update all data in a field record
-		obj = Field.objects.get(pk=pk)
 		data = json.loads(request.body)
-		data['pk'] = pk
-		newobj = Field(**data)
-		self.validate_model_obj(newobj)
-		if self.errors:
-			return self.http_error(status_code=400)
-		newobj.save()
-		objdata = newobj.to_data(depth=2)
-		datastr = json.dumps(objdata)
-		return HttpResponse(datastr)
+		return self.update_record(pk, data, FieldBatch.EDITABLE_FIELDS)
 
 	#-==@method
 	# PATCH
 	#-== Update some fields of a /Field object.
+	# The JSON data must include the /version the change is based on,
+	# see /update_record .
 	# @params
 	# pk: the primary key of the field, read from the URL
 
 	def patch(self, request, pk, *args, **kwargs):
 		# update partial data in a field record
-		obj = Field.objects.get(pk=pk)
 		data = json.loads(request.body)
-		for key, val in data.items():
-			setattr(obj, key, val)
-		self.validate_model_obj(obj)
+		fields = [key for key in FieldBatch.EDITABLE_FIELDS if key in data]
+		return self.update_record(pk, data, fields)
+
+	#-== @method
+	def update_record(self, pk, data, fields):
+		#-== Validates the /fields of /data and writes them with /ConcurrentModel.versioned_update ,
+		# a single conditional /UPDATE which returns the new row.
+		# The farm is not looked up during validation, the foreign key constraint
+		# of the database rejects a farm which does not exist.
+		# @returns
+		# The response with the updated /Field data, or an error response with HTTP status
+		# 400 if the data is invalid, 404 if there is no such field,
+		# or 409 if the field has been modified since /version .
+
+		version = data.get('version')
+		if not isinstance(version, int):
+			self.log_error('version: is required')
+			return self.http_error(status_code=400)
+		obj = Field(pk=pk, **{key: data.get(key) for key in fields})
+		obj._state.adding = False
+		exclude = ['farm'] + [field.name for field in Field._meta.fields if field.attname not in fields]
+		self.validate_model_obj(obj, exclude=exclude)
+		if 'farm_id' in fields and obj.farm_id is None:
+			self.log_error('farm: This field cannot be null.')
 		if self.errors:
 			return self.http_error(status_code=400)
-		obj.save()
+
+		try:
+			obj = Field.versioned_update(pk, version, **{key: getattr(obj, key) for key in fields})
+		except Field.DoesNotExist as exc:
+			self.log_error(str(exc))
+			return self.http_error(status_code=404)
+		except RecordModifiedError:
+			self.log_error('Record has been modified since version {}'.format(version))
+			return self.http_error(status_code=409)
+		except IntegrityError:
+			self.log_error('farm: farm instance with id {} does not exist.'.format(obj.farm_id))
+			return self.http_error(status_code=400)
+		obj.farm = Farm.objects.select_related('grower').get(pk=obj.farm_id)
 		objdata = obj.to_data(depth=2)
-		datastr = json.dumps(objdata)
+		datastr = dumps(objdata)
 		return HttpResponse(datastr)
 
 	#-==@method
@@ -137,13 +253,239 @@ class FieldRecord(BaseView, CrudMixin):
 
 	def delete(self, request, pk, *args, **kwargs):
 		# delete a field record
-		obj = Field.objects.get(pk=pk)
+		obj = self.depth_queryset(Field, depth=2).get(pk=pk)
 		objdata = obj.to_data(depth=2)
 		obj.delete()
-		datastr = json.dumps(objdata)
+		datastr = dumps(objdata)
 		return HttpResponse(datastr)
 
 
+#-== @class
+class FieldBatchRecords(BaseView, CrudMixin):
+	#-== Applies many changes to /Field objects in a single request.
+
+	query_limits = {'post': 12}
+
+	#-==@method
+	# POST
+	#-== Applies a JSON list of create, update and delete operations with the /FieldBatch .
+	# The operations are applied in one transaction, and the response
+	# is a JSON list with the result of each operation in the same order.
+	# Operations which are invalid, refer to a missing record, or have an outdated
+	# /version are reported in their result and are not applied.
+
+	def post(self, request, *args, **kwargs):
+		try:
+			operations = json.loads(request.body)
+		except ValueError:
+			self.log_error('The batch is not valid JSON')
+			return self.http_error(status_code=400)
+		batch = FieldBatch(logger=self.logger)
+		if not batch.check_operations(operations):
+			self.errors = batch.errors
+			return self.http_error(status_code=400)
+		results = batch.apply(operations)
+		datastr = dumps(results)
+		return HttpResponse(datastr)
+
+
+#-== @class
+class FieldSummary(BaseView, CrudMixin):
+	#-== Provides the total area, field count and farm count of the fields,
+	# grouped by grower, farm, state or country.
+
+	GROUPS = {
+		'grower': ['grower_id', 'grower__name'],
+		'farm': ['pk', 'name', 'grower_id', 'grower__name'],
+		'state': ['grower__state'],
+		'country': ['grower__country'],
+	}
+	query_limits = {'get': 2}
+
+	#-==@method
+	# GET
+	#-== Provides a JSON list with a row for each group, holding the group columns
+	# and the /total_area , /field_count and /farm_count of the group.
+	# @params
+	# group: one of the /GROUPS , read from the URL
+	#
+	#-== The summary is a single /-GROUP BY-/ query over the farms and their /FarmRollup ,
+	# which holds the field count and area of each farm and is recounted whenever its fields change.
+	# Responses are cached until the data changes, see /CrudMixin.cached_response .
+
+	def get(self, request, group, *args, **kwargs):
+		columns = self.GROUPS.get(group)
+		if columns is None:
+			self.log_error('Unsupported summary group: {}'.format(group))
+			return self.http_error(status_code=404)
+		generation = DatasetGeneration.current()
+		return self.cached_response(request, generation.value, generation.updated,
+			lambda: self.summarize(columns))
+
+	#-== @method
+	def summarize(self, columns):
+		#-== Builds the response with the summary of the farms grouped by /columns .
+
+		qs = (Farm.objects.values(*columns)
+			.annotate(total_area=Coalesce(Sum('rollup__total_area'), 0.0),
+				field_count=Coalesce(Sum('rollup__field_count'), 0),
+				farm_count=Count('pk'))
+			.order_by(*columns))
+		datastr = dumps(list(qs))
+		return HttpResponse(datastr)
+
+
+#-== @class
+class ExportData(AsyncBaseView, AsyncCrudMixin):
+	#-== Exports the grower, farm and field data in the same column layout
+	# that /ImportData accepts, so an export can be imported again.
+	# @attributes
+	# EXPORT_COLUMNS: the exported columns paired with the field they are read from
+
+	EXPORT_COLUMNS = [
+		('grower_name', 'farm__grower__name'),
+		('street_addr', 'farm__grower__street_addr'),
+		('city', 'farm__grower__city'),
+		('state', 'farm__grower__state'),
+		('zip_code', 'farm__grower__zip_code'),
+		('country', 'farm__grower__country'),
+		('farm_name', 'farm__name'),
+		('field_name', 'name'),
+		('area', 'area'),
+	]
+	CSV = 'csv'
+	NDJSON = 'ndjson'
+
+	#-==@method
+	# GET
+	#-== Streams every /Field record, joined with its farm and grower.
+	# The records can be filtered in the same way as the /Index list.
+	# @params
+	# format: /csv (default) or /ndjson , one JSON object per line
+	#
+	#-== The records are read with a server-side cursor and written as they are read.
+	# With Postgres and the /EXPORT_USE_COPY setting, CSV exports are produced
+	# by the database with /-COPY ... TO STDOUT-/ instead of the ORM.
+	#
+	#-== Under ASGI the response is an asynchronous generator, which reads each chunk
+	# in the thread of the request (see /AsyncCrudMixin.aread_chunks ) and sends it before
+	# reading the next, as Django would read a synchronous generator whole before sending it.
+	# Under WSGI the response is a synchronous generator, for the same reason as /AsyncCrudMixin.astream_json .
+
+	async def get(self, request, *args, **kwargs):
+		export_format = request.GET.get('format', self.CSV)
+		if export_format not in [self.CSV, self.NDJSON]:
+			self.log_error('Unsupported export format: {}'.format(export_format))
+			return self.http_error(status_code=400)
+		qs = Field.objects.all()
+		qs = self.filter_queryset(qs, request.GET, Index.RECORD_FIELDS)
+		if qs is None:
+			return self.http_error(status_code=400)
+		qs = qs.order_by('pk').values_list(*[field for column, field in self.EXPORT_COLUMNS])
+
+		is_async = isinstance(request, ASGIRequest)
+		if export_format == self.NDJSON:
+			content = self.agenerate_ndjson(qs) if is_async else self.generate_ndjson(qs)
+			response = StreamingHttpResponse(content, content_type='application/x-ndjson')
+		elif connection.vendor == 'postgresql' and getattr(settings, 'EXPORT_USE_COPY', True):
+			content = self.agenerate_copy_csv(qs) if is_async else self.generate_copy_csv(qs)
+			response = StreamingHttpResponse(content, content_type='text/csv')
+		else:
+			content = self.agenerate_csv(qs) if is_async else self.generate_csv(qs)
+			response = StreamingHttpResponse(content, content_type='text/csv')
+		response['Content-Disposition'] = 'attachment; filename="fields.{}"'.format(export_format)
+		return response
+
+	#-== @method
+	def columns(self):
+		#-== @returns
+		# The list of exported column names.
+
+		return [column for column, field in self.EXPORT_COLUMNS]
+
+	#-== @method
+	def csv_text(self, rows):
+		#-== @returns
+		# The /rows written as CSV lines.
+
+		buffer = io.StringIO()
+		csv.writer(buffer, lineterminator='\n').writerows(rows)
+		return buffer.getvalue()
+
+	#-== @method
+	def ndjson_text(self, rows):
+		#-== @returns
+		# The /rows written as JSON objects, one per line.
+
+		columns = self.columns()
+		return ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+
+	#-== @method
+	def generate_csv(self, qs):
+		#-== Yields the CSV header and then the rows of /qs , a chunk at a time.
+
+		chunk_size = getattr(settings, 'STREAM_CHUNK_SIZE', 2000)
+		yield self.csv_text([self.columns()])
+		rows = qs.iterator(chunk_size=chunk_size)
+		while True:
+			chunk = list(islice(rows, chunk_size))
+			if not chunk:
+				break
+			yield self.csv_text(chunk)
+
+	#-== @method
+	async def agenerate_csv(self, qs):
+		#-== The asynchronous version of /generate_csv .
+
+		chunk_size = getattr(settings, 'STREAM_CHUNK_SIZE', 2000)
+		yield self.csv_text([self.columns()])
+		async for chunk in self.aread_chunks(qs.iterator(chunk_size=chunk_size), chunk_size):
+			yield self.csv_text(chunk)
+
+	#-== @method
+	def generate_ndjson(self, qs):
+		#-== Yields the rows of /qs as JSON objects, one per line, a chunk at a time.
+
+		chunk_size = getattr(settings, 'STREAM_CHUNK_SIZE', 2000)
+		rows = qs.iterator(chunk_size=chunk_size)
+		while True:
+			chunk = list(islice(rows, chunk_size))
+			if not chunk:
+				break
+			yield self.ndjson_text(chunk)
+
+	#-== @method
+	async def agenerate_ndjson(self, qs):
+		#-== The asynchronous version of /generate_ndjson .
+
+		chunk_size = getattr(settings, 'STREAM_CHUNK_SIZE', 2000)
+		async for chunk in self.aread_chunks(qs.iterator(chunk_size=chunk_size), chunk_size):
+			yield self.ndjson_text(chunk)
+
+	#-== @method
+	def generate_copy_csv(self, qs):
+		#-== Yields the CSV header and then the output of a Postgres
+		# /-COPY (SELECT ...) TO STDOUT-/ of the query for /qs .
+
+		yield self.csv_text([self.columns()]).encode('utf-8')
+		sql, params = qs.query.sql_with_params()
+		with connection.cursor() as cursor:
+			with cursor.cursor.copy('COPY ({}) TO STDOUT WITH (FORMAT csv)'.format(sql), params) as copy:
+				for block in copy:
+					yield bytes(block)
+
+	#-== @method
+	async def agenerate_copy_csv(self, qs):
+		#-== The asynchronous version of /generate_copy_csv .
+		# The /COPY runs on the synchronous connection of the request, so the blocks
+		# of /generate_copy_csv are read in its thread, a chunk of blocks at a time.
+		# Postgres sends a block for each row.
+
+		chunk_size = getattr(settings, 'STREAM_CHUNK_SIZE', 2000)
+		async for chunk in self.aread_chunks(self.generate_copy_csv(qs), chunk_size):
+			yield b''.join(chunk)
+
+
 #-== @class
 class ImportData(BaseView, CrudMixin):
 	#-== Allows a user to import CSV data into the database.
@@ -162,165 +504,145 @@ class ImportData(BaseView, CrudMixin):
 	# then the record is rejected and not stored in the database.
 	# Each record is considered individually and
 	# only rejected records will not be imported to the database.
+	#
+	#-== The rows are resolved and written in batches by the /BulkImporter ,
+	# the size of which is set with the /IMPORT_BATCH_SIZE setting.
 
 	#-==@method
 	# POST
-	#-== Imports CSV data received in the request body.
+	#-== Imports CSV data received in the request body,
+	# or in the /file field of a multipart form upload.
 	# The response will be JSON data with details and errors about the import.
+	#
+	#-== The upload is decoded and parsed as it is read from the request,
+	# and the rows are passed to the database in batches,
+	# so the whole file is never held in memory.
+	# If a record is not valid UTF-8 or CSV, the import stops at that record
+	# and reports it in the /errors , and the records before it are kept
+	# (see /BulkImporter.import_csv ).
+	#
+	#-== If the /background query parameter is set, the upload is stored
+	# as an /ImportJob and the response is sent right away with HTTP status 202
+	# and the job data. The progress of the import can then be polled with /ImportJobStatus .
+	#
+	#-== The /mode query parameter selects how the rows are imported:
+	# @deflist
+	# batch: (default) the rows are imported in batches by the /BulkImporter
+	# parallel: the rows are sharded by grower and imported by a pool of processes with the /ParallelImporter
+	# copy: the rows are loaded with Postgres /COPY and merged with set-based SQL by the /CopyImporter
+	# upsert: the rows are written with /-INSERT ... ON CONFLICT-/ by the /UpsertImporter ,
+	# which requires the unique natural keys, see /field_mgmt.natural_keys.py
+	#
+	#-== The response includes the /timings of the import: the time and the number of queries
+	# of the whole import, and of each of its stages, such as parsing the CSV, validating the rows,
+	# and looking up and writing the growers, farms and fields (see /ImportTimings ).
+	# If a staff user sets the /profile query parameter to /cprofile or /speedscope , the import is also
+	# profiled in that format (see /core.profiling.py ) and the name of the profile file,
+	# in the directory of the /IMPORT_PROFILE_DIR setting, is sent under /profile .
+
+	IMPORT_MODES = {
+		'batch': BulkImporter,
+		'parallel': ParallelImporter,
+		'copy': CopyImporter,
+		'upsert': UpsertImporter,
+	}
 
 	def post(self, request, *args, **kwargs):
 		# import CSV data as new field records
-		records_read = 0
-		records_processed = 0
-		success = True
-		importdata = request.body.decode('utf-8')
-		reader = csv.DictReader(importdata.splitlines())
-
-		if self.check_required_columns(reader.fieldnames):
-			for row in reader:
-				records_read += 1
-
-				grower = self.get_grower(row)
-				if grower is None:
-					continue
-
-				farm = self.get_farm(row, grower)
-				if farm is None:
-					continue
-
-				field = self.get_field(row, farm)
-				if field is not None:
-					records_processed += 1
-
-		if self.errors:
-			success = False
-		data = {
-			'records_read': records_read,
-			'records_processed': records_processed,
-			'success': success,
-			'errors': self.errors,
-		}
-		datastr = json.dumps(data)
+		if request.GET.get('background'):
+			return self.submit_background(request)
+		lines = self.read_lines(request)
+		if lines is None:
+			return self.http_error(status_code=400)
+		importer_class = self.IMPORT_MODES.get(request.GET.get('mode', 'batch'))
+		if importer_class is None:
+			self.log_error('Unsupported import mode: {}'.format(request.GET['mode']))
+			return self.http_error(status_code=400)
+		profile = request.GET.get('profile')
+		if profile and not getattr(settings, 'IMPORT_PROFILE_DIR', None):
+			self.log_error('Import profiling is not enabled')
+			return self.http_error(status_code=400)
+		if profile and not request.user.is_staff:
+			self.log_error('Only staff users can profile imports')
+			return self.http_error(status_code=403)
+		if profile and profile not in PROFILE_FORMATS:
+			self.log_error('Unsupported profile format: {}'.format(profile))
+			return self.http_error(status_code=400)
+		reader = csv.DictReader(lines)
+		importer = importer_class(logger=self.logger)
+		results = self.run_import(importer, reader, profile)
+		self.errors = importer.errors
+		datastr = dumps(results)
 		return HttpResponse(datastr)
 
 	#-== @method
-	def set_value(self, obj, row, field_name):
-		#-== Checks the /row for a /field_name and updates the /obj if it finds it.
-
-		if field_name in row.keys():
-			setattr(obj, field_name, row[field_name])
-
-	#-== @method
-	def get_grower(self, row):
-		#-== Tries to identify a /Grower object which matches the /grower_name in the /row .
-		# If no /Grower object is found, it creates a new one, and populates the data from /row .
-		# If multiple /Grower objects have the same name, it rejects the record.
-		# @returns
-		# A /Grower object, or if the record is to be rejected, returns /None .
-
-		grower_name = row['grower_name']
-		grower = None
-		existing_growers = Grower.objects.filter(name=grower_name)
-		if len(existing_growers) == 0:
-			self.logger.info('No grower with name, creating new grower: {}'.format(grower_name))
-			grower = Grower(name=grower_name)
-			self.set_value(grower, row, 'street_addr')
-			self.set_value(grower, row, 'city')
-			self.set_value(grower, row, 'state')
-			self.set_value(grower, row, 'zip_code')
-			self.set_value(grower, row, 'country')
-			if self.validate_model_obj(grower):
-				grower.save()
-			else:
-				grower = None
-		elif len(existing_growers) > 1:
-			self.log_error('Multiple growers with name: {}'.format(grower_name))
-		elif len(existing_growers) == 1:
-			grower = existing_growers[0]
-		return grower
-	
-	#-== @method
-	def get_farm(self, row, grower):
-		#-== Tries to identify a /Farm object which matches the /farm_name in the /row .
-		# If no /Farm object is found, it creates a new one, and populates the data from /row .
-		# If multiple /Farm objects have the same name, it rejects the record.
-		# @returns
-		# A /Farm object, or if the record is to be rejected, returns /None .
-
-		farm_name = row['farm_name']
-		farm = None
-		existing_farms = grower.farm_set.filter(name=farm_name)
-		if len(existing_farms) == 0:
-			self.logger.info('No farm with name, creating new farm: {}'.format(farm_name))
-			farm = Farm(name=farm_name, grower=grower)
-			if self.validate_model_obj(farm):
-				farm.save()
-			else:
-				farm = None
-		elif len(existing_farms) > 1:
-			self.log_error('Multiple farms with name: {}'.format(farm_name))
-		elif len(existing_farms) == 1:
-			farm = existing_farms[0]
-		return farm
-	
-	#-== @method
-	def get_field(self, row, farm):
-		#-== Tries to identify a /Field object which matches the /field_name in the /row .
-		# If no /Field object is found, it creates a new one, and populates the data from /row .
-		# If multiple /Field objects have the same name, it rejects the record.
+	def run_import(self, importer, reader, profile=None):
+		#-== Imports the rows of the CSV /reader with the /importer ,
+		# profiling the import in the /profile format if it is set.
 		# @returns
-		# A /Field object, or if the record is to be rejected, returns /None .
-
-		field_name = row['field_name']
-		field = None
-		existing_fields = farm.field_set.filter(name=field_name)
-		if len(existing_fields) == 0:
-			self.logger.warning('No field with name, creating new field: {}'.format(field_name))
-			area = row['area']
-			field = Field(name=field_name, area=area, farm=farm)
-			if self.validate_model_obj(field):
-				field.save()
-			else:
-				field = None
-		elif len(existing_fields) > 1:
-			self.log_error('Multiple field with name: {}'.format(field_name))
-		elif len(existing_fields) == 1:
-			field = existing_fields[0]
-			field.area = row['area']
-			if self.validate_model_obj(field):
-				field.save()
-			else:
-				field = None
-		return field
-	
+		# The /results of the /importer , with the name of the profile file under /profile .
+
+		path = None
+		with ExitStack() as stack:
+			if profile:
+				path = stack.enter_context(profile_to_file(profile, settings.IMPORT_PROFILE_DIR, 'import',
+					getattr(settings, 'IMPORT_PROFILE_MAX_EVENTS', None)))
+			with importer.timings.measure():
+				importer.import_csv(reader)
+		results = importer.results()
+		if path is not None:
+			results['profile'] = os.path.basename(path)
+		return results
+
 	#-== @method
-	def check_required_columns(self, columns):
-		#-== Checks that all column names required for the import
-		# are in the /columns parameter.
+	def read_lines(self, request):
+		#-== Provides the lines of the uploaded CSV data as they are read from the request.
+		# Multipart uploads are read from the /file field, which Django
+		# spools to a temporary file on disk when it is large.
 		# @returns
-		# /True if all required names are found, or /False if not.
-
-		passed = True
-		if 'grower_name' not in columns:
-			passed = False
-			self.log_error('No "grower_name" column defined')
-		if 'farm_name' not in columns:
-			self.log_error('No "farm_name" column defined')
-			passed = False
-		if 'field_name' not in columns:
-			self.log_error('No "field_name" column defined')
-			passed = False
-		if 'area' not in columns:
-			self.log_error('No area column defined')
-			passed = False
-		return passed
-
-
+		# An iterator of decoded lines, or /None if no file was uploaded.
 
+		if request.content_type == 'multipart/form-data':
+			stream = request.FILES.get('file')
+			if stream is None:
+				self.log_error('No "file" uploaded')
+				return None
+		else:
+			stream = request
+		return codecs.iterdecode(stream, 'utf-8')
 
+	#-== @method
+	def submit_background(self, request):
+		#-== Stores the upload as a new /ImportJob and queues it for a background worker.
+
+		if request.content_type == 'multipart/form-data':
+			upload = request.FILES.get('file')
+			if upload is None:
+				self.log_error('No "file" uploaded')
+				return self.http_error(status_code=400)
+		else:
+			upload = File(request, name='import.csv')
+		job = ImportJob()
+		job.upload.save(upload.name, upload)
+		submit_job(job)
+		datastr = dumps(job.to_data())
+		return HttpResponse(datastr, status=202)
 
-			
 
+#-== @class
+class ImportJobStatus(BaseView, CrudMixin):
+	#-== Provides the progress of a background import.
 
-				
+	#-==@method
+	# GET
+	#-== Provides the status, counters and errors of an /ImportJob .
+	# A running job without progress for /IMPORT_JOB_STALE_SECONDS is reported as failed (see /fail_stale_jobs ).
+	# @params
+	# pk: the primary key of the import job, read from the URL
 
+	def get(self, request, pk, *args, **kwargs):
+		job = ImportJob.objects.get(pk=pk)
+		if job.status == ImportJob.RUNNING and fail_stale_jobs(job.pk):
+			job.refresh_from_db()
+		datastr = dumps(job.to_data())
+		return HttpResponse(datastr)
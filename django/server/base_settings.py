@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -121,4 +122,118 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGOUT_REDIRECT_URL = None
 
-DATA_UPLOAD_MAX_MEMORY_SIZE = 144000000
+# Number of CSV rows resolved and written together by the bulk import, in one transaction
+IMPORT_BATCH_SIZE = 1000
+
+# Uploaded files, such as CSV files for background imports
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Who processes background imports: 'thread' runs them in the web server process,
+# 'queue' leaves them for the `manage.py process_imports` worker
+IMPORT_JOB_WORKER = 'thread'
+IMPORT_JOB_THREADS = 1
+
+# Seconds a running background import may go without progress before it is marked as failed,
+# as its worker has stopped, keep it above the time taken by one batch of rows
+IMPORT_JOB_STALE_SECONDS = 600
+
+# Number of worker processes for the parallel import mode, defaults to the CPU count
+IMPORT_PARALLEL_WORKERS = None
+
+# Maximum number of grower and farm names remembered during an import
+IMPORT_CACHE_SIZE = 100000
+
+# Where the profiles of imports sent by staff users with ?profile=cprofile or ?profile=speedscope
+# are written, None refuses profiled imports; set it in the local settings of development only,
+# such as IMPORT_PROFILE_DIR = BASE_DIR / 'profiles'
+IMPORT_PROFILE_DIR = None
+
+# Most events kept by a speedscope profile, two for each call, which bounds its memory and file size
+IMPORT_PROFILE_MAX_EVENTS = 2000000
+
+# Largest page size allowed for the field list
+FIELD_LIST_MAX_LIMIT = 1000
+
+# Keep the flattened FieldListing table in sync and read the field list from it,
+# run `manage.py rebuild_field_listing` after enabling it
+FIELD_LISTING_TABLE = False
+
+# Largest number of operations accepted by the field batch endpoint
+FIELD_BATCH_MAX_SIZE = 1000
+
+# Number of records fetched per round trip when streaming a list
+STREAM_CHUNK_SIZE = 2000
+
+# Use Postgres COPY TO for CSV exports when the database is Postgres
+EXPORT_USE_COPY = True
+
+# Cache for the field and farm list responses. Local memory is per process;
+# use 'django.core.cache.backends.filebased.FileBasedCache' with a LOCATION
+# to share the cached responses between worker processes on the same host.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+RESPONSE_CACHE = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Measure each request and send the timings in the Server-Timing header,
+# the per-view latency histograms are shown at /core/metrics/ to the INTERNAL_IPS
+REQUEST_METRICS = True
+INTERNAL_IPS = ['127.0.0.1']
+
+# Requests slower than this many milliseconds are logged to 'django.arva.slow_requests'
+# with up to SLOW_REQUEST_MAX_QUERIES of the queries they ran
+SLOW_REQUEST_MS = 1000
+SLOW_REQUEST_MAX_QUERIES = 200
+
+# How `manage.py serve` runs the app, see core.management.commands.serve:
+# 'runserver' is the Django development server,
+# 'wsgi' serves server.wsgi with gunicorn's threaded workers,
+# 'asgi' serves server.asgi with gunicorn running uvicorn workers.
+# Each of the SERVER_ settings can be set with the environment variable of the same name.
+SERVER_MODE = os.environ.get('SERVER_MODE', 'runserver')
+SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:8000')
+# Worker processes, 0 to size them from the CPUs available to the server
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 0))
+# Threads of each WSGI worker
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 4))
+# A worker is replaced gracefully after serving this many requests, plus a random
+# jitter so the workers are not all replaced at once; 0 never replaces them
+SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 1000))
+SERVER_MAX_REQUESTS_JITTER = int(os.environ.get('SERVER_MAX_REQUESTS_JITTER', 100))
+# Seconds an idle client connection is kept open; behind a load balancer,
+# make it longer than the idle timeout of the load balancer
+SERVER_KEEPALIVE = int(os.environ.get('SERVER_KEEPALIVE', 5))
+# Seconds before a silent worker is restarted, and that workers are given
+# to finish their requests when they are replaced or the server stops
+SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 60))
+SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+
+# Default pool size and persistent connection lifetime of `postgres_database`
+DATABASE_POOL_OPTIONS = {'min_size': 2, 'max_size': 10, 'timeout': 10}
+DATABASE_CONN_MAX_AGE = 60
+
+
+def postgres_database(connections='pool', pool_options=DATABASE_POOL_OPTIONS,
+        conn_max_age=DATABASE_CONN_MAX_AGE, **database):
+    # Builds a DATABASES entry for Postgres, such as
+    # `postgres_database('pool', NAME='db', USER='postgres', PASSWORD='...', HOST='postgres')`.
+    # Each environment's settings choose how the connections are handled:
+    # 'pool' checks them out of a psycopg pool per process, see core.backends.postgresql,
+    # 'persistent' keeps one connection per thread open for `conn_max_age` seconds,
+    # 'per_request' opens a new connection for every request.
+    # Broken connections are detected with CONN_HEALTH_CHECKS before they are reused.
+    options = database.pop('OPTIONS', {})
+    if connections == 'pool':
+        database.update(ENGINE='core.backends.postgresql', CONN_MAX_AGE=0,
+            OPTIONS={'pool': pool_options, **options})
+    elif connections == 'persistent':
+        database.update(ENGINE='django.db.backends.postgresql', CONN_MAX_AGE=conn_max_age, OPTIONS=options)
+    elif connections == 'per_request':
+        database.update(ENGINE='django.db.backends.postgresql', CONN_MAX_AGE=0, OPTIONS=options)
+    else:
+        raise ValueError('Unknown database connections setting: {}'.format(connections))
+    database.setdefault('CONN_HEALTH_CHECKS', True)
+    return database